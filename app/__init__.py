@@ -1,28 +1,34 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_migrate import Migrate
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from app import startup
 
 load_dotenv()
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 mail = Mail()
-migrate = Migrate()
+
+startup.record('import', time.perf_counter() - _import_started)
 
 def create_app():
+    create_started = time.perf_counter()
+    lazy = startup.lazy_init()
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
 
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
 
     # Use in-memory database for Vercel (serverless) environment
     # Vercel has read-only file system, so we can't create SQLite files
-    if os.getenv('VERCEL') or '/var/task' in os.getcwd():
+    if startup.is_serverless():
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     else:
         app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///instance/zines.db')
@@ -30,6 +36,11 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+    # Canonical origin for share links and QR codes; Vercel exposes the production domain
+    production_host = os.getenv('VERCEL_PROJECT_PRODUCTION_URL')
+    app.config['PUBLIC_BASE_URL'] = os.getenv('PUBLIC_BASE_URL') or \
+        (f'https://{production_host}' if production_host else None)
+
     app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
     app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
     app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True').lower() == 'true'
@@ -50,25 +61,41 @@ def create_app():
     db.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
-    migrate.init_app(app, db)
+    if not startup.is_serverless():
+        # Alembic is only needed for `flask db ...`, which never runs on serverless
+        from flask_migrate import Migrate
+        Migrate(app, db)
     CORS(app)
 
     login_manager.login_view = 'auth.login'
 
     from app.firebase_auth import init_firebase
-    firebase_app = init_firebase()
-
-    # Initialize Firestore database with demo data only if Firebase is configured
-    firestore_available = False
-    try:
-        if firebase_app:  # Only use Firestore if Firebase Admin SDK is initialized
+    with startup.timed('init_firebase'):
+        firebase_app = init_firebase()
+
+    from app.blob_store import check_blob_store
+    check_blob_store()
+
+    # Check Firestore up front unless startup is lazy, in which case the client is
+    # created and checked on first use. Demo data is seeded with `flask seed-demo`.
+    firestore_available = None
+    if not firebase_app:
+        firestore_available = False
+        print("\n" + "="*60)
+        print("❌ Firebase not configured - using SQLAlchemy only")
+        print("WARNING: This will cause intermittent 404s on Vercel!")
+        print("="*60 + "\n")
+    elif lazy:
+        print("Lazy startup: Firestore will be checked on first use")
+    else:
+        try:
             print("\n" + "="*60)
             print("CHECKING FIRESTORE AVAILABILITY")
             print("="*60)
             from app.firestore_db import firestore_db
-            if firestore_db.is_available():
-                firestore_available = True
-                firestore_db.init_demo_data()
+            with startup.timed('firestore_check'):
+                firestore_available = firestore_db.is_available()
+            if firestore_available:
                 print("✅ Firestore initialized successfully")
                 print("="*60 + "\n")
             else:
@@ -76,45 +103,41 @@ def create_app():
                 print("Using SQLAlchemy with in-memory database")
                 print("WARNING: This will cause intermittent 404s on Vercel!")
                 print("="*60 + "\n")
-        else:
-            print("\n" + "="*60)
-            print("❌ Firebase not configured - using SQLAlchemy only")
+        except Exception as e:
+            firestore_available = False
+            print(f"\n❌ Error initializing Firestore: {e}")
+            print("Falling back to SQLAlchemy database")
             print("WARNING: This will cause intermittent 404s on Vercel!")
+            import traceback
+            traceback.print_exc()
             print("="*60 + "\n")
-    except Exception as e:
-        print(f"\n❌ Error initializing Firestore: {e}")
-        print("Falling back to SQLAlchemy database")
-        print("WARNING: This will cause intermittent 404s on Vercel!")
-        import traceback
-        traceback.print_exc()
-        print("="*60 + "\n")
 
-    # Store Firestore availability in app config for easy access
+    # Store Firestore availability in app config (None until first use on lazy startup)
     app.config['FIRESTORE_AVAILABLE'] = firestore_available
 
     from app.models import User
 
-    # Check if Firestore is available
-    use_firestore = False
     try:
         from app.firestore_db import firestore_db
-        if firestore_db.is_available():
-            from app.firestore_models import FirestoreUser
-            use_firestore = True
-            print("Using Firestore for user storage")
-        else:
-            print("Using SQLAlchemy for user storage")
+        from app.firestore_models import FirestoreUser
+        from app.user_session import snapshot_for, remember_user
     except Exception as e:
         print(f"Firestore not available for users: {e}")
+        firestore_db = None
 
     @login_manager.user_loader
     def load_user(user_id):
-        if use_firestore:
-            # Try Firestore
+        # is_available() is cached after the first check
+        if firestore_db is not None and firestore_db.is_available():
+            # Try the session snapshot, then Firestore (see app.user_session)
             try:
-                firestore_user = FirestoreUser.get(user_id)
-                if firestore_user:
-                    return firestore_user
+                user_data = snapshot_for(user_id)
+                if user_data is None:
+                    user_data = firestore_db.get_user_by_id(user_id)
+                    if user_data:
+                        remember_user(user_data)
+                if user_data:
+                    return FirestoreUser(user_data)
             except Exception as e:
                 print(f"Error loading user from Firestore: {e}")
 
@@ -124,17 +147,24 @@ def create_app():
         except:
             return None
 
-    from app.routes import main, auth, editor, viewer, api, debug
-    app.register_blueprint(main.bp)
-    app.register_blueprint(auth.bp)
-    app.register_blueprint(editor.bp)
-    app.register_blueprint(viewer.bp)
-    app.register_blueprint(api.bp)
-    app.register_blueprint(debug.bp)
-
-    with app.app_context():
+    with startup.timed('blueprints'):
+        from app.routes import main, auth, editor, viewer, api, debug, media
+        app.register_blueprint(media.bp)
+        app.register_blueprint(main.bp)
+        app.register_blueprint(auth.bp)
+        app.register_blueprint(editor.bp)
+        app.register_blueprint(viewer.bp)
+        app.register_blueprint(api.bp)
+        app.register_blueprint(debug.bp)
+
+    from app.commands import register_commands
+    register_commands(app)
+
+    # SQLAlchemy tables are created but we're using Firestore for actual data when available
+    with startup.timed('create_all'), app.app_context():
         db.create_all()
-        # SQLAlchemy tables are created but we're using Firestore for actual data
-        # Demo data is initialized in Firestore via firestore_db.init_demo_data()
+
+    startup.record('create_app', time.perf_counter() - create_started)
+    startup.print_report()
 
     return app
\ No newline at end of file
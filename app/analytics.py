@@ -0,0 +1,181 @@
+"""
+Buffered analytics ingestion
+
+View events are appended to an in-process buffer and written in batches by a background
+thread, so a zine view never waits on analytics I/O. Counter increments are summed per
+zine before being applied, turning N concurrent views into a single Increment(N).
+
+The buffer is flushed when it reaches ANALYTICS_FLUSH_SIZE events, every
+ANALYTICS_FLUSH_INTERVAL seconds, and at interpreter shutdown. On serverless hosts
+(Vercel), where background threads are frozen between requests, the buffer is instead
+flushed once the response has been sent (Response.call_on_close), so the view still
+doesn't wait on the write.
+
+Each write also folds the batch's readers into per-zine HyperLogLog sketches (one per day
+plus an all-time one), so unique readers are counted without scanning events.
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import after_this_request, g, has_request_context
+
+# Period key of the sketch that covers a zine's whole lifetime (daily sketches use YYYY-MM-DD)
+ALL_TIME = 'all'
+
+
+def reader_key(user_id=None, session_id=None):
+    """Identity a reader is counted under for unique-reader sketches"""
+    if user_id:
+        return f'u:{user_id}'
+    if session_id:
+        return f's:{session_id}'
+    return None
+
+
+def view_event_id(zine_id, session_id, when):
+    """Deterministic id of a session's view event for a zine on a day
+
+    Read-time reports address the event directly by this id instead of querying for it.
+    """
+    raw = f"{zine_id}:{session_id}:{when.strftime('%Y-%m-%d')}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def sketch_periods(created_at):
+    """Sketch periods an event at created_at is added to"""
+    return (created_at.strftime('%Y-%m-%d'), ALL_TIME)
+
+
+class AnalyticsBuffer:
+    """Collects analytics events and view counts and hands them to writer in batches
+
+    writer(events, view_counts) must persist a list of event dicts and a {zine_id: n}
+    mapping of view count increments.
+    """
+
+    def __init__(self, writer, flush_size=None, flush_interval=None, max_events=None, enabled=None,
+                 flush_after_response=None):
+        is_vercel = os.getenv('VERCEL') or '/var/task' in os.getcwd()
+        self.writer = writer
+        self.flush_size = flush_size or int(os.getenv('ANALYTICS_FLUSH_SIZE', 100))
+        self.flush_interval = flush_interval or float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 5))
+        self.max_events = max_events or int(os.getenv('ANALYTICS_MAX_BUFFER', 10000))
+        if enabled is None:
+            enabled = os.getenv('ANALYTICS_BUFFER', 'true').lower() != 'false'
+        self.enabled = enabled
+        self.flush_after_response = bool(is_vercel) if flush_after_response is None else flush_after_response
+
+        self._events = []
+        self._view_counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self.flushed_events = 0
+        self.flushes = 0
+        self.dropped_events = 0
+        self.failed_flushes = 0
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def record_view(self, zine_id, event):
+        """Queue a view event and a views_count increment for zine_id"""
+        if not self.enabled:
+            self._write([event], {zine_id: 1})
+            return
+
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                # Writes are failing or far behind; shed the oldest events but keep counting views
+                self._events.pop(0)
+                self.dropped_events += 1
+            self._events.append(event)
+            self._view_counts[zine_id] += 1
+            full = len(self._events) >= self.flush_size
+
+        if self.flush_after_response and has_request_context():
+            if not g.get('_analytics_flush_scheduled'):
+                g._analytics_flush_scheduled = True
+                after_this_request(self._flush_on_close)
+            return
+
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def _flush_on_close(self, response):
+        response.call_on_close(self.flush)
+        return response
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                view_counts, self._view_counts = self._view_counts, defaultdict(int)
+
+            if not events and not view_counts:
+                return 0
+
+            if not self._write(events, view_counts):
+                # Put the batch back so the next flush retries it
+                with self._lock:
+                    self._events = events + self._events
+                    overflow = len(self._events) - self.max_events
+                    if overflow > 0:
+                        del self._events[:overflow]
+                        self.dropped_events += overflow
+                    for zine_id, count in view_counts.items():
+                        self._view_counts[zine_id] += count
+                return 0
+
+            self.flushes += 1
+            self.flushed_events += len(events)
+            return len(events)
+
+    def _write(self, events, view_counts):
+        started = time.monotonic()
+        try:
+            self.writer(events, dict(view_counts))
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"Error writing {len(events)} analytics events: {e}")
+            return False
+        if len(events) > 1:
+            print(f"Flushed {len(events)} analytics events for {len(view_counts)} zines "
+                  f"in {(time.monotonic() - started) * 1000:.0f}ms")
+        return True
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._events)
+        return {
+            'enabled': self.enabled,
+            'pending': pending,
+            'flush_size': self.flush_size,
+            'flush_interval': self.flush_interval,
+            'flush_after_response': self.flush_after_response,
+            'flushes': self.flushes,
+            'flushed_events': self.flushed_events,
+            'failed_flushes': self.failed_flushes,
+            'dropped_events': self.dropped_events
+        }
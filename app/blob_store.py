@@ -0,0 +1,203 @@
+"""
+Content-addressed blob storage for uploaded media
+
+Blobs are keyed by the SHA-256 of their bytes, so identical uploads are stored once
+and their URL never changes. Two drivers are provided:
+- LocalBlobStore: files on the local filesystem (development and tests)
+- CloudStorageBlobStore: the Firebase Storage / Google Cloud Storage bucket (production)
+"""
+import hashlib
+import json
+import os
+import re
+
+from app import startup
+
+CHUNK_SIZE = 64 * 1024
+BLOB_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def blob_key(data):
+    """Content address for a blob"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_blob_key(key):
+    return bool(BLOB_KEY_RE.match(key or ''))
+
+
+def media_url(key):
+    """Public URL a blob is served from"""
+    return f'/media/{key}'
+
+
+class BlobStore:
+    """Interface shared by the blob store drivers"""
+
+    def put(self, data, content_type):
+        """Store bytes and return their key; storing existing content is a no-op"""
+        key = blob_key(data)
+        if not self.exists(key):
+            self._write(key, data, content_type)
+        return key
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Return {'content_type', 'size'} for a blob, or None if it does not exist"""
+        raise NotImplementedError
+
+    def iter_chunks(self, key):
+        """Yield the blob's bytes in CHUNK_SIZE pieces"""
+        raise NotImplementedError
+
+    def read(self, key):
+        return b''.join(self.iter_chunks(key))
+
+    def _write(self, key, data, content_type):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Stores blobs as files under root/ab/<key>, with a JSON sidecar for metadata"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def stat(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        meta['size'] = os.path.getsize(path)
+        return meta
+
+    def iter_chunks(self, key):
+        with open(self._path(key), 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def _write(self, key, data, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write metadata first and rename the blob into place so readers never see a partial file
+        with open(path + '.json', 'w') as f:
+            json.dump({'content_type': content_type}, f)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class CloudStorageBlobStore(BlobStore):
+    """Stores blobs in a Cloud Storage bucket under media/<key>"""
+
+    def __init__(self, bucket_name=None, prefix='media/'):
+        from firebase_admin import storage
+        self.bucket = storage.bucket(bucket_name)
+        self.prefix = prefix
+
+    def _blob(self, key):
+        return self.bucket.blob(self.prefix + key)
+
+    def exists(self, key):
+        return self._blob(key).exists()
+
+    def stat(self, key):
+        blob = self.bucket.get_blob(self.prefix + key)
+        if blob is None:
+            return None
+        return {'content_type': blob.content_type, 'size': blob.size}
+
+    def iter_chunks(self, key):
+        with self._blob(key).open('rb', chunk_size=CHUNK_SIZE) as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def _write(self, key, data, content_type):
+        blob = self._blob(key)
+        blob.cache_control = 'public, max-age=31536000, immutable'
+        blob.upload_from_string(data, content_type=content_type)
+
+
+def extract_inline_images(content, store):
+    """Move base64 data: URLs in page content into the blob store
+
+    Returns the number of image blocks rewritten to /media/<key> URLs.
+    """
+    import base64
+
+    moved = 0
+    for block in (content or {}).get('blocks') or (content or {}).get('elements') or []:
+        src = block.get('src') or ''
+        match = re.match(r'^data:([^;]+);base64,(.+)$', src, re.DOTALL)
+        if not match:
+            continue
+        key = store.put(base64.b64decode(match.group(2)), match.group(1))
+        block['src'] = media_url(key)
+        moved += 1
+    return moved
+
+
+_blob_store = None
+
+
+def blob_store_driver():
+    """'gcs' or 'local': the driver get_blob_store() will use
+
+    BLOB_STORE selects the driver. By default the Firebase Storage bucket is used when
+    FIREBASE_STORAGE_BUCKET is set and Firebase is initialized, and the local
+    filesystem otherwise.
+    """
+    driver = os.getenv('BLOB_STORE', '').lower()
+    if driver:
+        return driver
+    if (os.getenv('FIREBASE_STORAGE_BUCKET') or '').strip():
+        try:
+            import firebase_admin
+            firebase_admin.get_app()
+            return 'gcs'
+        except (ImportError, ValueError):
+            pass
+    return 'local'
+
+
+def check_blob_store():
+    """Refuse to start on serverless hosts without a bucket
+
+    Their only writable directory, /tmp, is private to one instance, so images and QR
+    codes stored there would 404 as soon as another instance served the link.
+    """
+    if startup.is_serverless() and blob_store_driver() != 'gcs':
+        raise RuntimeError('No blob store bucket configured: set FIREBASE_STORAGE_BUCKET '
+                           '(or BLOB_STORE=gcs) so uploaded images persist across instances')
+
+
+def get_blob_store():
+    """Return the configured blob store (see blob_store_driver)"""
+    global _blob_store
+    if _blob_store is not None:
+        return _blob_store
+
+    if blob_store_driver() == 'gcs':
+        bucket_name = (os.getenv('FIREBASE_STORAGE_BUCKET') or '').strip()
+        _blob_store = CloudStorageBlobStore(bucket_name or None)
+        print(f"Blob store: Cloud Storage bucket {bucket_name}")
+    else:
+        _blob_store = LocalBlobStore(os.getenv('BLOB_STORE_PATH', os.path.join('instance', 'media')))
+        print(f"Blob store: local filesystem at {_blob_store.root}")
+    return _blob_store
@@ -0,0 +1,223 @@
+"""
+In-process caching helpers for the data layer
+
+Two layers are used in front of Firestore reads:
+- a per-request identity map stored on flask.g, so a document is fetched at most once per request
+- a bounded TTL/LRU process cache shared between requests handled by the same instance
+
+Rendered zine page markup is cached separately, keyed by the zine's updated_at so any
+save or publish produces a new key.
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a fixed time-to-live"""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return a cached value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """Return a live cached value without touching LRU order or counters"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove a single key"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Remove every key starting with prefix"""
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+class DocumentCache:
+    """Read-through document cache combining a request identity map with a process TTL cache"""
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.process = TTLCache(
+            maxsize=maxsize or int(os.getenv('FIRESTORE_CACHE_SIZE', 1024)),
+            ttl=ttl if ttl is not None else float(os.getenv('FIRESTORE_CACHE_TTL', 30))
+        )
+        self.enabled = os.getenv('FIRESTORE_CACHE', 'true').lower() != 'false'
+        self.request_hits = 0
+
+    def _request_map(self):
+        """Identity map for the current request, or None outside an app context"""
+        if not has_app_context():
+            return None
+        if '_document_identity_map' not in g:
+            g._document_identity_map = {}
+        return g._document_identity_map
+
+    def _use_process_cache(self):
+        if not has_app_context():
+            return True
+        return not g.get('_document_cache_request_only', False)
+
+    def request_only(self):
+        """Skip the shared process cache for reads made during the current request
+
+        Used by routes that must see the latest write from any instance (e.g. the editor).
+        """
+        if has_app_context():
+            g._document_cache_request_only = True
+
+    def get(self, key):
+        """Return a deep copy of the cached value for key, or None on a miss
+
+        Values are copied on the way in and out, so callers may mutate what they get
+        (nested page content included) without changing the cached document.
+        """
+        if not self.enabled:
+            return None
+
+        identity_map = self._request_map()
+        if identity_map is not None and key in identity_map:
+            self.request_hits += 1
+            return copy.deepcopy(identity_map[key])
+
+        if not self._use_process_cache():
+            return None
+
+        value = self.process.get(key)
+        if value is not None and identity_map is not None:
+            identity_map[key] = value
+        return copy.deepcopy(value)
+
+    def peek(self, key):
+        """Return a cached value from either layer without counting it as a lookup
+
+        The stored value itself is returned; callers must not mutate it.
+        """
+        identity_map = self._request_map()
+        if identity_map is not None and key in identity_map:
+            return identity_map[key]
+        return self.process.peek(key)
+
+    def set(self, key, value):
+        """Store a snapshot of a freshly read value in both layers"""
+        if not self.enabled or value is None:
+            return
+
+        value = copy.deepcopy(value)
+        identity_map = self._request_map()
+        if identity_map is not None:
+            identity_map[key] = value
+        self.process.set(key, value)
+
+    def invalidate(self, *keys):
+        """Drop keys from both layers after a write"""
+        identity_map = self._request_map()
+        for key in keys:
+            if identity_map is not None:
+                identity_map.pop(key, None)
+            self.process.delete(key)
+
+    def invalidate_prefix(self, prefix):
+        """Drop every key starting with prefix from both layers"""
+        identity_map = self._request_map()
+        if identity_map is not None:
+            for key in [k for k in identity_map if k.startswith(prefix)]:
+                del identity_map[key]
+        self.process.delete_prefix(prefix)
+
+    def clear(self):
+        """Drop everything"""
+        identity_map = self._request_map()
+        if identity_map is not None:
+            identity_map.clear()
+        self.process.clear()
+
+    def stats(self):
+        """Return hit/miss counters for both layers"""
+        stats = self.process.stats()
+        stats['enabled'] = self.enabled
+        stats['request_hits'] = self.request_hits
+        return stats
+
+
+# Rendered page markup for the zine viewer, one entry per zine version and device variant
+rendered_zines = TTLCache(
+    maxsize=int(os.getenv('ZINE_HTML_CACHE_SIZE', 256)),
+    ttl=float(os.getenv('ZINE_HTML_CACHE_TTL', 3600))
+)
+
+
+def zine_html_key(zine_id, updated_at, variant):
+    """Cache key for a zine's rendered pages; changes whenever the zine is saved"""
+    version = updated_at.isoformat() if hasattr(updated_at, 'isoformat') else str(updated_at)
+    return f'zine_html:{zine_id}:{version}:{variant}'
+
+
+def invalidate_zine_html(zine_id):
+    """Drop every cached rendering of a zine after an edit"""
+    rendered_zines.delete_prefix(f'zine_html:{zine_id}:')
@@ -0,0 +1,162 @@
+"""
+Flask CLI commands for maintenance tasks
+
+Run with e.g. `flask --app app.py backfill-feeds`
+"""
+import click
+
+
+def register_commands(app):
+    """Attach maintenance commands to the app's CLI"""
+
+    @app.cli.command('backfill-feeds')
+    def backfill_feeds():
+        """Rebuild precomputed home feeds from existing follow edges"""
+        from app.firestore_db import firestore_db
+        if not firestore_db.is_available():
+            click.echo('Firestore is not available')
+            return
+
+        written = firestore_db.backfill_feeds()
+        click.echo(f'Backfilled {written} feeds')
+
+    @app.cli.command('seed-demo')
+    def seed_demo():
+        """Create the demo user and sample zines if they don't exist yet"""
+        from app.firestore_db import firestore_db
+        if not firestore_db.is_available():
+            click.echo('Firestore is not available')
+            return
+
+        if firestore_db.init_demo_data():
+            click.echo('Created demo user and sample zines')
+        else:
+            click.echo('Demo data already exists')
+
+    @app.cli.command('import-profile')
+    @click.option('--limit', default=20, help='Number of packages and app modules to list')
+    def import_profile(limit):
+        """Break down app import time by package and module (python -X importtime)"""
+        from app.startup import profile_imports
+
+        profile = profile_imports(limit=limit)
+        if not profile['ok']:
+            click.echo(f"Creating the app failed: {profile['error']}")
+        click.echo(f"{profile['module_count']} modules imported in {profile['import_ms']}ms "
+                   f"({profile['wall_ms']}ms wall)")
+        click.echo('\nSelf time by package:')
+        for entry in profile['packages']:
+            click.echo(f"  {entry['ms']:>8.1f}ms  {entry['package']}")
+        click.echo('\nApp modules by cumulative time:')
+        for entry in profile['app_modules']:
+            click.echo(f"  {entry['cumulative_ms']:>8.1f}ms  {entry['module']}")
+
+    @app.cli.command('reserve-names')
+    def reserve_names():
+        """Create username and slug reservations for users and zines that predate them"""
+        from app.firestore_db import firestore_db
+        if not firestore_db.is_available():
+            click.echo('Firestore is not available')
+            return
+
+        written = firestore_db.backfill_name_reservations()
+        click.echo(f'Reserved {written} usernames and slugs')
+
+    @app.cli.command('migrate-inline-images')
+    def migrate_inline_images():
+        """Move base64 images embedded in page content into the blob store"""
+        from app import db
+        from app.blob_store import get_blob_store, extract_inline_images
+        from app.firestore_db import firestore_db
+        from app.models import Page
+
+        store = get_blob_store()
+        moved = 0
+
+        if firestore_db.is_available():
+            for doc in firestore_db._get_db().collection('pages').get():
+                page = doc.to_dict()
+                content = page.get('content') or {}
+                count = extract_inline_images(content, store)
+                if count:
+                    firestore_db.update_page(doc.id, {'content': content})
+                    moved += count
+
+        for page in Page.query.all():
+            content = dict(page.content or {})
+            count = extract_inline_images(content, store)
+            if count:
+                page.content = content
+                moved += count
+        db.session.commit()
+
+        click.echo(f'Moved {moved} inline images to the blob store')
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--days', default=30, help='Number of most recent days to rebuild')
+    def rebuild_rollups(days):
+        """Recompute daily analytics rollups from raw events"""
+        from app import db
+        from app.firestore_db import firestore_db
+        from app.models import AnalyticsRollup
+
+        written = 0
+        if firestore_db.is_available():
+            firestore_db.analytics.flush()
+            written += firestore_db.rebuild_rollups(days)
+
+        written += AnalyticsRollup.rebuild(days)
+        db.session.commit()
+        click.echo(f'Rebuilt {written} rollups')
+
+    @app.cli.command('expire-analytics')
+    @click.option('--days', default=None, type=int, help='Retention in days (default ANALYTICS_RETENTION_DAYS)')
+    def expire_analytics(days):
+        """Delete raw analytics events that are older than the retention window"""
+        from datetime import datetime, timedelta
+        from app import db
+        from app.firestore_db import firestore_db
+        from app.models import Analytics
+        from app.rollups import ANALYTICS_RETENTION_DAYS
+
+        days = days or ANALYTICS_RETENTION_DAYS
+        deleted = 0
+        if firestore_db.is_available():
+            deleted += firestore_db.expire_analytics(days)
+
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        deleted += Analytics.query.filter(Analytics.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+
+        click.echo(f'Deleted {deleted} analytics events older than {days} days')
+
+    @app.cli.command('prune-versions')
+    def prune_versions():
+        """Drop versions beyond MAX_VERSIONS and page blobs no version refers to any more"""
+        from app import db
+        from app.firestore_db import firestore_db
+        from app.models import ZineVersion
+        from app.versions import sql_versions
+
+        pruned = 0
+        if firestore_db.is_available():
+            for doc in firestore_db._get_db().collection('zines').get():
+                pruned += firestore_db.versions.prune(doc.id)
+
+        for (zine_id,) in db.session.query(ZineVersion.zine_id).distinct():
+            pruned += sql_versions.prune(zine_id)
+        db.session.commit()
+
+        click.echo(f'Pruned {pruned} old versions')
+
+    @app.cli.command('compact-counters')
+    def compact_counters():
+        """Fold sharded view/follower counters back into their documents' fields"""
+        from app.firestore_db import firestore_db
+        if not firestore_db.is_available():
+            click.echo('Firestore is not available')
+            return
+
+        firestore_db.analytics.flush()
+        compacted = firestore_db.counters.compact_all()
+        click.echo(f'Compacted {compacted} counters')
@@ -0,0 +1,202 @@
+"""
+Atomic counters for view, like and follower counts
+
+Firestore: increments land on COUNTER_SHARDS shard documents stored in a
+`counter_shards` subcollection of the counted document. An increment is a single atomic
+Increment on a random shard, so concurrent writers don't contend on one document.
+Compaction moves the pending shard counts into the counted document's own field (e.g.
+zines/{id}.views_count) and deletes those shards, which keeps reads and ORDER BY queries
+cheap; the exact value is the field plus whatever shards are still pending.
+
+Compaction never runs on the request path. Long-running instances compact the counters
+they incremented from a background thread every COUNTER_COMPACT_INTERVAL seconds; on
+serverless hosts, and for counters left pending by idle or recycled instances, the
+/api/cron/compact-counters job scheduled in vercel.json (or `flask compact-counters`)
+does it.
+
+SQLAlchemy: counters are a single column updated with UPDATE ... SET x = x + n, which
+the database applies atomically.
+"""
+import atexit
+import os
+import random
+import threading
+import time
+
+from app import startup
+
+COUNTER_SHARDS = int(os.getenv('COUNTER_SHARDS', 10))
+
+# Minimum seconds between compactions of the same counter on one instance
+COUNTER_COMPACT_INTERVAL = float(os.getenv('COUNTER_COMPACT_INTERVAL', 30))
+
+SHARD_COLLECTION = 'counter_shards'
+
+# Document cache key prefix for each counted collection
+CACHE_PREFIXES = {
+    'zines': 'zine',
+    'users': 'user'
+}
+
+
+class ShardedCounters:
+    """Distributed counters stored as shard documents under the counted document"""
+
+    def __init__(self, firestore_db, shards=None, compact_interval=None):
+        self.firestore_db = firestore_db
+        self.shards = shards or COUNTER_SHARDS
+        self.compact_interval = COUNTER_COMPACT_INTERVAL if compact_interval is None else compact_interval
+        self._lock = threading.Lock()
+        self._dirty = {}      # (collection, doc_id, field) -> time of first unflushed increment
+        self._compacted = {}  # (collection, doc_id, field) -> time of last compaction
+        self._thread = None
+
+    def _ensure_thread(self):
+        """Start the background compaction thread (not on serverless, where the cron does it)"""
+        if self._thread is not None or startup.is_serverless():
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='counter-compaction', daemon=True)
+            self._thread.start()
+            atexit.register(self.compact_due, force=True)
+
+    def _run(self):
+        while True:
+            time.sleep(self.compact_interval)
+            self.compact_due()
+
+    def _doc(self, collection, doc_id):
+        return self.firestore_db._get_db().collection(collection).document(doc_id)
+
+    def _shards(self, collection, doc_id):
+        return self._doc(collection, doc_id).collection(SHARD_COLLECTION)
+
+    def increment_writes(self, collection, doc_id, field, amount=1):
+        """Write tuples for FirestoreDB._commit_writes that add amount to a counter
+
+        Returned separately so callers can commit them in the same batch as other writes.
+        """
+        from google.cloud.firestore_v1 import Increment
+
+        shard_ref = self._shards(collection, doc_id).document(f'{field}_{random.randrange(self.shards)}')
+        with self._lock:
+            self._dirty.setdefault((collection, doc_id, field), time.monotonic())
+        self._ensure_thread()
+        return [('merge', shard_ref, {'field': field, 'count': Increment(amount)})]
+
+    def increment(self, collection, doc_id, field, amount=1):
+        """Atomically add amount to a counter"""
+        self.firestore_db._commit_writes(self.increment_writes(collection, doc_id, field, amount))
+
+    def total(self, collection, doc_id, field):
+        """Exact current value: the compacted field plus the pending shards"""
+        snapshot = self._doc(collection, doc_id).get()
+        value = (snapshot.to_dict() or {}).get(field) or 0 if snapshot.exists else 0
+        query = self._shards(collection, doc_id).where('field', '==', field)
+        return value + sum((doc.to_dict() or {}).get('count', 0) for doc in query.get())
+
+    def compact(self, collection, doc_id, field):
+        """Move the pending shard counts into the counted document's field
+
+        The shards are read, deleted and their sum added to the field in one transaction,
+        so increments that land meanwhile wait for it or go to fresh shards.
+        """
+        from google.cloud import firestore
+
+        doc_ref = self._doc(collection, doc_id)
+        query = self._shards(collection, doc_id).where('field', '==', field)
+
+        @firestore.transactional
+        def move(transaction):
+            shards = list(query.get(transaction=transaction))
+            snapshot = doc_ref.get(transaction=transaction)
+            value = (snapshot.to_dict() or {}).get(field) or 0 if snapshot.exists else 0
+            pending = sum((shard.to_dict() or {}).get('count', 0) for shard in shards)
+            for shard in shards:
+                transaction.delete(shard.reference)
+            if snapshot.exists and pending:
+                # A plain field write: counters don't touch updated_at, which versions content
+                transaction.update(doc_ref, {field: max(0, value + pending)})
+            return max(0, value + pending)
+
+        value = move(self.firestore_db._get_db().transaction())
+        prefix = CACHE_PREFIXES.get(collection)
+        if prefix:
+            self.firestore_db.cache.invalidate(f'{prefix}:{doc_id}')
+
+        key = (collection, doc_id, field)
+        with self._lock:
+            self._compacted[key] = time.monotonic()
+        return value
+
+    def compact_due(self, force=False):
+        """Compact counters this instance incremented whose last compaction is old enough"""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                key for key in self._dirty
+                if force or now - self._compacted.get(key, 0) >= self.compact_interval
+            ]
+            for key in due:
+                del self._dirty[key]
+
+        compacted = 0
+        for key in due:
+            try:
+                self.compact(*key)
+                compacted += 1
+            except Exception as e:
+                print(f"Error compacting counter {key}: {e}")
+                with self._lock:
+                    self._dirty.setdefault(key, now)
+        return compacted
+
+    def compact_all(self):
+        """Compact every counter with pending shards (cron job and maintenance command)"""
+        db = self.firestore_db._get_db()
+        counters = set()
+        for shard in db.collection_group(SHARD_COLLECTION).stream():
+            parent = shard.reference.parent.parent
+            counters.add((parent.parent.id, parent.id, (shard.to_dict() or {}).get('field')))
+
+        for key in counters:
+            if key[2]:
+                self.compact(*key)
+        return len(counters)
+
+    def delete_writes(self, collection, doc_id):
+        """Write tuples that remove all shards of a document that is being deleted"""
+        return [('delete', shard.reference, None) for shard in self._shards(collection, doc_id).get()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'shards': self.shards,
+                'compact_interval': self.compact_interval,
+                'dirty': len(self._dirty)
+            }
+
+
+class SQLCounters:
+    """Counters stored in a single column, updated atomically by the database"""
+
+    def increment(self, model, row_id, field, amount=1, commit=True):
+        """UPDATE model SET field = field + amount WHERE id = row_id"""
+        column = getattr(model, field)
+        values = {column: column + amount}
+        if hasattr(model, 'updated_at'):
+            # Keep onupdate from bumping updated_at, which versions the row's content
+            values[model.updated_at] = model.updated_at
+        model.query.filter_by(id=row_id).update(values, synchronize_session=False)
+        if commit:
+            from app import db
+            db.session.commit()
+
+    def total(self, model, row_id, field):
+        from app import db
+        return db.session.query(getattr(model, field)).filter(model.id == row_id).scalar() or 0
+
+
+sql_counters = SQLCounters()
@@ -6,6 +6,7 @@ import os
 import base64
 import json
 import traceback
+from app.token_verifier import token_verifier, InvalidToken
 
 cred = None
 firebase_app = None
@@ -164,8 +165,15 @@ def verify_token(id_token):
                 'name': 'Dev User'
             }
 
-        decoded_token = firebase_auth.verify_id_token(id_token)
-        return decoded_token
+        if os.getenv('FIREBASE_AUTH_EMULATOR_HOST'):
+            # Emulator tokens are unsigned; only the SDK knows how to check them
+            return firebase_auth.verify_id_token(id_token)
+
+        # Verified locally against cached signing keys; repeat tokens hit the cache
+        return token_verifier.verify(id_token)
+    except InvalidToken as e:
+        print(f"Invalid token: {e}")
+        return None
     except Exception as e:
         print(f"Error verifying token: {e}")
         return None
@@ -3,15 +3,101 @@ Firestore database integration for Zine app
 Replaces SQLAlchemy with Firebase Firestore for persistent storage on Vercel
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import os
+import random
 import uuid
 from werkzeug.security import generate_password_hash, check_password_hash
+from app import startup
+from app.cache import DocumentCache
+from app.analytics import AnalyticsBuffer, ALL_TIME, reader_key, sketch_periods, view_event_id
+from app.counters import ShardedCounters
+from app.hll import HyperLogLog, sparse_registers
+from app.page_patch import apply_ops, RevisionConflict
+from app.page_order import legacy_rank, place, sort_pages, spread_ranks
+from app.names import next_free_name, NameUnavailable, MAX_CLAIM_ATTEMPTS, PREFIX_END
+from app.versions import FirestoreVersionStore
+from app.rollups import (fold_events, read_time_delta, add_counts, rollup_day, window_days,
+                         ROLLUP_WINDOW_DAYS, ANALYTICS_RETENTION_DAYS)
+
+# How availability is established when the client is first created: 'read' gets one
+# (possibly missing) document, 'off' trusts client creation and lets the first real
+# query surface errors
+FIRESTORE_HEALTH_CHECK = os.getenv('FIRESTORE_HEALTH_CHECK', 'read').lower()
+
+# Maximum number of document references sent in one batched get_all call
+GET_ALL_CHUNK_SIZE = 100
+
+# Firestore rejects batched writes with more than 500 operations; every field transform
+# (Increment, Maximum, ...) counts as one more
+BATCH_WRITE_LIMIT = 500
+
+# Home feed settings
+FEED_MAX_ENTRIES = int(os.getenv('FEED_MAX_ENTRIES', 200))  # entries kept per follower
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 5000))  # above this, followers pull instead
+FEED_TRIM_SAMPLE_RATE = float(os.getenv('FEED_TRIM_SAMPLE_RATE', 0.05))  # share of feed reads that trim
+FEED_BACKFILL_PER_CREATOR = 5  # recent zines copied into a feed when following someone
+
+# Search has no index, so it scans published zines in batches up to a fixed budget per page
+SEARCH_BATCH_SIZE = 50
+SEARCH_SCAN_LIMIT = 200
+
+
+def _sortable(value):
+    """Normalize a field value for in-Python ordering (None first, aware datetimes as naive UTC)"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (1, value)
+
+
+def _is_transform(value):
+    return type(value).__module__ == 'google.cloud.firestore_v1.transforms'
+
+
+def _leaves(data, path=()):
+    """(field path tuple, value) for every non-dict value of nested merge data"""
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            yield from _leaves(value, path + (key,))
+        else:
+            yield path + (key,), value
+
+
+def _nest(leaves):
+    data = {}
+    for path, value in leaves:
+        target = data
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return data
+
+
+def _split_merge(data, limit):
+    """Split merge data into parts with at most `limit` field transforms each
+
+    A merge of a large sketch or rollup can carry more transforms than one commit allows;
+    merging the parts one after another writes the same document.
+    """
+    leaves = list(_leaves(data))
+    transforms = [leaf for leaf in leaves if _is_transform(leaf[1])]
+    if len(transforms) <= limit:
+        return [data]
+    plain = [leaf for leaf in leaves if not _is_transform(leaf[1])]
+    return [_nest((plain if start == 0 else []) + transforms[start:start + limit])
+            for start in range(0, len(transforms), limit)]
 
 
 class FirestoreDB:
     def __init__(self):
         self.db = None
         self._available = None
+        self.cache = DocumentCache()
+        self.analytics = AnalyticsBuffer(self._write_analytics)
+        self.counters = ShardedCounters(self)
+        self.versions = FirestoreVersionStore(self)
 
     def _get_db(self):
         """Lazy initialization of Firestore client with availability check"""
@@ -28,23 +114,20 @@ class FirestoreDB:
                     self._available = False
                     raise Exception("Firebase Admin SDK not initialized")
 
-                from firebase_admin import firestore
-                self.db = firestore.client()
+                with startup.timed('firestore_client'):
+                    from firebase_admin import firestore
+                    client = firestore.client()
                 print("Firestore client created")
 
-                # Test if Firestore is actually available
-                test_ref = self.db.collection('_test').document('_test')
-                test_ref.set({'test': True, 'timestamp': datetime.now()})
-                test_doc = test_ref.get()
-                if test_doc.exists:
-                    print("✅ Firestore test write/read successful")
-                    test_ref.delete()
-                    self._available = True
-                    print("✅ Firestore is available and working")
-                else:
-                    print("❌ Firestore test document not found")
-                    self._available = False
-                    raise Exception("Firestore test failed")
+                if FIRESTORE_HEALTH_CHECK == 'read':
+                    # One document read: fails if the API is disabled, the database is
+                    # missing or the credentials can't read. A missing document is fine.
+                    with startup.timed('firestore_health_check'):
+                        client.collection('_health').document('probe').get()
+                    print("✅ Firestore health check read successful")
+                self.db = client
+                self._available = True
+                print("✅ Firestore is available and working")
 
             except Exception as e:
                 print(f"❌ Firestore connection failed: {e}")
@@ -64,9 +147,156 @@ class FirestoreDB:
                 pass
         return self._available == True
 
+    def _get_documents(self, collection, doc_ids, cache_prefix):
+        """Fetch many documents by ID with batched get_all calls
+
+        Returns a dict of id -> document data for the IDs that exist. Cached
+        documents are served from the cache; the rest are fetched in chunks.
+        """
+        unique_ids = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
+        found = {}
+        missing = []
+        for doc_id in unique_ids:
+            cached = self.cache.get(f'{cache_prefix}:{doc_id}')
+            if cached is not None:
+                found[doc_id] = cached
+            else:
+                missing.append(doc_id)
+
+        if missing:
+            db = self._get_db()
+            collection_ref = db.collection(collection)
+            for start in range(0, len(missing), GET_ALL_CHUNK_SIZE):
+                refs = [collection_ref.document(doc_id) for doc_id in missing[start:start + GET_ALL_CHUNK_SIZE]]
+                for doc in db.get_all(refs):
+                    if doc.exists:
+                        data = doc.to_dict()
+                        found[doc.id] = data
+                        self.cache.set(f'{cache_prefix}:{doc.id}', data)
+
+        return found
+
+    def _commit_writes(self, writes):
+        """Apply (op, ref, data) writes in as few batched commits as possible
+
+        Each write costs one operation plus one per field transform; merges with more
+        transforms than fit in a commit are split into several merges of the same document.
+        """
+        db = self._get_db()
+        batches = [[]]
+        used = 0
+        for op, ref, data in writes:
+            parts = _split_merge(data, BATCH_WRITE_LIMIT - 1) if op == 'merge' else [data]
+            for part in parts:
+                cost = 1 + sum(1 for _, value in _leaves(part or {}) if _is_transform(value))
+                if used + cost > BATCH_WRITE_LIMIT and batches[-1]:
+                    batches.append([])
+                    used = 0
+                batches[-1].append((op, ref, part))
+                used += cost
+
+        for writes_in_batch in batches:
+            if not writes_in_batch:
+                continue
+            batch = db.batch()
+            for op, ref, data in writes_in_batch:
+                if op == 'delete':
+                    batch.delete(ref)
+                elif op == 'update':
+                    batch.update(ref, data)
+                elif op == 'merge':
+                    batch.set(ref, data, merge=True)
+                else:
+                    batch.set(ref, data)
+            batch.commit()
+
+    def _ordered_query(self, query, order_field, descending=False, limit=None, start_after=None):
+        """Run a query ordered by (order_field, document id) with limit and cursor on the server
+
+        start_after is a dict of {order_field: value, '__name__': document_id}. If the
+        composite index required by the query is missing (see firestore.indexes.json),
+        the filtered documents are fetched and ordered in Python instead.
+        """
+        from google.api_core.exceptions import FailedPrecondition
+
+        direction = 'DESCENDING' if descending else 'ASCENDING'
+        ordered = query.order_by(order_field, direction=direction).order_by('__name__', direction=direction)
+        if start_after:
+            ordered = ordered.start_after(start_after)
+        if limit:
+            ordered = ordered.limit(limit)
+
+        try:
+            return [doc.to_dict() for doc in ordered.get()]
+        except FailedPrecondition as e:
+            print(f"Missing Firestore index for {order_field} query, sorting in Python: {e}")
+
+        keyed = []
+        for doc in query.get():
+            data = doc.to_dict()
+            keyed.append(((_sortable(data.get(order_field)), doc.id), data))
+        keyed.sort(key=lambda item: item[0], reverse=descending)
+        if start_after:
+            cursor = (_sortable(start_after.get(order_field)), start_after.get('__name__', ''))
+            if descending:
+                keyed = [item for item in keyed if item[0] < cursor]
+            else:
+                keyed = [item for item in keyed if item[0] > cursor]
+        docs = [data for _, data in keyed]
+        return docs[:limit] if limit else docs
+
+    # Name reservations (see app.names)
+    def _taken_names(self, collection, key_prefix):
+        """Names reserved in collection whose key starts with key_prefix, in one query"""
+        docs = self._get_db().collection(collection)\
+            .where('key', '>=', key_prefix)\
+            .where('key', '<', key_prefix + PREFIX_END)\
+            .select(['name']).get()
+        return {doc.to_dict().get('name') for doc in docs}
+
+    def _claim_name(self, collection, owner, base, separator, existing_query, target):
+        """Reserve the first free name starting with base and create target with it
+
+        owner is the key prefix ('' for usernames, '{creator_id}:' for slugs),
+        existing_query(name) finds a document that already uses the name but predates
+        reservations, and target(name) returns (ref, data) to create alongside the
+        reservation. Returns the claimed name.
+        """
+        from google.cloud import firestore
+
+        db = self._get_db()
+        for _ in range(MAX_CLAIM_ATTEMPTS):
+            name = next_free_name(base, self._taken_names(collection, owner + base), separator)
+            reservation = db.collection(collection).document(owner + name)
+
+            @firestore.transactional
+            def claim(transaction):
+                if reservation.get(transaction=transaction).exists:
+                    return None
+                legacy = list(existing_query(name).limit(1).get(transaction=transaction))
+                if legacy:
+                    # Taken before reservations existed: record it so the next prefix query skips it
+                    transaction.set(reservation, {'key': owner + name, 'name': name, 'owner_id': legacy[0].id})
+                    return None
+                ref, data = target(name)
+                transaction.create(reservation, {'key': owner + name, 'name': name, 'owner_id': ref.id,
+                                                 'created_at': datetime.utcnow()})
+                transaction.set(ref, data)
+                return name
+
+            claimed = claim(db.transaction())
+            if claimed is not None:
+                return claimed
+        raise NameUnavailable(base)
+
     # User operations
-    def create_user(self, username, email, firebase_uid, password=None):
-        """Create a new user in Firestore"""
+    def create_user(self, username, email, firebase_uid, password=None, **profile):
+        """Create a new user in Firestore
+
+        username is reserved atomically with the user; if it is taken the first free
+        numbered variant (username1, username2, ...) is used. The returned dict has the
+        username actually claimed.
+        """
         user_id = str(uuid.uuid4())
         user_data = {
             'id': user_id,
@@ -80,17 +310,35 @@ class FirestoreDB:
             'following_count': 0,
             'email_notifications': True
         }
+        user_data.update(profile)
 
         if password:
             user_data['password_hash'] = generate_password_hash(password)
 
-        self._get_db().collection('users').document(user_id).set(user_data)
+        users = self._get_db().collection('users')
+        user_data['username'] = self._claim_name(
+            'usernames', '', username, '',
+            lambda name: users.where('username', '==', name),
+            lambda name: (users.document(user_id), dict(user_data, username=name))
+        )
         return user_data
 
     def get_user_by_id(self, user_id):
         """Get user by ID"""
+        cache_key = f'user:{user_id}'
+        user = self.cache.get(cache_key)
+        if user is not None:
+            return user
+
         doc = self._get_db().collection('users').document(user_id).get()
-        return doc.to_dict() if doc.exists else None
+        user = doc.to_dict() if doc.exists else None
+        self.cache.set(cache_key, user)
+        return user
+
+    def get_users_by_ids(self, user_ids):
+        """Get many users in O(1) round trips, deduplicated and in the caller's order"""
+        found = self._get_documents('users', user_ids, 'user')
+        return [found[user_id] for user_id in dict.fromkeys(user_ids) if user_id in found]
 
     def get_user_by_username(self, username):
         """Get user by username"""
@@ -110,10 +358,69 @@ class FirestoreDB:
     def update_user(self, user_id, data):
         """Update user data"""
         self._get_db().collection('users').document(user_id).update(data)
+        self.cache.invalidate(f'user:{user_id}')
+
+    def count_upload(self, user_id, size):
+        """Count an image upload in the user's tally for today; returns (uploads, bytes)"""
+        from google.cloud import firestore
+
+        db = self._get_db()
+        day = rollup_day(datetime.utcnow())
+        tally_ref = db.collection('upload_tallies').document(f'{user_id}_{day}')
+
+        @firestore.transactional
+        def add(transaction):
+            tally = tally_ref.get(transaction=transaction)
+            data = tally.to_dict() if tally.exists else {}
+            uploads = (data.get('uploads') or 0) + 1
+            total = (data.get('bytes') or 0) + size
+            transaction.set(tally_ref, {'user_id': user_id, 'date': day, 'uploads': uploads, 'bytes': total})
+            return uploads, total
+
+        return add(db.transaction())
+
+    def change_username(self, user_id, username):
+        """Move a user's username reservation to username; returns False if it is taken"""
+        from google.cloud import firestore
+
+        db = self._get_db()
+        users = db.collection('users')
+        user_ref = users.document(user_id)
+        reservation = db.collection('usernames').document(username)
+
+        @firestore.transactional
+        def change(transaction):
+            user = user_ref.get(transaction=transaction)
+            if not user.exists:
+                return False
+            current = user.to_dict().get('username')
+            if current == username:
+                return True
+            reserved = reservation.get(transaction=transaction)
+            if reserved.exists and reserved.to_dict().get('owner_id') != user_id:
+                return False
+            legacy = users.where('username', '==', username).limit(1).get(transaction=transaction)
+            if any(doc.id != user_id for doc in legacy):
+                return False
+
+            transaction.set(reservation, {'key': username, 'name': username, 'owner_id': user_id,
+                                          'created_at': datetime.utcnow()})
+            if current:
+                transaction.delete(db.collection('usernames').document(current))
+            transaction.update(user_ref, {'username': username})
+            return True
+
+        changed = change(db.transaction())
+        self.cache.invalidate(f'user:{user_id}')
+        return changed
 
     # Zine operations
     def create_zine(self, creator_id, title, slug, description='', status='draft'):
-        """Create a new zine"""
+        """Create a new zine
+
+        The slug is reserved per creator atomically with the zine; if it is taken the
+        first free variant (slug-1, slug-2, ...) is used and returned in the dict.
+        """
         zine_id = str(uuid.uuid4())
         zine_data = {
             'id': zine_id,
@@ -129,17 +436,36 @@ class FirestoreDB:
             'likes_count': 0,
             'unique_readers': 0,
             'avg_read_time': 0,
+            'read_time_total': 0,
+            'read_time_count': 0,
             'enable_pdf': False,
             'format': 'A5'
         }
 
-        self._get_db().collection('zines').document(zine_id).set(zine_data)
+        zines = self._get_db().collection('zines')
+        zine_data['slug'] = self._claim_name(
+            'slugs', f'{creator_id}:', slug, '-',
+            lambda name: zines.where('creator_id', '==', creator_id).where('slug', '==', name),
+            lambda name: (zines.document(zine_id), dict(zine_data, slug=name))
+        )
         return zine_data
 
     def get_zine_by_id(self, zine_id):
         """Get zine by ID"""
+        cache_key = f'zine:{zine_id}'
+        zine = self.cache.get(cache_key)
+        if zine is not None:
+            return zine
+
         doc = self._get_db().collection('zines').document(zine_id).get()
-        return doc.to_dict() if doc.exists else None
+        zine = doc.to_dict() if doc.exists else None
+        self.cache.set(cache_key, zine)
+        return zine
+
+    def get_zines_by_ids(self, zine_ids):
+        """Get many zines in O(1) round trips, deduplicated and in the caller's order"""
+        found = self._get_documents('zines', zine_ids, 'zine')
+        return [found[zine_id] for zine_id in dict.fromkeys(zine_ids) if zine_id in found]
 
     def get_zine_by_slug(self, creator_id, slug):
         """Get zine by creator and slug"""
@@ -149,30 +475,59 @@ class FirestoreDB:
             .limit(1).get()
         return zines[0].to_dict() if zines else None
 
-    def get_user_zines(self, creator_id, status=None):
-        """Get all zines by a user"""
+    def get_user_zines(self, creator_id, status=None, limit=None, start_after=None):
+        """Get zines by a user, newest first"""
         query = self._get_db().collection('zines').where('creator_id', '==', creator_id)
         if status:
             query = query.where('status', '==', status)
-        # Get all zines and sort in Python to avoid composite index
-        zines = [doc.to_dict() for doc in query.get()]
-        # Sort by created_at descending
-        return sorted(zines, key=lambda x: x.get('created_at', datetime.min), reverse=True)
+        return self._ordered_query(query, 'created_at', descending=True, limit=limit, start_after=start_after)
 
-    def get_published_zines(self, limit=20):
+    def get_published_zines(self, limit=20, start_after=None):
         """Get recently published zines"""
         query = self._get_db().collection('zines')\
             .where('status', '==', 'published')
-        # Get all published zines and sort in Python to avoid composite index
-        zines = [doc.to_dict() for doc in query.get()]
-        # Sort by published_at descending and limit
-        sorted_zines = sorted(zines, key=lambda x: x.get('published_at', datetime.min), reverse=True)
-        return sorted_zines[:limit]
+        return self._ordered_query(query, 'published_at', descending=True, limit=limit, start_after=start_after)
+
+    def get_popular_zines(self, limit=12, start_after=None):
+        """Get published zines ordered by view count"""
+        query = self._get_db().collection('zines')\
+            .where('status', '==', 'published')
+        return self._ordered_query(query, 'views_count', descending=True, limit=limit, start_after=start_after)
+
+    def search_published_zines(self, text, limit=20, start_after=None, scan_limit=SEARCH_SCAN_LIMIT):
+        """Find published zines whose title or description contains text
+
+        Scans at most scan_limit zines per call, newest first. Returns (matches,
+        next_start_after) where next_start_after resumes the scan, or is None when
+        every published zine has been scanned.
+        """
+        text = text.lower()
+        matches = []
+        scanned = 0
+        cursor = start_after
+        while scanned < scan_limit and len(matches) < limit:
+            batch = self.get_published_zines(limit=SEARCH_BATCH_SIZE, start_after=cursor)
+            for zine in batch:
+                scanned += 1
+                cursor = {'published_at': zine.get('published_at'), '__name__': zine['id']}
+                if text in (zine.get('title') or '').lower() or text in (zine.get('description') or '').lower():
+                    matches.append(zine)
+                    if len(matches) == limit:
+                        return matches, cursor
+            if len(batch) < SEARCH_BATCH_SIZE:
+                return matches, None
+        return matches, cursor
 
     def update_zine(self, zine_id, data):
         """Update zine data"""
         data['updated_at'] = datetime.utcnow()
         self._get_db().collection('zines').document(zine_id).update(data)
+        self.cache.invalidate(f'zine:{zine_id}')
+
+    def set_zine_qr_codes(self, zine_id, qr_codes):
+        """Persist a zine's generated QR keys without changing its updated_at"""
+        self._get_db().collection('zines').document(zine_id).update({'qr_codes': qr_codes})
+        self.cache.invalidate(f'zine:{zine_id}')
 
     def delete_zine(self, zine_id):
         """Delete a zine and all its pages"""
@@ -180,84 +535,317 @@ class FirestoreDB:
         pages = self._get_db().collection('pages').where('zine_id', '==', zine_id).get()
         for page in pages:
             page.reference.delete()
+            self.cache.invalidate(f'page:{page.id}')
 
-        # Delete the zine
+        # Delete the zine, its slug reservation, counter shards, history and analytics aggregates
+        db = self._get_db()
+        zine = self.get_zine_by_id(zine_id)
+        sketches = db.collection('reader_sketches').where('zine_id', '==', zine_id).get()
+        rollups = db.collection('analytics_rollups').where('zine_id', '==', zine_id).get()
+        slug = [('delete', db.collection('slugs').document(f"{zine['creator_id']}:{zine['slug']}"), None)] \
+            if zine and zine.get('slug') else []
+        self._commit_writes(
+            slug +
+            self.counters.delete_writes('zines', zine_id) +
+            self.versions.delete_writes(zine_id) +
+            [('delete', doc.reference, None) for doc in list(sketches) + list(rollups)]
+        )
         self._get_db().collection('zines').document(zine_id).delete()
+        self.cache.invalidate(f'zine:{zine_id}', f'pages:{zine_id}')
 
     # Page operations
-    def create_page(self, zine_id, order=0, content=None, template='blank'):
-        """Create a new page"""
+    def create_page(self, zine_id, order=0, content=None, template='blank', rank=None):
+        """Create a new page (see app.page_order for how rank positions it)"""
         page_id = str(uuid.uuid4())
         page_data = {
             'id': page_id,
             'zine_id': zine_id,
-            'order': order,
+            'rank': rank or legacy_rank(order),
             'content': content or {'blocks': []},
             'template': template,
+            'revision': 0,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
 
         self._get_db().collection('pages').document(page_id).set(page_data)
+        self.cache.invalidate(f'pages:{zine_id}')
         return page_data
 
     def get_page_by_id(self, page_id):
         """Get page by ID"""
+        cache_key = f'page:{page_id}'
+        page = self.cache.get(cache_key)
+        if page is not None:
+            return page
+
         doc = self._get_db().collection('pages').document(page_id).get()
-        return doc.to_dict() if doc.exists else None
+        page = self._page_from_doc(doc.to_dict()) if doc.exists else None
+        self.cache.set(cache_key, page)
+        return page
+
+    @staticmethod
+    def _page_from_doc(page):
+        """Page dict with content['blocks'], whichever layout the document is stored in
+
+        Pages saved with patches store blocks as a block_map keyed by block id plus a
+        block_order list, so an edit only writes the fields that changed.
+        """
+        if page is not None and 'block_order' in page:
+            block_map = page.pop('block_map', None) or {}
+            order = page.pop('block_order') or []
+            page['content'] = {'blocks': [block_map[block_id] for block_id in order if block_id in block_map]}
+        return page
 
     def get_zine_pages(self, zine_id):
         """Get all pages for a zine"""
-        query = self._get_db().collection('pages')\
-            .where('zine_id', '==', zine_id)
-        pages = [doc.to_dict() for doc in query.get()]
-        # Sort by order in Python to avoid needing a composite index
-        return sorted(pages, key=lambda x: x.get('order', 0))
+        cache_key = f'pages:{zine_id}'
+        pages = self.cache.get(cache_key)
+        if pages is not None:
+            return pages
+
+        pages = self._read_pages(zine_id)
+        self.cache.set(cache_key, pages)
+        return pages
+
+    def _read_pages(self, zine_id):
+        """A zine's pages straight from Firestore, in rank order with positions filled in
+
+        Pages without a rank field still sort by their legacy order, so they are fetched
+        unordered and sorted here rather than with order_by.
+        """
+        docs = self._get_db().collection('pages').where('zine_id', '==', zine_id).get()
+        pages = sort_pages(self._page_from_doc(doc.to_dict()) for doc in docs)
+        for position, page in enumerate(pages):
+            page['order'] = position
+        return pages
+
+    def _invalidate_page(self, page_id):
+        """Drop a page and the page list of its zine from the cache"""
+        cached_page = self.cache.peek(f'page:{page_id}')
+        self.cache.invalidate(f'page:{page_id}')
+        if cached_page and cached_page.get('zine_id'):
+            self.cache.invalidate(f"pages:{cached_page['zine_id']}")
+        else:
+            # Owning zine unknown - drop every cached page list
+            self.cache.invalidate_prefix('pages:')
 
     def update_page(self, page_id, data):
         """Update page data"""
+        from google.cloud.firestore_v1 import DELETE_FIELD, Increment
+
         data['updated_at'] = datetime.utcnow()
+        if 'content' in data:
+            # A whole-content save replaces the patch layout and starts a new revision
+            data.update({'block_map': DELETE_FIELD, 'block_order': DELETE_FIELD, 'revision': Increment(1)})
         self._get_db().collection('pages').document(page_id).update(data)
+        self._invalidate_page(page_id)
+
+    def save_page_content(self, page_id, content, base_revision=None):
+        """Replace a page's content and bump its revision in one transaction
+
+        The revision is read inside the transaction rather than from the cache, so the
+        returned value is the one stored. Returns None if the page doesn't exist; raises
+        RevisionConflict if base_revision is given and the page has moved past it.
+        """
+        from google.cloud import firestore
+        from google.cloud.firestore_v1 import DELETE_FIELD
+
+        ref = self._get_db().collection('pages').document(page_id)
+
+        @firestore.transactional
+        def save(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            revision = snapshot.to_dict().get('revision', 0)
+            if base_revision is not None and revision != base_revision:
+                raise RevisionConflict(revision)
+            # A whole-content save replaces the patch layout
+            transaction.update(ref, {'content': content, 'block_map': DELETE_FIELD, 'block_order': DELETE_FIELD,
+                                     'revision': revision + 1, 'updated_at': datetime.utcnow()})
+            return revision + 1
+
+        revision = save(self._get_db().transaction())
+        self._invalidate_page(page_id)
+        return revision
+
+    def patch_page(self, page_id, base_revision, ops):
+        """Apply block operations (see app.page_patch) if the page is still at base_revision
+
+        Only the touched blocks' fields are written. Returns (revision, blocks), or None
+        if the page doesn't exist. Raises RevisionConflict or PatchError.
+        """
+        from google.cloud import firestore
+        from google.cloud.firestore_v1 import DELETE_FIELD
+        from google.cloud.firestore_v1.field_path import FieldPath
+
+        ref = self._get_db().collection('pages').document(page_id)
+
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            page = snapshot.to_dict()
+            revision = page.get('revision', 0)
+            if revision != base_revision:
+                raise RevisionConflict(revision)
+
+            converted = 'block_order' not in page
+            blocks, touched = apply_ops(self._page_from_doc(dict(page))['content'].get('blocks'), ops)
+            final = {block['id']: block for block in blocks}
+            order = [block['id'] for block in blocks]
+
+            if converted:
+                # First patch of a page saved as a whole: switch it to the block layout
+                update = {'block_map': final, 'block_order': order, 'content': DELETE_FIELD}
+            else:
+                update = {}
+                for block_id, fields in touched.items():
+                    if block_id not in final:
+                        update[FieldPath('block_map', block_id).to_api_repr()] = DELETE_FIELD
+                    elif fields is None:
+                        update[FieldPath('block_map', block_id).to_api_repr()] = final[block_id]
+                    else:
+                        for field in fields:
+                            update[FieldPath('block_map', block_id, field).to_api_repr()] = final[block_id][field]
+                if order != page.get('block_order'):
+                    update['block_order'] = order
+
+            update.update({'revision': revision + 1, 'updated_at': datetime.utcnow()})
+            transaction.update(ref, update)
+            return revision + 1, blocks
+
+        result = apply(self._get_db().transaction())
+        self._invalidate_page(page_id)
+        return result
 
     def delete_page(self, page_id):
-        """Delete a page"""
+        """Delete a page; ranks leave no gap to close, so no other page is written"""
         self._get_db().collection('pages').document(page_id).delete()
+        self._invalidate_page(page_id)
+
+    def _rank_writes(self, respaced):
+        now = datetime.utcnow()
+        pages = self._get_db().collection('pages')
+        return [('update', pages.document(page_id), {'rank': rank, 'updated_at': now})
+                for page_id, rank in respaced.items()]
+
+    def insert_page(self, zine_id, index=None, content=None, template='blank'):
+        """Create a page at position index (default: last), writing only the new page
+
+        Returns the page dict with its position as 'order'.
+        """
+        pages = self._read_pages(zine_id)
+        rank, respaced = place(pages, index)
+        page = {
+            'id': str(uuid.uuid4()),
+            'zine_id': zine_id,
+            'rank': rank,
+            'content': content or {'blocks': []},
+            'template': template,
+            'revision': 0,
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+        self._commit_writes(
+            [('set', self._get_db().collection('pages').document(page['id']), page)] +
+            self._rank_writes(respaced)
+        )
+        self.cache.invalidate(f'pages:{zine_id}')
+        return dict(page, order=len(pages) if index is None else max(0, min(index, len(pages))))
+
+    def move_page(self, zine_id, page_id, index):
+        """Move a page to position index; returns its new position, or None if not in the zine"""
+        pages = self._read_pages(zine_id)
+        if not any(page['id'] == page_id for page in pages):
+            return None
+        rank, respaced = place(pages, index, moving_id=page_id)
+        respaced[page_id] = rank
+        self._commit_writes(self._rank_writes(respaced))
+        for moved in respaced:
+            self.cache.invalidate(f'page:{moved}')
+        self.cache.invalidate(f'pages:{zine_id}')
+        return max(0, min(index, len(pages) - 1))
+
+    def replace_pages(self, zine_id, pages):
+        """Make the zine's pages exactly `pages` (dicts, in order) in one batched write
+
+        Pages whose id still exists are overwritten in place and keep their id; the rest
+        are created. Pages not listed are deleted. Used to restore a version.
+        """
+        now = datetime.utcnow()
+        collection = self._get_db().collection('pages')
+        existing = {page['id']: page for page in self._read_pages(zine_id)}
+        writes = []
+        for rank, page in zip(spread_ranks(len(pages)), sorted(pages, key=lambda p: p.get('order', 0))):
+            old = existing.pop(page.get('id'), None)
+            page_id = old['id'] if old else str(uuid.uuid4())
+            writes.append(('set', collection.document(page_id), {
+                'id': page_id,
+                'zine_id': zine_id,
+                'rank': rank,
+                'content': page.get('content') or {'blocks': []},
+                'template': page.get('template') or 'blank',
+                'revision': old.get('revision', 0) + 1 if old else 0,
+                'created_at': old.get('created_at', now) if old else now,
+                'updated_at': now
+            }))
+        writes += [('delete', collection.document(page_id), None) for page_id in existing]
+        self._commit_writes(writes)
+        self.cache.invalidate(*(f'page:{ref.id}' for _, ref, _ in writes), f'pages:{zine_id}')
 
     # Follow operations
-    def follow_user(self, follower_id, followed_id):
-        """Follow a user"""
+    def follow_user(self, follower_id, followed_id, zine_id=None):
+        """Follow a user
+
+        zine_id is the followed creator's zine the follow came from; the follow event is
+        stored and counted in that zine's rollup in the same commit.
+        """
         follow_id = f"{follower_id}_{followed_id}"
+        now = datetime.utcnow()
         follow_data = {
             'id': follow_id,
             'follower_id': follower_id,
             'followed_id': followed_id,
-            'created_at': datetime.utcnow()
+            'created_at': now
         }
 
-        self._get_db().collection('follows').document(follow_id).set(follow_data)
+        # The edge and both counter increments are committed together
+        writes = [('set', self._get_db().collection('follows').document(follow_id), follow_data)]
+        writes += self.counters.increment_writes('users', follower_id, 'following_count', 1)
+        writes += self.counters.increment_writes('users', followed_id, 'followers_count', 1)
+        if zine_id:
+            event = {
+                'id': str(uuid.uuid4()),
+                'zine_id': zine_id,
+                'user_id': follower_id,
+                'event_type': 'follow',
+                'created_at': now
+            }
+            writes.append(('set', self._get_db().collection('analytics').document(event['id']), event))
+            for (_, day), delta in fold_events([event]).items():
+                writes.append(('merge', self._rollup_ref(zine_id, day), self._rollup_increments(zine_id, day, delta)))
+        self._commit_writes(writes)
 
-        # Update counts
-        follower = self.get_user_by_id(follower_id)
         followed = self.get_user_by_id(followed_id)
-
-        if follower:
-            self.update_user(follower_id, {'following_count': follower.get('following_count', 0) + 1})
         if followed:
-            self.update_user(followed_id, {'followers_count': followed.get('followers_count', 0) + 1})
+            self._add_creator_to_feed(follower_id, followed, follow_id)
 
     def unfollow_user(self, follower_id, followed_id):
         """Unfollow a user"""
         follow_id = f"{follower_id}_{followed_id}"
-        self._get_db().collection('follows').document(follow_id).delete()
+        follow_ref = self._get_db().collection('follows').document(follow_id)
+        if not follow_ref.get().exists:
+            return
 
-        # Update counts
-        follower = self.get_user_by_id(follower_id)
-        followed = self.get_user_by_id(followed_id)
+        writes = [('delete', follow_ref, None)]
+        writes += self.counters.increment_writes('users', follower_id, 'following_count', -1)
+        writes += self.counters.increment_writes('users', followed_id, 'followers_count', -1)
+        self._commit_writes(writes)
 
-        if follower:
-            self.update_user(follower_id, {'following_count': max(0, follower.get('following_count', 0) - 1)})
-        if followed:
-            self.update_user(followed_id, {'followers_count': max(0, followed.get('followers_count', 0) - 1)})
+        self._remove_creator_from_feed(follower_id, followed_id)
 
     def is_following(self, follower_id, followed_id):
         """Check if user is following another user"""
@@ -268,29 +856,184 @@ class FirestoreDB:
     def get_followers(self, user_id):
         """Get all followers of a user"""
         query = self._get_db().collection('follows').where('followed_id', '==', user_id)
-        followers = []
-        for doc in query.get():
-            follower_data = doc.to_dict()
-            follower = self.get_user_by_id(follower_data['follower_id'])
-            if follower:
-                followers.append(follower)
-        return followers
+        follower_ids = [doc.to_dict()['follower_id'] for doc in query.get()]
+        return self.get_users_by_ids(follower_ids)
 
     def get_following(self, user_id):
         """Get all users that a user is following"""
         query = self._get_db().collection('follows').where('follower_id', '==', user_id)
-        following = []
-        for doc in query.get():
-            follow_data = doc.to_dict()
-            followed = self.get_user_by_id(follow_data['followed_id'])
-            if followed:
-                following.append(followed)
-        return following
+        followed_ids = [doc.to_dict()['followed_id'] for doc in query.get()]
+        return self.get_users_by_ids(followed_ids)
+
+    # Feed operations
+    # Each user has a precomputed feed at feeds/{user_id}/entries/{zine_id}. Publishing
+    # pushes a compact entry to every follower (fan-out-on-write). Creators with more
+    # than FEED_FANOUT_LIMIT followers are marked feed_mode='pull' and their follow
+    # edges carry feed_pull=True, so readers fetch their zines at read time instead.
+    def _feed_entries(self, user_id):
+        return self._get_db().collection('feeds').document(user_id).collection('entries')
+
+    def _feed_entry(self, zine, creator=None):
+        """Compact feed entry for a published zine"""
+        return {
+            'zine_id': zine['id'],
+            'creator_id': zine.get('creator_id'),
+            'creator_username': (creator or {}).get('username'),
+            'title': zine.get('title'),
+            'slug': zine.get('slug'),
+            'cover_image': zine.get('cover_image'),
+            'published_at': zine.get('published_at') or zine.get('created_at')
+        }
+
+    def _follower_ids(self, user_id):
+        query = self._get_db().collection('follows').where('followed_id', '==', user_id)
+        return [doc.to_dict()['follower_id'] for doc in query.get()]
+
+    def _switch_to_pull(self, creator):
+        """One-time move of a large creator from fan-out-on-write to fan-out-on-read"""
+        print(f"Feed: switching {creator.get('username')} to fan-out-on-read")
+        query = self._get_db().collection('follows').where('followed_id', '==', creator['id'])
+        self._commit_writes([('update', doc.reference, {'feed_pull': True}) for doc in query.get()])
+        self.update_user(creator['id'], {'feed_mode': 'pull'})
+
+    def fan_out_zine(self, zine_id):
+        """Push a published zine into its followers' feeds
+
+        Returns the number of feeds written, or 0 when the creator's followers pull instead.
+        """
+        zine = self.get_zine_by_id(zine_id)
+        if not zine or zine.get('status') != 'published':
+            return 0
+
+        creator = self.get_user_by_id(zine['creator_id']) or {'id': zine['creator_id']}
+        if creator.get('feed_mode') == 'pull':
+            return 0
+        if creator.get('followers_count', 0) > FEED_FANOUT_LIMIT:
+            self._switch_to_pull(creator)
+            return 0
+
+        entry = self._feed_entry(zine, creator)
+        follower_ids = self._follower_ids(creator['id'])
+        self._commit_writes([
+            ('set', self._feed_entries(follower_id).document(zine_id), entry)
+            for follower_id in follower_ids
+        ])
+        return len(follower_ids)
+
+    def _add_creator_to_feed(self, follower_id, creator, follow_id):
+        """Seed a new follower's feed with the creator's recent zines, or mark the edge for pull"""
+        if creator.get('feed_mode') == 'pull':
+            self._get_db().collection('follows').document(follow_id).update({'feed_pull': True})
+            return
+
+        zines = self.get_user_zines(creator['id'], status='published', limit=FEED_BACKFILL_PER_CREATOR)
+        self._commit_writes([
+            ('set', self._feed_entries(follower_id).document(zine['id']), self._feed_entry(zine, creator))
+            for zine in zines
+        ])
+
+    def _remove_creator_from_feed(self, follower_id, creator_id):
+        entries = self._feed_entries(follower_id).where('creator_id', '==', creator_id).get()
+        self._commit_writes([('delete', doc.reference, None) for doc in entries])
+
+    def trim_feed(self, user_id, max_entries=FEED_MAX_ENTRIES):
+        """Delete feed entries beyond the newest max_entries"""
+        stale = self._feed_entries(user_id)\
+            .order_by('published_at', direction='DESCENDING')\
+            .offset(max_entries).get()
+        self._commit_writes([('delete', doc.reference, None) for doc in stale])
+        return len(stale)
+
+    def get_home_feed(self, user_id, limit=20, start_after=None):
+        """Get a page of a user's home feed as published zine dicts, newest first
+
+        Reads the precomputed feed in one ordered, limited query, merges in zines from
+        followed fan-out-on-read creators, and hydrates the result with one batched read.
+        start_after is {'published_at': ..., '__name__': zine_id}. Returns (zines,
+        next_start_after), with next_start_after None on the last page.
+        """
+        query = self._feed_entries(user_id)
+        entries = self._ordered_query(query, 'published_at', descending=True, limit=limit, start_after=start_after)
+        feed_exhausted = len(entries) < limit
+
+        pull_edges = self._get_db().collection('follows')\
+            .where('follower_id', '==', user_id)\
+            .where('feed_pull', '==', True).get()
+        for edge in pull_edges:
+            creator_query = self._get_db().collection('zines')\
+                .where('creator_id', '==', edge.to_dict()['followed_id'])\
+                .where('status', '==', 'published')
+            pulled = self._ordered_query(creator_query, 'published_at', descending=True,
+                                         limit=limit, start_after=start_after)
+            feed_exhausted = feed_exhausted and len(pulled) < limit
+            entries.extend(self._feed_entry(zine) for zine in pulled)
+
+        entries.sort(key=lambda e: (_sortable(e.get('published_at')), e['zine_id']), reverse=True)
+        entries = entries[:limit]
+        zines = self.get_zines_by_ids([e['zine_id'] for e in entries])
+
+        if start_after is None and random.random() < FEED_TRIM_SAMPLE_RATE:
+            self.trim_feed(user_id)
+
+        next_start_after = None
+        if entries and not (feed_exhausted and len(entries) < limit):
+            next_start_after = {'published_at': entries[-1]['published_at'], '__name__': entries[-1]['zine_id']}
+        return [z for z in zines if z.get('status') == 'published'], next_start_after
+
+    def backfill_feeds(self):
+        """Rebuild every user's feed from existing follow edges; returns feeds written"""
+        followers_by_creator = {}
+        for doc in self._get_db().collection('follows').get():
+            edge = doc.to_dict()
+            followers_by_creator.setdefault(edge['followed_id'], []).append(edge['follower_id'])
+
+        creators = {user['id']: user for user in self.get_users_by_ids(list(followers_by_creator))}
+        touched = set()
+        for creator_id, follower_ids in followers_by_creator.items():
+            creator = creators.get(creator_id)
+            if not creator:
+                continue
+            if creator.get('feed_mode') == 'pull':
+                continue
+            if len(follower_ids) > FEED_FANOUT_LIMIT:
+                self._switch_to_pull(creator)
+                continue
+            for follower_id in follower_ids:
+                self._add_creator_to_feed(follower_id, creator, f"{follower_id}_{creator_id}")
+                touched.add(follower_id)
+
+        for follower_id in touched:
+            self.trim_feed(follower_id)
+        return len(touched)
+
+    def backfill_name_reservations(self):
+        """Reserve usernames and slugs of users and zines created before reservations existed"""
+        db = self._get_db()
+        writes = []
+        for doc in db.collection('users').select(['username']).get():
+            name = doc.to_dict().get('username')
+            if name:
+                writes.append(('set', db.collection('usernames').document(name),
+                               {'key': name, 'name': name, 'owner_id': doc.id}))
+        for doc in db.collection('zines').select(['creator_id', 'slug']).get():
+            zine = doc.to_dict()
+            if zine.get('slug'):
+                key = f"{zine['creator_id']}:{zine['slug']}"
+                writes.append(('set', db.collection('slugs').document(key),
+                               {'key': key, 'name': zine['slug'], 'owner_id': doc.id}))
+        self._commit_writes(writes)
+        return len(writes)
 
     # Analytics operations
     def track_view(self, zine_id, user_id=None, session_id=None, referrer=None):
-        """Track a zine view"""
-        analytics_id = str(uuid.uuid4())
+        """Track a zine view
+
+        The event is buffered and written in a later batch (see app.analytics), so this
+        does no I/O on the request path. A session's views of a zine on one day share a
+        single event document.
+        """
+        now = datetime.utcnow()
+        analytics_id = view_event_id(zine_id, session_id, now) if session_id else str(uuid.uuid4())
         analytics_data = {
             'id': analytics_id,
             'zine_id': zine_id,
@@ -298,32 +1041,155 @@ class FirestoreDB:
             'session_id': session_id,
             'event_type': 'view',
             'referrer': referrer,
-            'created_at': datetime.utcnow()
+            'created_at': now
         }
+        self.analytics.record_view(zine_id, analytics_data)
 
-        self._get_db().collection('analytics').document(analytics_id).set(analytics_data)
+    def _write_analytics(self, events, view_counts):
+        """Persist buffered analytics events and per-zine view count increments"""
+        from google.cloud.firestore_v1 import Increment
+        from google.cloud.firestore_v1.transforms import Maximum
 
-        # Update zine view count
-        zine = self.get_zine_by_id(zine_id)
-        if zine:
-            self.update_zine(zine_id, {'views_count': zine.get('views_count', 0) + 1})
-
-    def track_read_time(self, zine_id, session_id, read_time):
-        """Update read time for a session"""
-        query = self._get_db().collection('analytics')\
-            .where('zine_id', '==', zine_id)\
-            .where('session_id', '==', session_id)\
-            .where('event_type', '==', 'view')\
-            .limit(1)
-
-        docs = query.get()
-        if docs:
-            doc = docs[0]
-            doc.reference.update({'read_time': read_time})
-
-    # Initialize demo data
+        db = self._get_db()
+        view_events = {}
+        for event in events:
+            view_events.setdefault(event['id'], []).append(event)
+
+        # A session's daily event keeps the referrer, user and time of its first view; later
+        # flushes only add to its view count. Docs a read-time report created ahead of the
+        # view have no created_at yet and still get the view's fields.
+        refs = {event_id: db.collection('analytics').document(event_id) for event_id in view_events}
+        recorded = set()
+        # Events without a session have random ids and are always new
+        ids = [event_id for event_id, same in view_events.items() if same[0].get('session_id')]
+        for start in range(0, len(ids), GET_ALL_CHUNK_SIZE):
+            for doc in db.get_all([refs[event_id] for event_id in ids[start:start + GET_ALL_CHUNK_SIZE]]):
+                if doc.exists and (doc.to_dict() or {}).get('created_at'):
+                    recorded.add(doc.id)
+        writes = [
+            ('merge', refs[event_id],
+             {'views': Increment(len(same))} if event_id in recorded else {**same[0], 'views': Increment(len(same))})
+            for event_id, same in view_events.items()
+        ]
+        for zine_id, count in view_counts.items():
+            writes += self.counters.increment_writes('zines', zine_id, 'views_count', count)
+
+        # Register-wise Maximum transforms merge sketches without reading them first
+        readers = {}
+        for event in events:
+            reader = reader_key(event.get('user_id'), event.get('session_id'))
+            if reader:
+                for period in sketch_periods(event['created_at']):
+                    readers.setdefault((event['zine_id'], period), set()).add(reader)
+        for (zine_id, period), keys in readers.items():
+            registers = {index: Maximum(rank) for index, rank in sparse_registers(keys).items()}
+            ref = db.collection('reader_sketches').document(f'{zine_id}_{period}')
+            writes.append(('merge', ref, {'zine_id': zine_id, 'period': period, 'registers': registers}))
+
+        for (zine_id, day), delta in fold_events(events).items():
+            writes.append(('merge', self._rollup_ref(zine_id, day), self._rollup_increments(zine_id, day, delta)))
+
+        self._commit_writes(writes)
+
+    def _rollup_ref(self, zine_id, day):
+        return self._get_db().collection('analytics_rollups').document(f'{zine_id}_{day}')
+
+    @staticmethod
+    def _rollup_increments(zine_id, day, delta):
+        """Merge data that adds a rollup delta with Increment transforms"""
+        from google.cloud.firestore_v1 import Increment
+
+        def increments(counts):
+            return {key: increments(value) if isinstance(value, dict) else Increment(value)
+                    for key, value in counts.items()}
+        return {'zine_id': zine_id, 'date': day, **increments(delta)}
+
+    def get_analytics_rollups(self, zine_id, days=ROLLUP_WINDOW_DAYS):
+        """{day: rollup} for the last `days` days, read in one batched get"""
+        refs = [self._rollup_ref(zine_id, day) for day in window_days(days)]
+        return {doc.to_dict()['date']: doc.to_dict() for doc in self._get_db().get_all(refs) if doc.exists}
+
+    def rebuild_rollups(self, days=ROLLUP_WINDOW_DAYS):
+        """Recompute the last `days` days of rollups from raw events (maintenance command)
+
+        Days older than ANALYTICS_RETENTION_DAYS have lost their raw events and must not
+        be rebuilt. Views recorded while this runs may be counted twice.
+        """
+        days = min(days, ANALYTICS_RETENTION_DAYS)
+        since = datetime.combine(datetime.utcnow().date() - timedelta(days=days - 1), datetime.min.time())
+        events = self._get_db().collection('analytics').where('created_at', '>=', since).stream()
+
+        rollups = {}
+        for (zine_id, day), delta in fold_events(doc.to_dict() for doc in events).items():
+            add_counts(rollups.setdefault((zine_id, day), {'zine_id': zine_id, 'date': day}), delta)
+        self._commit_writes([('set', self._rollup_ref(*key), rollup) for key, rollup in rollups.items()])
+        return len(rollups)
+
+    def expire_analytics(self, retention_days=ANALYTICS_RETENTION_DAYS):
+        """Delete raw events older than the retention window; they live on in the rollups"""
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        deleted = 0
+        while True:
+            docs = self._get_db().collection('analytics').where('created_at', '<', cutoff)\
+                .limit(BATCH_WRITE_LIMIT).get()
+            if not docs:
+                return deleted
+            self._commit_writes([('delete', doc.reference, None) for doc in docs])
+            deleted += len(docs)
+
+    def get_unique_reader_counts(self, zine_id, windows=(7, ROLLUP_WINDOW_DAYS)):
+        """{ALL_TIME: n, days: n, ...} approximate distinct readers (users or sessions)
+
+        The all-time sketch and the daily sketches of the longest window are read in one
+        batched get; shorter windows are merged from the same daily sketches.
+        """
+        days = window_days(max(windows))
+        collection = self._get_db().collection('reader_sketches')
+        refs = [collection.document(f'{zine_id}_{period}') for period in [ALL_TIME] + days]
+        registers = {}
+        for doc in self._get_db().get_all(refs):
+            if doc.exists:
+                data = doc.to_dict() or {}
+                registers[data.get('period')] = data.get('registers') or {}
+
+        counts = {}
+        for window, periods in [(ALL_TIME, [ALL_TIME])] + [(window, days[:window]) for window in windows]:
+            sketch = HyperLogLog()
+            for period in periods:
+                sketch.update(registers.get(period, {}))
+            counts[window] = sketch.count()
+        return counts
+
+    def track_read_time(self, zine_id, session_id, read_time, viewed_at=None):
+        """Record a session's read time on its view event and in the zine's running average
+
+        The event is addressed by its deterministic id for the day of the view (viewed_at),
+        which is also the rollup day the read time is added to. The average is kept as
+        read_time_total / read_time_count counters, so nothing is queried or rescanned.
+        """
+        if not self.get_zine_by_id(zine_id):
+            return
+
+        viewed_at = viewed_at or datetime.utcnow()
+        day = rollup_day(viewed_at)
+        event_ref = self._get_db().collection('analytics').document(view_event_id(zine_id, session_id, viewed_at))
+        # A merge, as the view itself may still be waiting in the analytics buffer; its
+        # event_type and created_at are left for the view to set
+        writes = [('merge', event_ref, {
+            'id': event_ref.id,
+            'zine_id': zine_id,
+            'session_id': session_id,
+            'read_time': read_time
+        })]
+        writes += self.counters.increment_writes('zines', zine_id, 'read_time_total', read_time)
+        writes += self.counters.increment_writes('zines', zine_id, 'read_time_count', 1)
+        writes.append(('merge', self._rollup_ref(zine_id, day),
+                       self._rollup_increments(zine_id, day, read_time_delta(read_time))))
+        self._commit_writes(writes)
+
+    # Initialize demo data (run via `flask seed-demo`)
     def init_demo_data(self):
-        """Initialize demo data if database is empty"""
+        """Initialize demo data if database is empty; returns whether anything was created"""
         # Check if demo user exists
         demo_user = self.get_user_by_username('dev')
 
@@ -400,6 +1266,8 @@ class FirestoreDB:
                     ]
                 }
             )
+            return True
+        return False
 
 
 # Global instance
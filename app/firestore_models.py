@@ -4,6 +4,7 @@ Firestore-compatible User class for Flask-Login
 from flask_login import UserMixin
 from werkzeug.security import check_password_hash
 from app.firestore_db import firestore_db
+from app.user_session import refresh_snapshot
 
 
 class FirestoreUser(UserMixin):
@@ -168,6 +169,17 @@ class FirestoreUser(UserMixin):
         # Update local attributes
         for key, value in kwargs.items():
             setattr(self, key, value)
+        self._user_data = dict(self._user_data, **kwargs)
+        refresh_snapshot(self._user_data)
+
+    def change_username(self, username):
+        """Move to a new username; returns False if someone else holds it"""
+        if not firestore_db.change_username(self.id, username):
+            return False
+        self.username = username
+        self._user_data = dict(self._user_data, username=username)
+        refresh_snapshot(self._user_data)
+        return True
 
     def to_dict(self):
         """Convert to dictionary"""
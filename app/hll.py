@@ -0,0 +1,91 @@
+"""
+HyperLogLog sketches for approximate distinct counts
+
+A sketch is HLL_PRECISION bits of register index (4096 registers by default, ~1.6%
+standard error) and never grows with the number of items added. Sketches with the same
+precision merge by taking the register-wise maximum, so daily sketches can be combined
+into any window and concurrent writers can apply updates in any order.
+"""
+import hashlib
+import math
+import os
+
+HLL_PRECISION = int(os.getenv('HLL_PRECISION', 12))
+
+
+def _hash64(value):
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch"""
+
+    def __init__(self, precision=None, registers=None):
+        self.precision = precision or HLL_PRECISION
+        self.m = 1 << self.precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f'Expected {self.m} registers, got {len(self.registers)}')
+
+    def position(self, value):
+        """(register index, rank) that value maps to"""
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = h & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        return index, rank
+
+    def add(self, value):
+        index, rank = self.position(value)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, sparse):
+        """Apply a {index: rank} mapping, e.g. one read back from Firestore"""
+        for index, rank in sparse.items():
+            index = int(index)
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data, precision=None):
+        return cls(precision, data)
+
+    def __len__(self):
+        return self.count()
+
+
+def sparse_registers(values, precision=None):
+    """{str(index): rank} for the registers a set of values touches
+
+    Only touched registers are returned, so a handful of new readers produces a handful
+    of field updates rather than a full sketch.
+    """
+    sketch = HyperLogLog(precision)
+    registers = {}
+    for value in values:
+        index, rank = sketch.position(value)
+        key = str(index)
+        if rank > registers.get(key, 0):
+            registers[key] = rank
+    return registers
@@ -0,0 +1,74 @@
+"""
+HTTP conditional request helpers
+
+Routes build a validator (ETag and optionally Last-Modified) from the documents they are
+about to render and call not_modified() before doing any rendering work. When the client
+already holds the current version a bodyless 304 is returned instead.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from flask import Response, request
+from flask_login import current_user
+
+# Published content that is the same for every anonymous reader
+PUBLIC_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=600'
+
+# Zine pages count views server-side, so shared caches must revalidate every request
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+# Content that varies by user or must be revalidated on every request
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts):
+    """Stable ETag value derived from the values a response depends on"""
+    raw = json.dumps(parts, default=str, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _http_date(value):
+    """Whole-second UTC datetime, as HTTP dates have no sub-second precision"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def is_shared_cacheable():
+    """HTML only varies by the current user when someone is logged in or has flashed messages"""
+    from flask import session
+    return not current_user.is_authenticated and '_flashes' not in session
+
+
+def _apply(response, etag, last_modified, cache_control):
+    response.set_etag(etag, weak=True)
+    last_modified = _http_date(last_modified)
+    if last_modified:
+        response.last_modified = last_modified
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified(etag, last_modified=None, cache_control=None):
+    """Return a 304 response if the client's cached copy is current, otherwise None
+
+    If-None-Match takes precedence over If-Modified-Since, as required by RFC 9110.
+    """
+    if request.if_none_match:
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    else:
+        last_modified = _http_date(last_modified)
+        if not (last_modified and request.if_modified_since and last_modified <= request.if_modified_since):
+            return None
+
+    return _apply(Response(status=304), etag, last_modified, cache_control)
+
+
+def add_validators(response, etag, last_modified=None, cache_control=None):
+    """Attach ETag, Last-Modified and Cache-Control headers to a full response"""
+    return _apply(response, etag, last_modified, cache_control)
@@ -0,0 +1,193 @@
+"""
+Background image processing jobs
+
+Decoding, resizing and encoding uploads is CPU-bound and would block a request worker for
+seconds on large images. Uploads are instead submitted to a bounded process pool and the
+client polls /api/upload/<job_id> for progress. When the queue is full new uploads are
+rejected so image work cannot starve page views handled by the same instance.
+
+Job state is kept in memory, so status must be polled on the instance that accepted the
+upload. With IMAGE_WORKERS=0 (the default on Vercel, where background work is frozen
+after the response) uploads are processed inline and the job is returned already done.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.cache import TTLCache
+from app.images import generate_derivatives, store_derivatives
+
+# Finished jobs are kept this long for the client to collect the result
+FINISHED_JOB_TTL = 600
+
+_progress_queue = None
+
+
+class QueueFull(Exception):
+    """Raised when too many uploads are already waiting for processing"""
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_job(job_id, data, filename):
+    """Worker-process entry point; reports progress back to the parent"""
+    def progress(fraction):
+        if _progress_queue is not None:
+            _progress_queue.put((job_id, fraction))
+    return generate_derivatives(data, filename, progress=progress)
+
+
+class ImageJobQueue:
+    """Bounded queue of image jobs executed in a process pool"""
+
+    def __init__(self, workers=None, max_pending=None):
+        is_vercel = os.getenv('VERCEL') or '/var/task' in os.getcwd()
+        default_workers = 0 if is_vercel else min(2, os.cpu_count() or 1)
+        self.workers = workers if workers is not None else int(os.getenv('IMAGE_WORKERS', default_workers))
+        self.max_pending = max_pending or int(os.getenv('IMAGE_QUEUE_SIZE', 8))
+        self._active = {}
+        self._finished = TTLCache(maxsize=1024, ttl=FINISHED_JOB_TTL)
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pool = None
+        self._storer = None
+        self._progress = None
+
+    def _start(self):
+        """Create the pools on first use so importing the app never forks processes"""
+        with self._start_lock:
+            if self._pool is None:
+                self._create_pools()
+
+    def _create_pools(self):
+        # spawn avoids forking a parent that holds gRPC/Firestore threads
+        context = multiprocessing.get_context('spawn')
+        self._progress = context.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=_init_worker, initargs=(self._progress,)
+        )
+        if self._storer is None:
+            # Storing derivatives is I/O; keep it off the pool's result-handling thread
+            self._storer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-store')
+            atexit.register(self.shutdown)
+        threading.Thread(target=self._read_progress, args=(self._progress,), name='image-progress', daemon=True).start()
+        print(f"Image job pool started with {self.workers} workers")
+
+    def _read_progress(self, progress_queue):
+        while True:
+            try:
+                job_id, fraction = progress_queue.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                job = self._active.get(job_id)
+                if job is not None:
+                    job['status'] = 'processing'
+                    # The last 10% is reserved for writing to the blob store
+                    job['progress'] = round(fraction * 0.9, 2)
+
+    def pending(self):
+        with self._lock:
+            return len(self._active)
+
+    def submit(self, data, filename, store, owner_id=None):
+        """Queue an upload for processing and return its job dict
+
+        Raises QueueFull when max_pending jobs are already queued or running.
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'owner_id': owner_id,
+            'status': 'queued',
+            'progress': 0.0,
+            'result': None,
+            'error': None,
+            'created_at': time.time()
+        }
+
+        if self.workers <= 0:
+            # Inline mode: process in the request and return a finished job
+            self._finish(job, lambda: store_derivatives(generate_derivatives(data, filename), store))
+            return dict(job)
+
+        with self._lock:
+            if len(self._active) >= self.max_pending:
+                raise QueueFull()
+            self._active[job['id']] = job
+
+        try:
+            self._start()
+            future = self._pool.submit(_run_job, job['id'], data, filename)
+        except Exception as e:
+            with self._lock:
+                self._active.pop(job['id'], None)
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. out of memory); start a fresh pool on the next upload
+                self._pool = None
+            raise
+
+        def on_done(fut):
+            produce = lambda: store_derivatives(fut.result(), store)
+            try:
+                self._storer.submit(self._finish, job, produce)
+            except RuntimeError:
+                # Shutting down: store on this thread rather than losing the result
+                self._finish(job, produce)
+        future.add_done_callback(on_done)
+        return dict(job)
+
+    def _finish(self, job, produce):
+        try:
+            result, error = produce(), None
+        except Exception as e:
+            print(f"Image job {job['id']} failed: {e}")
+            result, error = None, str(e)
+        else:
+            total_bytes = sum(v['bytes'] for v in result['variants'])
+            print(f"Image job {job['id']} done: {len(result['variants'])} derivatives "
+                  f"({total_bytes/1024:.1f}KB total), Dimensions: {result['width']}x{result['height']}")
+
+        with self._lock:
+            job.update({
+                'status': 'error' if error else 'done',
+                'progress': 1.0 if not error else job['progress'],
+                'result': result,
+                'error': error,
+                'finished_at': time.time()
+            })
+            self._finished.set(job['id'], job)
+            self._active.pop(job['id'], None)
+
+    def get(self, job_id):
+        """Return a snapshot of a job, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._active.get(job_id) or self._finished.peek(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._active),
+                'finished': len(self._finished)
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._storer is not None:
+            self._storer.shutdown(wait=False)
+
+
+image_jobs = ImageJobQueue()
@@ -0,0 +1,130 @@
+"""
+Image derivative pipeline for uploads
+
+An upload is decoded once and re-encoded at several widths in WebP and in a
+fallback format (JPEG for photos, PNG for graphics). Every derivative is stored in
+the blob store, and a JSON manifest describing them is stored next to them. Image
+blocks keep `src`, `srcset`, `srcset_webp` and `manifest` so viewers can emit
+responsive <picture> markup and each client downloads only the bytes it needs.
+"""
+import json
+from io import BytesIO
+
+from app.blob_store import media_url
+
+DERIVATIVE_WIDTHS = (160, 400, 800, 1600)
+
+# Width used for the plain `src` fallback (matches the old single 800px upload)
+DEFAULT_SRC_WIDTH = 800
+
+# Above this size a JPEG derivative is re-encoded at lower quality
+MAX_JPEG_BYTES = 200000
+
+
+def _normalize(img):
+    """Flatten transparency onto white so every derivative can be encoded as JPEG"""
+    from PIL import Image
+
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _target_widths(width):
+    """Derivative widths for an image, never upscaling"""
+    widths = [w for w in DERIVATIVE_WIDTHS if w < width]
+    if width <= DERIVATIVE_WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def _encode(img, fmt):
+    buffered = BytesIO()
+    if fmt == 'WEBP':
+        img.save(buffered, format='WEBP', quality=75, method=4)
+    elif fmt == 'PNG':
+        img.save(buffered, format='PNG', optimize=True, compress_level=9)
+    else:
+        img.save(buffered, format='JPEG', optimize=True, quality=75, progressive=True)
+        if buffered.tell() > MAX_JPEG_BYTES:
+            buffered = BytesIO()
+            img.save(buffered, format='JPEG', optimize=True, quality=60, progressive=True)
+    return buffered.getvalue()
+
+
+def generate_derivatives(data, filename, progress=None):
+    """Decode an upload and encode all derivatives
+
+    Pure CPU work with picklable input and output, so it can run in a worker process.
+    Returns {'width', 'height', 'fallback_type', 'derivatives': [(width, content_type, bytes)]}.
+    progress, if given, is called with a 0-1 fraction as derivatives are produced.
+    """
+    # Pillow is imported here so only processes that encode images load it
+    from PIL import Image
+
+    img = _normalize(Image.open(BytesIO(data)))
+    original_width, original_height = img.size
+
+    # Graphics/logos with few colours stay PNG; photos use JPEG
+    is_graphic = len(img.getcolors(maxcolors=256) or []) < 256
+    fallback = 'PNG' if (is_graphic and filename.lower().endswith('.png')) else 'JPEG'
+    formats = (('WEBP', 'image/webp'), (fallback, f'image/{fallback.lower()}'))
+
+    widths = _target_widths(img.width)
+    derivatives = []
+    steps = len(widths) * len(formats)
+    for width in sorted(widths, reverse=True):
+        resized = img.copy()
+        if width < img.width:
+            resized.thumbnail((width, img.height), Image.Resampling.LANCZOS)
+        for fmt, content_type in formats:
+            derivatives.append((resized.width, content_type, _encode(resized, fmt)))
+            if progress:
+                progress(len(derivatives) / steps)
+        # Later (smaller) widths are resized from this one, which is faster than from the original
+        img = resized
+
+    return {
+        'width': derivatives[0][0],
+        'height': original_height * derivatives[0][0] // original_width,
+        'fallback_type': formats[1][1],
+        'derivatives': derivatives
+    }
+
+
+def store_derivatives(result, store):
+    """Store generated derivatives and their manifest; returns the manifest dict"""
+    variants = []
+    for width, content_type, image_bytes in result['derivatives']:
+        key = store.put(image_bytes, content_type)
+        variants.append({'url': media_url(key), 'width': width, 'type': content_type, 'bytes': len(image_bytes)})
+    variants.sort(key=lambda v: v['width'])
+
+    fallback = [v for v in variants if v['type'] == result['fallback_type']]
+    webp = [v for v in variants if v['type'] == 'image/webp']
+    default = max((v for v in fallback if v['width'] <= DEFAULT_SRC_WIDTH), key=lambda v: v['width'], default=fallback[0])
+    thumbnail = max((v for v in fallback if v['width'] <= 400), key=lambda v: v['width'], default=fallback[0])
+
+    manifest = {
+        'width': result['width'],
+        'height': result['height'],
+        'src': default['url'],
+        'thumbnail': thumbnail['url'],
+        'srcset': ', '.join(f"{v['url']} {v['width']}w" for v in fallback),
+        'srcset_webp': ', '.join(f"{v['url']} {v['width']}w" for v in webp),
+        'variants': variants
+    }
+    manifest_key = store.put(json.dumps(manifest, sort_keys=True).encode(), 'application/json')
+    manifest['manifest'] = media_url(manifest_key)
+    return manifest
+
+
+def process_upload(data, filename, store):
+    """Generate and store all derivatives for an upload; returns the manifest"""
+    return store_derivatives(generate_derivatives(data, filename), store)
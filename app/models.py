@@ -1,6 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_login import UserMixin
 from app import db
+from app.analytics import ALL_TIME, sketch_periods
+from app.hll import HyperLogLog
+from app.rollups import add_counts, fold_events, window_days, ANALYTICS_RETENTION_DAYS, ROLLUP_WINDOW_DAYS
+import copy
 import json
 
 followers = db.Table('followers',
@@ -64,13 +68,20 @@ class Zine(db.Model):
     views_count = db.Column(db.Integer, default=0)
     unique_readers = db.Column(db.Integer, default=0)
     avg_read_time = db.Column(db.Float, default=0)
+    read_time_total = db.Column(db.Float, default=0)
+    read_time_count = db.Column(db.Integer, default=0)
     enable_pdf = db.Column(db.Boolean, default=True)
     layout_type = db.Column(db.String(20), default='A5')  # A5, A4, square
 
+    __table_args__ = (db.UniqueConstraint('creator_id', 'slug'),)  # Slugs are claimed via app.names
+
     pages = db.relationship('Page', backref='zine', lazy='dynamic', cascade='all, delete-orphan', order_by='Page.order')
     tags = db.relationship('Tag', secondary='zine_tags', backref='zines', lazy='dynamic')
     analytics = db.relationship('Analytics', backref='zine', lazy='dynamic', cascade='all, delete-orphan')
     versions = db.relationship('ZineVersion', backref='zine', lazy='dynamic', cascade='all, delete-orphan', order_by='ZineVersion.created_at.desc()')
+    reader_sketches = db.relationship('ReaderSketch', backref='zine', lazy='dynamic', cascade='all, delete-orphan')
+    analytics_rollups = db.relationship('AnalyticsRollup', backref='zine', lazy='dynamic', cascade='all, delete-orphan')
+    page_blobs = db.relationship('PageBlob', backref='zine', lazy='dynamic', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Zine {self.title}>'
@@ -81,9 +92,11 @@ class Zine(db.Model):
 class Page(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     zine_id = db.Column(db.Integer, db.ForeignKey('zine.id'), nullable=False)
-    order = db.Column(db.Integer, nullable=False)
+    order = db.Column(db.Integer, nullable=False)  # Legacy position, used when rank is unset
+    rank = db.Column(db.String(64))  # Fractional position key, see app.page_order
     content = db.Column(db.JSON)  # Stores page blocks as JSON
     template = db.Column(db.String(50))
+    revision = db.Column(db.Integer, default=0)  # Bumped on every save, for patch conflicts
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -94,7 +107,7 @@ class ZineVersion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     zine_id = db.Column(db.Integer, db.ForeignKey('zine.id'), nullable=False)
     version_number = db.Column(db.Integer, nullable=False)
-    content_snapshot = db.Column(db.JSON)
+    content_snapshot = db.Column(db.JSON)  # Manifest of page hashes (see app.versions)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
 
@@ -126,4 +139,122 @@ class Analytics(db.Model):
     referrer = db.Column(db.String(255))
     session_id = db.Column(db.String(100))
     read_time = db.Column(db.Float)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PageBlob(db.Model):
+    """Page content stored once per zine per content hash, shared by versions"""
+    id = db.Column(db.Integer, primary_key=True)
+    zine_id = db.Column(db.Integer, db.ForeignKey('zine.id'), nullable=False)
+    hash = db.Column(db.String(64), nullable=False)
+    content = db.Column(db.JSON)
+
+    __table_args__ = (db.UniqueConstraint('zine_id', 'hash'),)
+
+class ReaderSketch(db.Model):
+    """HyperLogLog sketch of a zine's distinct readers for one day, or all time"""
+    id = db.Column(db.Integer, primary_key=True)
+    zine_id = db.Column(db.Integer, db.ForeignKey('zine.id'), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # YYYY-MM-DD or 'all'
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('zine_id', 'period'),)
+
+    @classmethod
+    def add_reader(cls, zine_id, reader, when=None):
+        """Add a reader to the day's and the all-time sketch; returns the all-time count
+
+        The rows are locked until the caller commits, so concurrent views can't drop each
+        other's registers.
+        """
+        count = 0
+        for period in sketch_periods(when or datetime.utcnow()):
+            row = cls.query.filter_by(zine_id=zine_id, period=period).with_for_update().first()
+            sketch = HyperLogLog.from_bytes(row.registers) if row else HyperLogLog()
+            sketch.add(reader)
+            if row:
+                row.registers = sketch.to_bytes()
+            else:
+                db.session.add(cls(zine_id=zine_id, period=period, registers=sketch.to_bytes()))
+            if period == ALL_TIME:
+                count = sketch.count()
+        return count
+
+    @classmethod
+    def merged(cls, zine_id, days=None):
+        """Merged sketch for the last `days` days, or all time if None"""
+        if days:
+            today = datetime.utcnow().date()
+            periods = [(today - timedelta(days=n)).strftime('%Y-%m-%d') for n in range(days)]
+        else:
+            periods = [ALL_TIME]
+
+        sketch = HyperLogLog()
+        for row in cls.query.filter(cls.zine_id == zine_id, cls.period.in_(periods)):
+            sketch.merge(HyperLogLog.from_bytes(row.registers))
+        return sketch
+
+class UploadTally(db.Model):
+    """A user's image uploads on one day, for the daily upload quota"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.String(10), nullable=False)  # YYYY-MM-DD
+    uploads = db.Column(db.Integer, nullable=False, default=0)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'date'),)
+
+    @classmethod
+    def add(cls, user_id, day, size):
+        """Count one upload of size bytes; returns (uploads, bytes) for the day (caller commits)"""
+        row = cls.query.filter_by(user_id=user_id, date=day).with_for_update().first()
+        if row is None:
+            row = cls(user_id=user_id, date=day, uploads=0, bytes=0)
+            db.session.add(row)
+        row.uploads = (row.uploads or 0) + 1
+        row.bytes = (row.bytes or 0) + size
+        return row.uploads, row.bytes
+
+class AnalyticsRollup(db.Model):
+    """Per-zine daily analytics counts (see app.rollups)"""
+    id = db.Column(db.Integer, primary_key=True)
+    zine_id = db.Column(db.Integer, db.ForeignKey('zine.id'), nullable=False)
+    date = db.Column(db.String(10), nullable=False)  # YYYY-MM-DD
+    counts = db.Column(db.JSON, nullable=False, default=dict)
+
+    __table_args__ = (db.UniqueConstraint('zine_id', 'date'),)
+
+    @classmethod
+    def add(cls, zine_id, day, delta):
+        """Add a rollup delta to the zine's row for day (caller commits)"""
+        row = cls.query.filter_by(zine_id=zine_id, date=day).with_for_update().first()
+        if row is None:
+            row = cls(zine_id=zine_id, date=day, counts={})
+            db.session.add(row)
+        # Reassign so the JSON column is marked dirty
+        row.counts = add_counts(copy.deepcopy(row.counts or {}), delta)
+
+    @classmethod
+    def rebuild(cls, days=ROLLUP_WINDOW_DAYS):
+        """Recompute the last `days` days of rollups from raw Analytics rows (caller commits)
+
+        Days older than ANALYTICS_RETENTION_DAYS have lost their raw events and are not rebuilt.
+        """
+        days = min(days, ANALYTICS_RETENTION_DAYS)
+        since = datetime.combine(datetime.utcnow().date() - timedelta(days=days - 1), datetime.min.time())
+        events = ({'zine_id': row.zine_id, 'event_type': row.event_type, 'referrer': row.referrer,
+                   'read_time': row.read_time, 'created_at': row.created_at}
+                  for row in Analytics.query.filter(Analytics.created_at >= since))
+        rollups = fold_events(events)
+        for (zine_id, day), counts in rollups.items():
+            row = cls.query.filter_by(zine_id=zine_id, date=day).with_for_update().first()
+            if row is None:
+                db.session.add(cls(zine_id=zine_id, date=day, counts=counts))
+            else:
+                row.counts = counts
+        return len(rollups)
+
+    @classmethod
+    def window(cls, zine_id, days=ROLLUP_WINDOW_DAYS):
+        """{day: counts} for the last `days` days"""
+        rows = cls.query.filter(cls.zine_id == zine_id, cls.date.in_(window_days(days)))
+        return {row.date: row.counts for row in rows}
@@ -0,0 +1,58 @@
+"""
+Unique username and zine slug allocation
+
+A name is taken by a reservation document whose id is the name (`usernames/{username}`,
+`slugs/{creator_id}:{slug}`), created in the same transaction as the user or zine, so
+two concurrent sign-ups or zine creations can't both get the same name. Choosing a name
+is one prefix query over the reservations followed by picking the first free suffix
+locally, instead of probing `base1`, `base2`, ... with a query each.
+
+On SQL the unique constraints play the role of the reservations: the taken names come
+from one prefix query and the insert is retried if a concurrent request won the race.
+"""
+
+MAX_CLAIM_ATTEMPTS = 5
+
+# Sorts after every character a name can contain, for prefix range queries
+PREFIX_END = '\uf8ff'
+
+
+class NameUnavailable(Exception):
+    """No free name could be claimed within MAX_CLAIM_ATTEMPTS"""
+
+    def __init__(self, base):
+        super().__init__(f'Could not allocate a unique name for {base!r}')
+        self.base = base
+
+
+def next_free_name(base, taken, separator=''):
+    """base itself if free, else base + separator + the smallest free positive number"""
+    if base not in taken:
+        return base
+    number = 1
+    while f'{base}{separator}{number}' in taken:
+        number += 1
+    return f'{base}{separator}{number}'
+
+
+def claim_sql_name(column, base, build, separator='', filters=()):
+    """Insert and commit build(name) under the first free name starting with base
+
+    column is the unique name column; filters narrow the prefix query (e.g. to one
+    creator). Returns the committed row.
+    """
+    from sqlalchemy.exc import IntegrityError
+    from app import db
+
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        taken = {name for (name,) in db.session.query(column).filter(
+            column.startswith(base, autoescape=True), *filters)}
+        row = build(next_free_name(base, taken, separator))
+        db.session.add(row)
+        try:
+            db.session.commit()
+            return row
+        except IntegrityError:
+            # Someone else took the name between the query and the insert
+            db.session.rollback()
+    raise NameUnavailable(base)
@@ -0,0 +1,113 @@
+"""
+Page ordering with fractional rank keys
+
+Each page stores a `rank`: a base-62 digit string read as a fraction (0.d1d2...), and pages
+are shown in rank order. A page can always be given a rank strictly between two
+neighbours, so inserting, moving or deleting a page writes that one page only - nothing
+after it is renumbered. A page's position (`order`) is derived when pages are listed.
+
+Pages saved before ranks existed only have an integer `order`; legacy_rank() maps it onto
+a rank that sorts the same way, so old and new pages mix without a migration.
+
+Repeated inserts into the same gap make keys longer; once a key would exceed
+MAX_RANK_LENGTH every page in the zine is given an evenly spaced rank instead, in one
+batched write.
+"""
+RANK_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+MAX_RANK_LENGTH = 32
+
+_LEGACY_WIDTH = 4
+
+
+def _digit(char):
+    return RANK_DIGITS.index(char)
+
+
+def _midpoint(a, b):
+    """Digit string strictly between a and b (b=None is the open end)"""
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    low = _digit(a[0]) if a else 0
+    high = _digit(b[0]) if b is not None else len(RANK_DIGITS)
+    if high - low > 1:
+        return RANK_DIGITS[(low + high + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return RANK_DIGITS[low] + _midpoint(a[1:], None)
+
+
+def rank_between(before=None, after=None):
+    """Rank sorting after `before` and before `after`; either may be None"""
+    before = before or ''
+    if after is not None and before >= after:
+        raise ValueError(f'Cannot rank between {before!r} and {after!r}')
+    return _midpoint(before, after)
+
+
+def _encode(number, width):
+    digits = []
+    for _ in range(width):
+        number, remainder = divmod(number, len(RANK_DIGITS))
+        digits.append(RANK_DIGITS[remainder])
+    return ''.join(reversed(digits))
+
+
+def legacy_rank(order):
+    """Rank equivalent of an integer page order"""
+    order = min(max(int(order or 0), 0), len(RANK_DIGITS) ** _LEGACY_WIDTH - 1)
+    # Keys never end in '0', so there is always room before them
+    return _encode(order, _LEGACY_WIDTH) + 'V'
+
+
+def spread_ranks(count):
+    """`count` short, evenly spaced ranks in ascending order"""
+    width = 1
+    while len(RANK_DIGITS) ** width <= count:
+        width += 1
+    space = len(RANK_DIGITS) ** width
+    return [_encode((i + 1) * space // (count + 1), width).rstrip('0') for i in range(count)]
+
+
+def _field(page, name):
+    return page.get(name) if isinstance(page, dict) else getattr(page, name, None)
+
+
+def page_rank(page):
+    """Rank of a page dict or Page row, falling back to its legacy order"""
+    return _field(page, 'rank') or legacy_rank(_field(page, 'order'))
+
+
+def sort_pages(pages):
+    """Pages in display order; ties (concurrent inserts) are broken by id"""
+    return sorted(pages, key=lambda page: (page_rank(page), str(_field(page, 'id'))))
+
+
+def place(pages, index=None, moving_id=None):
+    """(rank, respaced) for putting a page at `index` among `pages`
+
+    `moving_id` is left out of the neighbours when an existing page moves. respaced is
+    empty unless the new key would be too long, in which case it maps every other page
+    id to a fresh evenly spaced rank.
+    """
+    others = [page for page in sort_pages(pages) if str(_field(page, 'id')) != str(moving_id)]
+    index = len(others) if index is None else max(0, min(int(index), len(others)))
+    keys = [page_rank(page) for page in others]
+
+    before = keys[index - 1] if index else None
+    after = keys[index] if index < len(keys) else None
+    if before is not None and after is not None and before >= after:
+        # Tied ranks from concurrent inserts leave no gap; respace below
+        rank = None
+    else:
+        rank = rank_between(before, after)
+    if rank is not None and len(rank) <= MAX_RANK_LENGTH:
+        return rank, {}
+
+    ranks = spread_ranks(len(others) + 1)
+    respaced = {_field(page, 'id'): ranks[i if i < index else i + 1] for i, page in enumerate(others)}
+    return ranks[index], respaced
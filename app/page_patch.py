@@ -0,0 +1,118 @@
+"""
+Block-level page patches for editor autosave
+
+Instead of re-sending the whole page, the editor sends the operations since its last save
+together with the page revision it started from:
+
+    {"base_revision": 7, "ops": [
+        {"op": "insert", "block": {...}, "index": 2},
+        {"op": "update", "id": "b1", "fields": {"x": "40px", "content": "Hello"}},
+        {"op": "delete", "id": "b2"},
+        {"op": "move", "id": "b3", "index": 0}
+    ]}
+
+If the page has moved past base_revision (another tab saved in between) the patch is
+rejected with RevisionConflict and the client reloads the page.
+"""
+import copy
+import re
+
+MAX_PATCH_OPS = 500
+
+_FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class PatchError(ValueError):
+    """The patch is malformed or refers to blocks that don't exist"""
+
+
+class RevisionConflict(Exception):
+    """The page changed since the client's base revision"""
+
+    def __init__(self, revision):
+        super().__init__(f'Page is at revision {revision}')
+        self.revision = revision
+
+
+def ensure_block_ids(blocks):
+    """Give blocks saved without an id a stable positional one, so patches can address them"""
+    for index, block in enumerate(blocks):
+        if isinstance(block, dict) and not block.get('id'):
+            block['id'] = f'b{index}'
+    return blocks
+
+
+def _block_id(value):
+    if not isinstance(value, (str, int)) or isinstance(value, bool) or value == '':
+        raise PatchError('Block ids must be non-empty strings')
+    return str(value)
+
+
+def _check_fields(fields):
+    if not isinstance(fields, dict) or not all(isinstance(k, str) and _FIELD_NAME.match(k) for k in fields):
+        raise PatchError('Block fields must be a mapping of simple field names')
+
+
+def apply_ops(blocks, ops):
+    """Apply ops to a copy of blocks
+
+    Returns (new_blocks, touched) where touched maps each changed block id to the set of
+    fields that changed, or to None if the whole block was inserted or replaced. Ids
+    missing from new_blocks were deleted.
+    """
+    if not isinstance(ops, list) or len(ops) > MAX_PATCH_OPS:
+        raise PatchError(f'ops must be a list of at most {MAX_PATCH_OPS} operations')
+
+    blocks = ensure_block_ids(copy.deepcopy(blocks or []))
+    by_id = {block['id']: block for block in blocks}
+    order = [block['id'] for block in blocks]
+    touched = {}
+
+    def position(op, limit):
+        index = op.get('index', limit)
+        if not isinstance(index, int) or isinstance(index, bool):
+            raise PatchError('index must be an integer')
+        return max(0, min(index, limit))
+
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError('Each operation must be an object')
+        kind = op.get('op')
+
+        if kind == 'insert':
+            block = op.get('block')
+            if not isinstance(block, dict):
+                raise PatchError('insert needs a block')
+            _check_fields(block)
+            block_id = _block_id(block.get('id'))
+            if block_id in by_id:
+                raise PatchError(f'Block {block_id} already exists')
+            block = dict(block, id=block_id)
+            by_id[block_id] = block
+            order.insert(position(op, len(order)), block_id)
+            touched[block_id] = None
+            continue
+
+        block_id = _block_id(op.get('id'))
+        if block_id not in by_id:
+            raise PatchError(f'Unknown block {block_id}')
+
+        if kind == 'update':
+            fields = op.get('fields')
+            _check_fields(fields)
+            if 'id' in fields:
+                raise PatchError('A block id cannot be changed')
+            by_id[block_id].update(copy.deepcopy(fields))
+            if touched.get(block_id, set()) is not None:
+                touched[block_id] = touched.get(block_id, set()) | set(fields)
+        elif kind == 'delete':
+            del by_id[block_id]
+            order.remove(block_id)
+            touched[block_id] = None
+        elif kind == 'move':
+            order.remove(block_id)
+            order.insert(position(op, len(order)), block_id)
+        else:
+            raise PatchError(f'Unknown operation {kind!r}')
+
+    return [by_id[block_id] for block_id in order], touched
@@ -0,0 +1,68 @@
+"""
+Opaque cursor tokens for keyset pagination
+
+A cursor encodes the sort value and id of the last item on a page. The next page
+starts strictly after it, so every page costs the same number of reads however
+deep the user scrolls.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort_value, item_id):
+    """Build an opaque, URL-safe cursor from the last item's sort value and id"""
+    if isinstance(sort_value, datetime):
+        payload = {'t': 'dt', 'v': sort_value.isoformat(), 'id': item_id}
+    else:
+        payload = {'t': 'raw', 'v': sort_value, 'id': item_id}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (sort_value, item_id) from a cursor, or None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        value = payload['v']
+        if payload.get('t') == 'dt':
+            value = datetime.fromisoformat(value)
+        return value, payload['id']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _value(item, field):
+    return item.get(field) if isinstance(item, dict) else getattr(item, field, None)
+
+
+def next_cursor(items, sort_field, page_size, id_field='id'):
+    """Cursor for the page after items, or None when this was the last page"""
+    if not items or len(items) < page_size:
+        return None
+    last = items[-1]
+    return encode_cursor(_value(last, sort_field), _value(last, id_field))
+
+
+def firestore_start_after(cursor, sort_field):
+    """Convert a decoded cursor into a Firestore start_after dict"""
+    if not cursor:
+        return None
+    sort_value, item_id = cursor
+    return {sort_field: sort_value, '__name__': item_id}
+
+
+def keyset_filter(query, sort_column, id_column, cursor):
+    """Restrict a descending (sort_column, id_column) SQLAlchemy query to rows after cursor"""
+    if not cursor:
+        return query
+    sort_value, item_id = cursor
+    return query.filter(or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < item_id)
+    ))
@@ -0,0 +1,100 @@
+"""
+QR codes for sharing zines
+
+A zine's QR code only depends on its canonical URL, so it is generated once (at publish
+time, or on the first request for older zines), stored in the blob store and served from
+/<username>/<slug>/qr.svg|png with an ETag. SVG output is a single path made of
+horizontal runs, which is a fraction of the size of the per-module SVG qrcode emits.
+"""
+import io
+import os
+
+from app.cache import TTLCache
+
+QR_FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png'
+}
+
+# Canonical URL -> stored QR keys, so instances without a persisted copy generate once
+_qr_codes = TTLCache(maxsize=int(os.getenv('QR_CACHE_SIZE', 1024)), ttl=86400)
+
+
+def _qr(url):
+    # qrcode (and Pillow, for PNGs) load on first use, not on every cold start
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_svg(url):
+    """Vector QR code with one path of horizontal runs"""
+    matrix = _qr(url).get_matrix()
+    size = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            runs.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(runs)}" fill="#000"/></svg>'
+    ).encode()
+
+
+def render_qr_png(url):
+    img = _qr(url).make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def zine_share_url(username, slug):
+    """The zine URL encoded in its QR code
+
+    Built on PUBLIC_BASE_URL, so preview deployments, custom domains and localhost all
+    produce the same URL and there is one stored QR code per zine. Without it (local
+    development) the requesting host is used.
+    """
+    from flask import current_app, url_for
+
+    base = current_app.config.get('PUBLIC_BASE_URL')
+    if base:
+        return base.rstrip('/') + url_for('viewer.view_zine', username=username, slug=slug)
+    return url_for('viewer.view_zine', username=username, slug=slug, _external=True)
+
+
+def generate_qr_codes(url, store):
+    """Render every format for url into the blob store; returns {'url', 'svg', 'png'} keys"""
+    codes = {
+        'url': url,
+        'svg': store.put(render_qr_svg(url), QR_FORMATS['svg']),
+        'png': store.put(render_qr_png(url), QR_FORMATS['png'])
+    }
+    _qr_codes.set(url, codes)
+    return codes
+
+
+def get_qr_codes(url, store, stored=None):
+    """Return QR keys for url, reusing a persisted copy when it was made for the same URL
+
+    Returns (codes, generated) where generated is True if the codes had to be rendered.
+    """
+    if stored and stored.get('url') == url:
+        return stored, False
+
+    codes = _qr_codes.get(url)
+    if codes:
+        return codes, False
+
+    return generate_qr_codes(url, store), True
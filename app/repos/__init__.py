@@ -0,0 +1,85 @@
+"""
+Storage repositories
+
+Routes read and write zines, pages, users, follows and analytics through get_repos()
+instead of branching on Firestore vs SQLAlchemy themselves, so caching, batching and
+pagination live in one place per backend:
+
+- firestore: app.firestore_db (persistent storage on Vercel)
+- sql: the SQLAlchemy models (local development)
+- memory: plain dicts in this process, a fast stand-in for load tests and local runs
+  without Firestore; MEMORY_SEED="creators,zines,pages" fills it with sample data
+
+STORAGE_BACKEND picks one; by default Firestore is used when it is available and SQL
+otherwise. See app.repos.base for the interfaces.
+"""
+import os
+import threading
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', '').strip().lower()
+
+_repos = None
+_lock = threading.Lock()
+
+
+class Repos:
+    """One backend's repositories plus its unit of work"""
+
+    def __init__(self, backend, zines, pages, users, follows, analytics, versions):
+        self.backend = backend
+        self.zines = zines
+        self.pages = pages
+        self.users = users
+        self.follows = follows
+        self.analytics = analytics
+        self.versions = versions
+
+    def commit(self):
+        """Commit pending writes (SQL only; other backends write immediately)"""
+
+    def rollback(self):
+        """Discard pending writes (SQL only)"""
+
+    def with_creators(self, zines):
+        """Zines with their creator dict as 'creator', loading all creators in one read"""
+        zines = [zine for zine in zines if zine]
+        creators = self.users.get_many({zine.get('creator_id') for zine in zines})
+        return [dict(zine, creator=creators.get(zine.get('creator_id'))) for zine in zines]
+
+
+def _firestore_available():
+    try:
+        from app.firestore_db import firestore_db
+        return firestore_db.is_available()
+    except Exception as e:
+        print(f"Error checking Firestore availability: {e}")
+        return False
+
+
+def _build(backend):
+    if backend == 'firestore':
+        from app.repos.firestore import firestore_repos
+        return firestore_repos()
+    if backend == 'memory':
+        from app.repos.memory import memory_repos
+        return memory_repos(os.getenv('MEMORY_SEED', ''))
+    from app.repos.sql import sql_repos
+    return sql_repos()
+
+
+def get_repos():
+    """The process's repositories, choosing the backend on first use"""
+    global _repos
+    if _repos is None:
+        with _lock:
+            if _repos is None:
+                backend = STORAGE_BACKEND or ('firestore' if _firestore_available() else 'sql')
+                _repos = _build(backend)
+                print(f"Storage backend: {_repos.backend}")
+    return _repos
+
+
+def set_repos(repos):
+    """Replace the process's repositories (tests, load-test harnesses)"""
+    global _repos
+    _repos = repos
@@ -0,0 +1,166 @@
+"""
+Repository interfaces
+
+Every backend returns plain dicts shaped like the Firestore documents (zines, pages,
+users), so routes and templates have a single code path whichever backend is in use.
+
+Listing methods take a decoded cursor (app.pagination.decode_cursor) and return
+(items, next_cursor_token), with the token None on the last page.
+
+On SQL, writes join the request's session and are committed by Repos.commit(); Firestore
+and the in-memory backend write immediately and commit() does nothing.
+"""
+
+
+class ZineRepo:
+    def get(self, zine_id):
+        """Zine dict by id, or None"""
+        raise NotImplementedError
+
+    def get_by_slug(self, creator_id, slug):
+        raise NotImplementedError
+
+    def create(self, creator_id, title, slug, description='', status='draft'):
+        """Create a zine under the first free variant of slug (slug-1, slug-2, ...)"""
+        raise NotImplementedError
+
+    def update(self, zine_id, fields):
+        """Update fields and bump updated_at"""
+        raise NotImplementedError
+
+    def touch(self, zine_id):
+        """Mark the zine as changed (its cached HTML and ETags depend on updated_at)"""
+        self.update(zine_id, {})
+
+    def publish(self, zine_id, status, tags, qr_codes=None):
+        """Set status ('published' or 'unlisted'), published_at, tags and share QR codes"""
+        raise NotImplementedError
+
+    def set_qr_codes(self, zine_id, qr_codes):
+        """Persist generated QR keys without changing updated_at (no-op where unsupported)"""
+
+    def by_creator(self, creator_id, status=None, limit=None, cursor=None):
+        """A creator's zines, newest first"""
+        raise NotImplementedError
+
+    def published(self, limit, cursor=None, category=None):
+        """Published zines, most recently published first"""
+        raise NotImplementedError
+
+    def popular(self, limit, cursor=None):
+        """Published zines by view count"""
+        raise NotImplementedError
+
+    def search(self, text, limit, cursor=None):
+        """Published zines whose title or description contains text"""
+        raise NotImplementedError
+
+    def categories(self):
+        """Tag dicts ({'name', 'category'}) to filter listings by"""
+        return []
+
+
+class PageRepo:
+    def list(self, zine_id):
+        """A zine's pages in display order, each with its position as 'order'"""
+        raise NotImplementedError
+
+    def get(self, page_id):
+        raise NotImplementedError
+
+    def insert(self, zine_id, index=None, content=None, template='blank'):
+        """Create a page at position index (default: last); returns it with 'order'"""
+        raise NotImplementedError
+
+    def save_content(self, page_id, content, base_revision=None):
+        """Replace a page's content; returns the new revision
+
+        Raises RevisionConflict if base_revision is given and the page has moved past it.
+        """
+        raise NotImplementedError
+
+    def patch(self, page_id, base_revision, ops):
+        """Apply block operations (app.page_patch) at base_revision
+
+        Returns (new revision, new content), or None if the page doesn't exist. Raises
+        RevisionConflict or PatchError.
+        """
+        raise NotImplementedError
+
+    def move(self, zine_id, page_id, index):
+        """Move a page to index; returns its new position, or None if not in the zine"""
+        raise NotImplementedError
+
+    def delete(self, page_id):
+        raise NotImplementedError
+
+    def replace(self, zine_id, pages):
+        """Make the zine's pages exactly `pages` (dicts with 'order'), keeping known ids"""
+        raise NotImplementedError
+
+
+class UserRepo:
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def get_by_username(self, username):
+        raise NotImplementedError
+
+    def get_many(self, user_ids):
+        """{id: user} for the ids that exist, in as few reads as the backend allows"""
+        raise NotImplementedError
+
+    def create(self, username, email, firebase_uid, **profile):
+        """Create a user under the first free variant of username"""
+        raise NotImplementedError
+
+    def search(self, text, limit=20):
+        """Users whose username or bio contains text"""
+        return []
+
+    def notifications(self, user_id, limit=50):
+        """A user's newest notifications, marking them read"""
+        return []
+
+    def notify(self, user_id, kind, title, message, link=None):
+        """Queue a notification for a user (no-op where unsupported)"""
+
+    def count_upload(self, user_id, size):
+        """Count an image upload against the user's daily quota; returns (uploads, bytes) today"""
+        raise NotImplementedError
+
+
+class FollowRepo:
+    def follow(self, follower_id, followed_id, zine_id=None):
+        """Follow a creator; zine_id is the creator's zine the follow came from, if any,
+        and a new follow is counted in that zine's rollups"""
+        raise NotImplementedError
+
+    def unfollow(self, follower_id, followed_id):
+        raise NotImplementedError
+
+    def is_following(self, follower_id, followed_id):
+        raise NotImplementedError
+
+    def feed(self, user_id, limit, cursor=None):
+        """Published zines from the user and the creators they follow, newest first"""
+        raise NotImplementedError
+
+    def announce(self, zine, creator, link):
+        """Deliver a newly published zine to the creator's followers
+
+        Firestore pushes it into precomputed feeds; SQL notifies followers who opted in.
+        """
+
+
+class AnalyticsRepo:
+    def track_view(self, zine, user_id=None, session_id=None, referrer=None):
+        raise NotImplementedError
+
+    def track_read_time(self, zine_id, session_id, read_time, viewed_at=None):
+        """Add a session's read time to the view made at viewed_at; ignored for unknown zines"""
+        raise NotImplementedError
+
+    def stats(self, zine):
+        """(dashboard stats, {day: rollup}) for a zine"""
+        raise NotImplementedError
@@ -0,0 +1,180 @@
+"""
+Repositories over app.firestore_db
+
+Thin adapters: the document cache, batched reads and precomputed feeds stay in
+FirestoreDB. Cursors map onto Firestore start_after dicts.
+"""
+from datetime import datetime
+
+from app.analytics import ALL_TIME
+from app.pagination import encode_cursor, next_cursor, firestore_start_after
+from app.repos import Repos
+from app.repos.base import ZineRepo, PageRepo, UserRepo, FollowRepo, AnalyticsRepo
+from app.rollups import average_read_time, ROLLUP_WINDOW_DAYS
+
+
+def _resume_token(start_after, sort_field):
+    """Cursor token for a start_after dict returned by FirestoreDB, or None"""
+    return encode_cursor(start_after[sort_field], start_after['__name__']) if start_after else None
+
+
+class FirestoreZineRepo(ZineRepo):
+    def __init__(self, firestore_db):
+        self.db = firestore_db
+
+    def get(self, zine_id):
+        return self.db.get_zine_by_id(str(zine_id))
+
+    def get_by_slug(self, creator_id, slug):
+        return self.db.get_zine_by_slug(creator_id, slug)
+
+    def create(self, creator_id, title, slug, description='', status='draft'):
+        return self.db.create_zine(creator_id=creator_id, title=title, slug=slug,
+                                   description=description, status=status)
+
+    def update(self, zine_id, fields):
+        self.db.update_zine(zine_id, dict(fields))
+
+    def publish(self, zine_id, status, tags, qr_codes=None):
+        updates = {'status': status, 'published_at': datetime.utcnow(), 'tags': list(tags)}
+        if qr_codes:
+            updates['qr_codes'] = qr_codes
+        self.db.update_zine(zine_id, updates)
+
+    def set_qr_codes(self, zine_id, qr_codes):
+        self.db.set_zine_qr_codes(zine_id, qr_codes)
+
+    def by_creator(self, creator_id, status=None, limit=None, cursor=None):
+        zines = self.db.get_user_zines(creator_id, status=status, limit=limit,
+                                       start_after=firestore_start_after(cursor, 'created_at'))
+        return zines, next_cursor(zines, 'created_at', limit) if limit else None
+
+    def published(self, limit, cursor=None, category=None):
+        # Categories aren't in the Firestore schema yet, so category is ignored
+        zines = self.db.get_published_zines(limit=limit, start_after=firestore_start_after(cursor, 'published_at'))
+        return zines, next_cursor(zines, 'published_at', limit)
+
+    def popular(self, limit, cursor=None):
+        zines = self.db.get_popular_zines(limit=limit, start_after=firestore_start_after(cursor, 'views_count'))
+        return zines, next_cursor(zines, 'views_count', limit)
+
+    def search(self, text, limit, cursor=None):
+        # Bounded scan of published zines; the cursor resumes where the scan stopped
+        zines, resume_after = self.db.search_published_zines(
+            text, limit=limit, start_after=firestore_start_after(cursor, 'published_at'))
+        return zines, _resume_token(resume_after, 'published_at')
+
+
+class FirestorePageRepo(PageRepo):
+    def __init__(self, firestore_db):
+        self.db = firestore_db
+
+    def list(self, zine_id):
+        return self.db.get_zine_pages(str(zine_id))
+
+    def get(self, page_id):
+        return self.db.get_page_by_id(str(page_id))
+
+    def insert(self, zine_id, index=None, content=None, template='blank'):
+        return self.db.insert_page(zine_id, index, content=content, template=template)
+
+    def save_content(self, page_id, content, base_revision=None):
+        return self.db.save_page_content(page_id, content, base_revision)
+
+    def patch(self, page_id, base_revision, ops):
+        result = self.db.patch_page(page_id, base_revision, ops)
+        if result is None:
+            return None
+        revision, blocks = result
+        # Patched pages are stored block by block, so their content is just the blocks
+        return revision, {'blocks': blocks}
+
+    def move(self, zine_id, page_id, index):
+        return self.db.move_page(zine_id, page_id, index)
+
+    def delete(self, page_id):
+        self.db.delete_page(page_id)
+
+    def replace(self, zine_id, pages):
+        self.db.replace_pages(zine_id, pages)
+
+
+class FirestoreUserRepo(UserRepo):
+    def __init__(self, firestore_db):
+        self.db = firestore_db
+
+    def get(self, user_id):
+        return self.db.get_user_by_id(str(user_id))
+
+    def get_by_username(self, username):
+        return self.db.get_user_by_username(username)
+
+    def get_many(self, user_ids):
+        return {user['id']: user for user in self.db.get_users_by_ids([i for i in user_ids if i])}
+
+    def create(self, username, email, firebase_uid, **profile):
+        return self.db.create_user(username, email, firebase_uid, **profile)
+
+    def count_upload(self, user_id, size):
+        return self.db.count_upload(str(user_id), size)
+
+
+class FirestoreFollowRepo(FollowRepo):
+    def __init__(self, firestore_db):
+        self.db = firestore_db
+
+    def follow(self, follower_id, followed_id, zine_id=None):
+        self.db.follow_user(follower_id, followed_id, zine_id=zine_id)
+
+    def unfollow(self, follower_id, followed_id):
+        self.db.unfollow_user(follower_id, followed_id)
+
+    def is_following(self, follower_id, followed_id):
+        return self.db.is_following(follower_id, followed_id)
+
+    def feed(self, user_id, limit, cursor=None):
+        # Precomputed feed: one ordered, limited read (see FirestoreDB.get_home_feed)
+        zines, start_after = self.db.get_home_feed(
+            user_id, limit=limit, start_after=firestore_start_after(cursor, 'published_at'))
+        return zines, _resume_token(start_after, 'published_at')
+
+    def announce(self, zine, creator, link):
+        fanned_out = self.db.fan_out_zine(zine['id'])
+        print(f"Zine fanned out to {fanned_out} follower feeds")
+
+
+class FirestoreAnalyticsRepo(AnalyticsRepo):
+    def __init__(self, firestore_db):
+        self.db = firestore_db
+
+    def track_view(self, zine, user_id=None, session_id=None, referrer=None):
+        self.db.track_view(zine_id=zine['id'], user_id=user_id, session_id=session_id, referrer=referrer)
+
+    def track_read_time(self, zine_id, session_id, read_time, viewed_at=None):
+        self.db.track_read_time(str(zine_id), session_id, read_time, viewed_at=viewed_at)
+
+    def stats(self, zine):
+        zine_id = zine['id']
+        readers = self.db.get_unique_reader_counts(zine_id, windows=(7, ROLLUP_WINDOW_DAYS))
+        stats = {
+            'views': zine.get('views_count', 0),
+            'unique_readers': readers[ALL_TIME],
+            'unique_readers_7d': readers[7],
+            'unique_readers_30d': readers[ROLLUP_WINDOW_DAYS],
+            'avg_read_time': average_read_time(zine.get('read_time_total'), zine.get('read_time_count'))
+        }
+        return stats, self.db.get_analytics_rollups(zine_id)
+
+
+def firestore_repos():
+    from app.firestore_db import firestore_db
+
+    return Repos(
+        'firestore',
+        zines=FirestoreZineRepo(firestore_db),
+        pages=FirestorePageRepo(firestore_db),
+        users=FirestoreUserRepo(firestore_db),
+        follows=FirestoreFollowRepo(firestore_db),
+        analytics=FirestoreAnalyticsRepo(firestore_db),
+        versions=firestore_db.versions
+    )
@@ -0,0 +1,442 @@
+"""
+Repositories over plain dicts in this process
+
+Nothing is persisted and every process has its own data, so this backend is for load
+tests, profiling the request path without network storage, and local runs without
+Firestore. Documents have the same shape as on Firestore (string uuid ids, rank-ordered
+pages, HyperLogLog reader sketches, daily rollups).
+
+Users can't sign in against it: Flask-Login still loads users from Firestore or SQL, so
+the editor needs one of those. Read-only traffic (home, explore, profiles, zine views)
+works on seeded data.
+"""
+import copy
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from app.analytics import reader_key, sketch_periods, ALL_TIME
+from app.hll import HyperLogLog
+from app.names import next_free_name
+from app.page_order import place, sort_pages, spread_ranks
+from app.page_patch import apply_ops, RevisionConflict
+from app.pagination import next_cursor
+from app.repos import Repos
+from app.repos.base import ZineRepo, PageRepo, UserRepo, FollowRepo, AnalyticsRepo
+from app.rollups import (add_counts, average_read_time, fold_events, read_time_delta, rollup_day,
+                         window_days, ROLLUP_WINDOW_DAYS)
+from app.versions import MemoryVersionStore
+
+
+def _sort_key(value, item_id):
+    # None sorts lowest, like NULLs in a descending SQL listing
+    return (value is not None, value if value is not None else 0, str(item_id))
+
+
+def _page_of(items, field, limit, cursor):
+    """One keyset page of items ordered by field then id, highest first"""
+    items = sorted(items, key=lambda item: _sort_key(item.get(field), item['id']), reverse=True)
+    if cursor:
+        after = _sort_key(*cursor)
+        items = [item for item in items if _sort_key(item.get(field), item['id']) < after]
+    items = [dict(item) for item in (items[:limit] if limit else items)]
+    return items, next_cursor(items, field, limit) if limit else None
+
+
+class MemoryStore:
+    """The collections every memory repository shares"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.zines = {}
+        self.pages = {}
+        self.users = {}
+        self.follows = set()  # (follower_id, followed_id)
+        self.notifications = []
+        self.sketches = {}  # (zine_id, period) -> HyperLogLog
+        self.rollups = {}  # (zine_id, day) -> rollup
+        self.uploads = {}  # (user_id, day) -> (uploads, bytes)
+
+
+class MemoryZineRepo(ZineRepo):
+    def __init__(self, store):
+        self.store = store
+
+    def _published(self):
+        return [zine for zine in self.store.zines.values() if zine['status'] == 'published']
+
+    def get(self, zine_id):
+        zine = self.store.zines.get(str(zine_id))
+        return dict(zine) if zine else None
+
+    def get_by_slug(self, creator_id, slug):
+        for zine in self.store.zines.values():
+            if zine['creator_id'] == creator_id and zine['slug'] == slug:
+                return dict(zine)
+        return None
+
+    def create(self, creator_id, title, slug, description='', status='draft'):
+        now = datetime.utcnow()
+        with self.store.lock:
+            taken = {zine['slug'] for zine in self.store.zines.values() if zine['creator_id'] == creator_id}
+            zine = {
+                'id': str(uuid.uuid4()),
+                'creator_id': creator_id,
+                'title': title,
+                'slug': next_free_name(slug, taken, '-'),
+                'description': description,
+                'status': status,
+                'created_at': now,
+                'updated_at': now,
+                'published_at': now if status == 'published' else None,
+                'views_count': 0,
+                'likes_count': 0,
+                'unique_readers': 0,
+                'avg_read_time': 0,
+                'read_time_total': 0,
+                'read_time_count': 0,
+                'enable_pdf': False,
+                'format': 'A5'
+            }
+            self.store.zines[zine['id']] = zine
+        return dict(zine)
+
+    def update(self, zine_id, fields):
+        with self.store.lock:
+            self.store.zines[str(zine_id)].update(fields, updated_at=datetime.utcnow())
+
+    def publish(self, zine_id, status, tags, qr_codes=None):
+        updates = {'status': status, 'published_at': datetime.utcnow(), 'tags': list(tags)}
+        if qr_codes:
+            updates['qr_codes'] = qr_codes
+        self.update(zine_id, updates)
+
+    def set_qr_codes(self, zine_id, qr_codes):
+        with self.store.lock:
+            self.store.zines[str(zine_id)]['qr_codes'] = qr_codes
+
+    def by_creator(self, creator_id, status=None, limit=None, cursor=None):
+        zines = [zine for zine in self.store.zines.values()
+                 if zine['creator_id'] == creator_id and (not status or zine['status'] == status)]
+        return _page_of(zines, 'created_at', limit, cursor)
+
+    def published(self, limit, cursor=None, category=None):
+        zines = self._published()
+        if category:
+            zines = [zine for zine in zines if category in (zine.get('tags') or [])]
+        return _page_of(zines, 'published_at', limit, cursor)
+
+    def popular(self, limit, cursor=None):
+        return _page_of(self._published(), 'views_count', limit, cursor)
+
+    def search(self, text, limit, cursor=None):
+        text = text.lower()
+        zines = [zine for zine in self._published()
+                 if text in (zine.get('title') or '').lower() or text in (zine.get('description') or '').lower()]
+        return _page_of(zines, 'published_at', limit, cursor)
+
+    def categories(self):
+        names = sorted({tag for zine in self._published() for tag in zine.get('tags') or []})
+        return [{'name': name, 'category': name} for name in names]
+
+
+class MemoryPageRepo(PageRepo):
+    def __init__(self, store):
+        self.store = store
+
+    def _pages(self, zine_id):
+        return sort_pages([page for page in self.store.pages.values() if page['zine_id'] == zine_id])
+
+    def _set_ranks(self, respaced):
+        for page_id, rank in respaced.items():
+            self.store.pages[page_id]['rank'] = rank
+
+    def list(self, zine_id):
+        with self.store.lock:
+            return [dict(copy.deepcopy(page), order=position)
+                    for position, page in enumerate(self._pages(str(zine_id)))]
+
+    def get(self, page_id):
+        page = self.store.pages.get(str(page_id))
+        return copy.deepcopy(page) if page else None
+
+    def insert(self, zine_id, index=None, content=None, template='blank'):
+        now = datetime.utcnow()
+        with self.store.lock:
+            pages = self._pages(zine_id)
+            rank, respaced = place(pages, index)
+            self._set_ranks(respaced)
+            page = {
+                'id': str(uuid.uuid4()),
+                'zine_id': zine_id,
+                'rank': rank,
+                'content': copy.deepcopy(content) or {'blocks': []},
+                'template': template,
+                'revision': 0,
+                'created_at': now,
+                'updated_at': now
+            }
+            self.store.pages[page['id']] = page
+        return dict(copy.deepcopy(page), order=len(pages) if index is None else max(0, min(index, len(pages))))
+
+    def save_content(self, page_id, content, base_revision=None):
+        with self.store.lock:
+            page = self.store.pages.get(str(page_id))
+            if page is None:
+                return None
+            if base_revision is not None and page.get('revision', 0) != base_revision:
+                raise RevisionConflict(page.get('revision', 0))
+            page.update(content=copy.deepcopy(content), revision=page.get('revision', 0) + 1,
+                        updated_at=datetime.utcnow())
+            return page['revision']
+
+    def patch(self, page_id, base_revision, ops):
+        with self.store.lock:
+            page = self.store.pages.get(str(page_id))
+            if page is None:
+                return None
+            if page.get('revision', 0) != base_revision:
+                raise RevisionConflict(page.get('revision', 0))
+
+            blocks, _ = apply_ops(copy.deepcopy((page.get('content') or {}).get('blocks')), ops)
+            page.update(content=dict(page.get('content') or {}, blocks=blocks), revision=base_revision + 1,
+                        updated_at=datetime.utcnow())
+            return page['revision'], copy.deepcopy(page['content'])
+
+    def move(self, zine_id, page_id, index):
+        with self.store.lock:
+            pages = self._pages(zine_id)
+            if not any(page['id'] == page_id for page in pages):
+                return None
+            rank, respaced = place(pages, index, moving_id=page_id)
+            respaced[page_id] = rank
+            self._set_ranks(respaced)
+            return max(0, min(index, len(pages) - 1))
+
+    def delete(self, page_id):
+        with self.store.lock:
+            self.store.pages.pop(str(page_id), None)
+
+    def replace(self, zine_id, pages):
+        now = datetime.utcnow()
+        with self.store.lock:
+            existing = {page['id']: page for page in self._pages(zine_id)}
+            pages = sorted(pages, key=lambda page: page.get('order', 0))
+            for rank, page in zip(spread_ranks(len(pages)), pages):
+                old = existing.pop(str(page.get('id')), None)
+                page_id = old['id'] if old else str(uuid.uuid4())
+                self.store.pages[page_id] = {
+                    'id': page_id,
+                    'zine_id': zine_id,
+                    'rank': rank,
+                    'content': copy.deepcopy(page.get('content')) or {'blocks': []},
+                    'template': page.get('template') or 'blank',
+                    'revision': (old or {}).get('revision', 0) + 1,
+                    'created_at': (old or {}).get('created_at', now),
+                    'updated_at': now
+                }
+            for page_id in existing:
+                del self.store.pages[page_id]
+
+
+class MemoryUserRepo(UserRepo):
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, user_id):
+        user = self.store.users.get(str(user_id))
+        return dict(user) if user else None
+
+    def get_by_username(self, username):
+        for user in self.store.users.values():
+            if user['username'] == username:
+                return dict(user)
+        return None
+
+    def get_many(self, user_ids):
+        return {user_id: dict(self.store.users[user_id]) for user_id in user_ids if user_id in self.store.users}
+
+    def create(self, username, email, firebase_uid, **profile):
+        with self.store.lock:
+            user = {
+                'id': str(uuid.uuid4()),
+                'username': next_free_name(username, {u['username'] for u in self.store.users.values()}),
+                'email': email,
+                'firebase_uid': firebase_uid,
+                'created_at': datetime.utcnow(),
+                'bio': '',
+                'avatar_url': None,
+                'followers_count': 0,
+                'following_count': 0,
+                'email_notifications': True
+            }
+            user.update(profile)
+            self.store.users[user['id']] = user
+        return dict(user)
+
+    def search(self, text, limit=20):
+        text = text.lower()
+        return [dict(user) for user in self.store.users.values()
+                if text in user['username'].lower() or text in (user.get('bio') or '').lower()][:limit]
+
+    def notifications(self, user_id, limit=50):
+        with self.store.lock:
+            mine = [n for n in self.store.notifications if n['user_id'] == user_id]
+            newest = sorted(mine, key=lambda n: n['created_at'], reverse=True)[:limit]
+            result = [dict(n) for n in newest]
+            for notification in mine:
+                notification['read'] = True
+        return result
+
+    def notify(self, user_id, kind, title, message, link=None):
+        with self.store.lock:
+            self.store.notifications.append({
+                'id': str(uuid.uuid4()),
+                'user_id': user_id,
+                'type': kind,
+                'title': title,
+                'message': message,
+                'link': link,
+                'read': False,
+                'created_at': datetime.utcnow()
+            })
+
+    def count_upload(self, user_id, size):
+        key = (user_id, rollup_day(datetime.utcnow()))
+        with self.store.lock:
+            uploads, total = self.store.uploads.get(key, (0, 0))
+            self.store.uploads[key] = (uploads + 1, total + size)
+            return self.store.uploads[key]
+
+
+class MemoryFollowRepo(FollowRepo):
+    def __init__(self, store):
+        self.store = store
+
+    def _adjust(self, follower_id, followed_id, step):
+        self.store.users[follower_id]['following_count'] += step
+        self.store.users[followed_id]['followers_count'] += step
+
+    def follow(self, follower_id, followed_id, zine_id=None):
+        with self.store.lock:
+            if (follower_id, followed_id) not in self.store.follows:
+                self.store.follows.add((follower_id, followed_id))
+                self._adjust(follower_id, followed_id, 1)
+                if zine_id:
+                    event = {'zine_id': zine_id, 'event_type': 'follow', 'created_at': datetime.utcnow()}
+                    for (_, day), delta in fold_events([event]).items():
+                        add_counts(self.store.rollups.setdefault((zine_id, day), {}), delta)
+
+    def unfollow(self, follower_id, followed_id):
+        with self.store.lock:
+            if (follower_id, followed_id) in self.store.follows:
+                self.store.follows.discard((follower_id, followed_id))
+                self._adjust(follower_id, followed_id, -1)
+
+    def is_following(self, follower_id, followed_id):
+        return (follower_id, followed_id) in self.store.follows
+
+    def feed(self, user_id, limit, cursor=None):
+        creators = {followed for follower, followed in self.store.follows if follower == user_id} | {user_id}
+        zines = [zine for zine in self.store.zines.values()
+                 if zine['status'] == 'published' and zine['creator_id'] in creators]
+        return _page_of(zines, 'published_at', limit, cursor)
+
+
+class MemoryAnalyticsRepo(AnalyticsRepo):
+    def __init__(self, store):
+        self.store = store
+
+    def _rollup(self, zine_id, day, delta):
+        add_counts(self.store.rollups.setdefault((zine_id, day), {}), delta)
+
+    def _sketch(self, zine_id, period):
+        return self.store.sketches.setdefault((zine_id, period), HyperLogLog())
+
+    def track_view(self, zine, user_id=None, session_id=None, referrer=None):
+        zine_id = zine['id']
+        view = {'zine_id': zine_id, 'referrer': referrer, 'created_at': datetime.utcnow()}
+        with self.store.lock:
+            stored = self.store.zines.get(zine_id)
+            if stored is None:
+                return
+            stored['views_count'] = stored.get('views_count', 0) + 1
+            reader = reader_key(user_id, session_id)
+            if reader:
+                for period in sketch_periods(view['created_at']):
+                    self._sketch(zine_id, period).add(reader)
+                stored['unique_readers'] = self._sketch(zine_id, ALL_TIME).count()
+            for (_, day), delta in fold_events([view]).items():
+                self._rollup(zine_id, day, delta)
+
+    def track_read_time(self, zine_id, session_id, read_time, viewed_at=None):
+        with self.store.lock:
+            zine = self.store.zines.get(str(zine_id))
+            if zine is None:
+                return
+            zine['read_time_total'] = zine.get('read_time_total', 0) + read_time
+            zine['read_time_count'] = zine.get('read_time_count', 0) + 1
+            zine['avg_read_time'] = zine['read_time_total'] / zine['read_time_count']
+            self._rollup(zine['id'], rollup_day(viewed_at or datetime.utcnow()), read_time_delta(read_time))
+
+    def _unique_readers(self, zine_id, days):
+        merged = HyperLogLog()
+        for day in window_days(days):
+            sketch = self.store.sketches.get((zine_id, day))
+            if sketch:
+                merged.merge(sketch)
+        return merged.count()
+
+    def stats(self, zine):
+        zine_id = zine['id']
+        with self.store.lock:
+            stats = {
+                'views': zine.get('views_count', 0),
+                'unique_readers': zine.get('unique_readers', 0),
+                'unique_readers_7d': self._unique_readers(zine_id, 7),
+                'unique_readers_30d': self._unique_readers(zine_id, ROLLUP_WINDOW_DAYS),
+                'avg_read_time': average_read_time(zine.get('read_time_total'), zine.get('read_time_count'))
+            }
+            rollups = {day: dict(self.store.rollups[(zine_id, day)])
+                       for day in window_days() if (zine_id, day) in self.store.rollups}
+        return stats, rollups
+
+
+class MemoryRepos(Repos):
+    def seed(self, creators=10, zines_per_creator=5, pages_per_zine=8):
+        """Fill the store with published sample zines; returns the number of zines created"""
+        started = datetime.utcnow()
+        for c in range(creators):
+            creator = self.users.create(f'creator{c}', f'creator{c}@example.com', None,
+                                        bio=f'Sample creator {c}')
+            for z in range(zines_per_creator):
+                zine = self.zines.create(creator['id'], f'Sample zine {c}-{z}', f'sample-zine-{z}',
+                                         description=f'Sample zine {z} by creator{c}', status='published')
+                # Spread publish times so listings have a stable, realistic order
+                self.zines.update(zine['id'], {
+                    'published_at': started - timedelta(minutes=c * zines_per_creator + z),
+                    'views_count': (c * 7 + z * 13) % 100
+                })
+                for p in range(pages_per_zine):
+                    self.pages.insert(zine['id'], content={'blocks': [
+                        {'id': f'b{p}', 'type': 'text', 'content': f'Page {p + 1} of sample zine {c}-{z}'}
+                    ]})
+        return creators * zines_per_creator
+
+
+def memory_repos(seed_spec=''):
+    """In-memory repositories, seeded from "creators,zines,pages" if given"""
+    store = MemoryStore()
+    repos = MemoryRepos(
+        'memory',
+        zines=MemoryZineRepo(store),
+        pages=MemoryPageRepo(store),
+        users=MemoryUserRepo(store),
+        follows=MemoryFollowRepo(store),
+        analytics=MemoryAnalyticsRepo(store),
+        versions=MemoryVersionStore()
+    )
+    if seed_spec:
+        counts = [int(n) for n in seed_spec.split(',')]
+        print(f"Seeded {repos.seed(*counts)} in-memory zines")
+    return repos
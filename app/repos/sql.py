@@ -0,0 +1,352 @@
+"""
+Repositories over the SQLAlchemy models
+
+Rows are returned as dicts of their columns. Writes join the request's session and are
+committed by SQLRepos.commit(), so a save, its version record and the zine's updated_at
+land in one transaction. Creating a zine or user commits immediately, since claiming a
+unique name relies on the insert succeeding (see app.names).
+"""
+from datetime import datetime
+
+from sqlalchemy import func, or_
+
+from app import db
+from app.analytics import reader_key
+from app.counters import sql_counters
+from app.models import (User, Zine, Page, Tag, Notification, ReaderSketch, Analytics, AnalyticsRollup,
+                        UploadTally)
+from app.names import claim_sql_name
+from app.page_order import place, sort_pages, spread_ranks
+from app.page_patch import apply_ops, RevisionConflict
+from app.pagination import keyset_filter, next_cursor
+from app.repos import Repos
+from app.repos.base import ZineRepo, PageRepo, UserRepo, FollowRepo, AnalyticsRepo
+from app.rollups import fold_events, rollup_day, ROLLUP_WINDOW_DAYS
+from app.versions import sql_versions
+
+
+def _int_id(value):
+    """Integer primary key from a route argument, or None if it can't be one"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _user_row(user_id):
+    user_id = _int_id(user_id)
+    return User.query.get(user_id) if user_id is not None else None
+
+
+def _row_dict(row):
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns} if row else None
+
+
+def _zine_dict(row):
+    zine = _row_dict(row)
+    if zine:
+        zine['format'] = zine.get('layout_type')
+    return zine
+
+
+def _listing(query, column, field, limit, cursor):
+    """One keyset page of zines ordered by column, newest/highest first"""
+    query = keyset_filter(query, column, Zine.id, cursor)
+    zines = [_zine_dict(row) for row in query.order_by(column.desc(), Zine.id.desc()).limit(limit).all()]
+    return zines, next_cursor(zines, field, limit) if limit else None
+
+
+class SQLZineRepo(ZineRepo):
+    def _row(self, zine_id):
+        zine_id = _int_id(zine_id)
+        return Zine.query.get(zine_id) if zine_id is not None else None
+
+    def get(self, zine_id):
+        return _zine_dict(self._row(zine_id))
+
+    def get_by_slug(self, creator_id, slug):
+        return _zine_dict(Zine.query.filter_by(creator_id=creator_id, slug=slug).first())
+
+    def create(self, creator_id, title, slug, description='', status='draft'):
+        return _zine_dict(claim_sql_name(Zine.slug, slug, lambda slug: Zine(
+            creator_id=creator_id,
+            title=title,
+            slug=slug,
+            description=description,
+            status=status
+        ), separator='-', filters=[Zine.creator_id == creator_id]))
+
+    def update(self, zine_id, fields):
+        row = self._row(zine_id)
+        for field, value in fields.items():
+            setattr(row, field, value)
+        row.updated_at = datetime.utcnow()
+
+    def publish(self, zine_id, status, tags, qr_codes=None):
+        # QR codes aren't stored on SQL; they are regenerated from the blob store's copy
+        row = self._row(zine_id)
+        row.status = status
+        row.published_at = datetime.utcnow()
+        row.updated_at = datetime.utcnow()
+        row.tags = []
+        for tag_name in tags:
+            tag = Tag.query.filter_by(name=tag_name).first()
+            if not tag:
+                tag = Tag(name=tag_name)
+                db.session.add(tag)
+            row.tags.append(tag)
+
+    def by_creator(self, creator_id, status=None, limit=None, cursor=None):
+        query = Zine.query.filter_by(creator_id=creator_id)
+        if status:
+            query = query.filter_by(status=status)
+        if status == 'published':
+            return _listing(query, Zine.published_at, 'published_at', limit, cursor)
+        return _listing(query, Zine.created_at, 'created_at', limit, cursor)
+
+    def published(self, limit, cursor=None, category=None):
+        query = Zine.query.filter_by(status='published')
+        if category:
+            tag = Tag.query.filter_by(name=category).first()
+            if tag:
+                query = query.filter(Zine.tags.contains(tag))
+        return _listing(query, Zine.published_at, 'published_at', limit, cursor)
+
+    def popular(self, limit, cursor=None):
+        return _listing(Zine.query.filter_by(status='published'), Zine.views_count, 'views_count', limit, cursor)
+
+    def search(self, text, limit, cursor=None):
+        query = Zine.query.filter(
+            Zine.status == 'published',
+            or_(Zine.title.contains(text), Zine.description.contains(text))
+        )
+        return _listing(query, Zine.published_at, 'published_at', limit, cursor)
+
+    def categories(self):
+        return [_row_dict(tag) for tag in Tag.query.distinct(Tag.category).all()]
+
+
+class SQLPageRepo(PageRepo):
+    def _rows(self, zine_id):
+        db.session.flush()
+        return sort_pages(Page.query.filter_by(zine_id=zine_id).all())
+
+    def _row(self, page_id):
+        page_id = _int_id(page_id)
+        return Page.query.get(page_id) if page_id is not None else None
+
+    def _place(self, zine_id, index=None, moving=None):
+        """Rank for a page at index, respacing the zine's other rows if needed"""
+        rows = self._rows(zine_id)
+        rank, respaced = place(rows, index, moving_id=moving.id if moving else None)
+        for row in rows:
+            if row.id in respaced:
+                row.rank = respaced[row.id]
+        return rank, len(rows)
+
+    def list(self, zine_id):
+        return [dict(_row_dict(row), order=position) for position, row in enumerate(self._rows(zine_id))]
+
+    def get(self, page_id):
+        return _row_dict(self._row(page_id))
+
+    def insert(self, zine_id, index=None, content=None, template='blank'):
+        rank, count = self._place(zine_id, index)
+        row = Page(zine_id=zine_id, order=count, rank=rank, content=content or {'blocks': []},
+                   template=template, revision=0)
+        db.session.add(row)
+        db.session.flush()
+        position = [page.id for page in self._rows(zine_id)].index(row.id)
+        return dict(_row_dict(row), order=position)
+
+    def save_content(self, page_id, content, base_revision=None):
+        page_id = _int_id(page_id)
+        row = Page.query.filter_by(id=page_id).with_for_update().first() if page_id is not None else None
+        if row is None:
+            return None
+        if base_revision is not None and (row.revision or 0) != base_revision:
+            raise RevisionConflict(row.revision or 0)
+        row.content = content
+        row.revision = (row.revision or 0) + 1
+        row.updated_at = datetime.utcnow()
+        return row.revision
+
+    def patch(self, page_id, base_revision, ops):
+        page_id = _int_id(page_id)
+        row = Page.query.filter_by(id=page_id).with_for_update().first() if page_id is not None else None
+        if row is None:
+            return None
+        if (row.revision or 0) != base_revision:
+            raise RevisionConflict(row.revision or 0)
+
+        blocks, _ = apply_ops((row.content or {}).get('blocks'), ops)
+        row.content = dict(row.content or {}, blocks=blocks)
+        row.revision = base_revision + 1
+        row.updated_at = datetime.utcnow()
+        return row.revision, row.content
+
+    def move(self, zine_id, page_id, index):
+        row = self._row(page_id)
+        if row is None or row.zine_id != zine_id:
+            return None
+        row.rank, count = self._place(zine_id, index, moving=row)
+        return min(index, count - 1)
+
+    def delete(self, page_id):
+        row = self._row(page_id)
+        if row is not None:
+            db.session.delete(row)
+
+    def replace(self, zine_id, pages):
+        existing = {str(row.id): row for row in Page.query.filter_by(zine_id=zine_id)}
+        pages = sorted(pages, key=lambda page: page.get('order', 0))
+        for position, (rank, page) in enumerate(zip(spread_ranks(len(pages)), pages)):
+            row = existing.pop(str(page.get('id')), None)
+            if row is None:
+                row = Page(zine_id=zine_id)
+                db.session.add(row)
+            row.order = position
+            row.rank = rank
+            row.content = page.get('content') or {'blocks': []}
+            row.template = page.get('template') or 'blank'
+            row.revision = (row.revision or 0) + 1
+        for row in existing.values():
+            db.session.delete(row)
+
+
+class SQLUserRepo(UserRepo):
+    def get(self, user_id):
+        return _row_dict(_user_row(user_id))
+
+    def get_by_username(self, username):
+        return _row_dict(User.query.filter_by(username=username).first())
+
+    def get_many(self, user_ids):
+        ids = [user_id for user_id in map(_int_id, user_ids) if user_id is not None]
+        return {row.id: _row_dict(row) for row in User.query.filter(User.id.in_(ids))} if ids else {}
+
+    def create(self, username, email, firebase_uid, **profile):
+        return _row_dict(claim_sql_name(User.username, username, lambda name: User(
+            username=name, email=email, firebase_uid=firebase_uid, **profile
+        )))
+
+    def search(self, text, limit=20):
+        rows = User.query.filter(or_(User.username.contains(text), User.bio.contains(text))).limit(limit)
+        return [_row_dict(row) for row in rows]
+
+    def notifications(self, user_id, limit=50):
+        rows = Notification.query.filter_by(user_id=user_id)\
+            .order_by(Notification.created_at.desc()).limit(limit).all()
+        Notification.query.filter_by(user_id=user_id, read=False).update({'read': True})
+        return [_row_dict(row) for row in rows]
+
+    def notify(self, user_id, kind, title, message, link=None):
+        db.session.add(Notification(user_id=user_id, type=kind, title=title, message=message, link=link))
+
+    def count_upload(self, user_id, size):
+        return UploadTally.add(_int_id(user_id), rollup_day(datetime.utcnow()), size)
+
+
+class SQLFollowRepo(FollowRepo):
+    def _pair(self, follower_id, followed_id):
+        return _user_row(follower_id), _user_row(followed_id)
+
+    def follow(self, follower_id, followed_id, zine_id=None):
+        follower, followed = self._pair(follower_id, followed_id)
+        if follower.is_following(followed):
+            return
+        follower.follow(followed)
+        if zine_id:
+            _record_event(zine_id=_int_id(zine_id), user_id=follower.id, event_type='follow')
+
+    def unfollow(self, follower_id, followed_id):
+        follower, followed = self._pair(follower_id, followed_id)
+        follower.unfollow(followed)
+
+    def is_following(self, follower_id, followed_id):
+        follower, followed = self._pair(follower_id, followed_id)
+        return bool(follower and followed and follower.is_following(followed))
+
+    def feed(self, user_id, limit, cursor=None):
+        query = keyset_filter(_user_row(user_id).get_feed(), Zine.published_at, Zine.id, cursor)
+        zines = [_zine_dict(row) for row in query.order_by(Zine.id.desc()).limit(limit).all()]
+        return zines, next_cursor(zines, 'published_at', limit)
+
+    def announce(self, zine, creator, link):
+        for follower in _user_row(creator['id']).followers.all():
+            if follower.email_notifications:
+                db.session.add(Notification(
+                    user_id=follower.id,
+                    type='new_issue',
+                    title='New zine published',
+                    message=f"{creator['username']} published \"{zine['title']}\"",
+                    link=link
+                ))
+
+
+def _record_event(**event):
+    """Store a raw analytics event and fold it into its zine's daily rollup (caller commits)"""
+    event.setdefault('created_at', datetime.utcnow())
+    db.session.add(Analytics(**event))
+    for (zine_id, day), delta in fold_events([event]).items():
+        AnalyticsRollup.add(zine_id, day, delta)
+
+
+class SQLAnalyticsRepo(AnalyticsRepo):
+    def track_view(self, zine, user_id=None, session_id=None, referrer=None):
+        zine_id = zine['id']
+        sql_counters.increment(Zine, zine_id, 'views_count', commit=False)
+        unique_readers = ReaderSketch.add_reader(zine_id, reader_key(user_id, session_id))
+        Zine.query.filter_by(id=zine_id).update(
+            {Zine.unique_readers: unique_readers, Zine.updated_at: Zine.updated_at},
+            synchronize_session=False
+        )
+        _record_event(zine_id=zine_id, user_id=_int_id(user_id), session_id=session_id, event_type='view',
+                      referrer=referrer[:255] if referrer else None)
+
+    def track_read_time(self, zine_id, session_id, read_time, viewed_at=None):
+        zine_id = _int_id(zine_id)
+        if zine_id is None or not Zine.query.filter_by(id=zine_id).count():
+            return
+        # Running average from sum + count in one atomic UPDATE; SET sees the old values
+        total = func.coalesce(Zine.read_time_total, 0)
+        count = func.coalesce(Zine.read_time_count, 0)
+        Zine.query.filter_by(id=zine_id).update({
+            Zine.read_time_total: total + read_time,
+            Zine.read_time_count: count + 1,
+            Zine.avg_read_time: (total + read_time) / (count + 1),
+            Zine.updated_at: Zine.updated_at
+        }, synchronize_session=False)
+        _record_event(zine_id=zine_id, session_id=session_id, event_type='read', read_time=read_time,
+                      created_at=viewed_at or datetime.utcnow())
+
+    def stats(self, zine):
+        zine_id = zine['id']
+        stats = {
+            'views': zine.get('views_count'),
+            'unique_readers': zine.get('unique_readers'),
+            'unique_readers_7d': ReaderSketch.merged(zine_id, days=7).count(),
+            'unique_readers_30d': ReaderSketch.merged(zine_id, days=ROLLUP_WINDOW_DAYS).count(),
+            'avg_read_time': round(zine['avg_read_time'], 1) if zine.get('avg_read_time') else 0
+        }
+        return stats, AnalyticsRollup.window(zine_id)
+
+
+class SQLRepos(Repos):
+    def commit(self):
+        db.session.commit()
+
+    def rollback(self):
+        db.session.rollback()
+
+
+def sql_repos():
+    return SQLRepos(
+        'sql',
+        zines=SQLZineRepo(),
+        pages=SQLPageRepo(),
+        users=SQLUserRepo(),
+        follows=SQLFollowRepo(),
+        analytics=SQLAnalyticsRepo(),
+        versions=sql_versions
+    )
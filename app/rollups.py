@@ -0,0 +1,119 @@
+"""
+Pre-aggregated analytics rollups
+
+Raw analytics events are folded into one rollup per zine per day as they are written
+(views with an hourly breakdown, referrer hosts, a read-time histogram and follows), so
+the creator dashboard reads at most ROLLUP_WINDOW_DAYS small rollups instead of grouping
+raw events. Once an event has been folded in it is only kept for
+ANALYTICS_RETENTION_DAYS, after which `flask expire-analytics` deletes it.
+
+Rollups are plain nested dicts of counts: deltas from a batch of events are added onto the
+stored rollup (Increment transforms on Firestore, a merged JSON row on SQL).
+"""
+import os
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+ROLLUP_WINDOW_DAYS = 30
+
+ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', 90))
+
+# Lower bounds, in seconds, of the read-time histogram buckets
+READ_TIME_BUCKETS = (0, 10, 30, 60, 120, 300, 600)
+
+TOP_REFERRERS = 5
+
+# Longer reports are clamped; nobody reads one zine for more than a few hours
+MAX_READ_TIME = 4 * 3600
+
+
+def rollup_day(when):
+    return when.strftime('%Y-%m-%d')
+
+
+def window_days(days=ROLLUP_WINDOW_DAYS, today=None):
+    """Day keys for the last `days` days, newest first"""
+    today = today or datetime.utcnow().date()
+    return [rollup_day(today - timedelta(days=n)) for n in range(days)]
+
+
+def referrer_host(referrer):
+    """Referrers are grouped by host so the referrer map stays small"""
+    if not referrer:
+        return 'Direct'
+    return urlparse(referrer).netloc or referrer[:100]
+
+
+def read_time_bucket(seconds):
+    return str(max(bound for bound in READ_TIME_BUCKETS if bound <= max(0, seconds)))
+
+
+def average_read_time(total, count):
+    return round((total or 0) / count, 1) if count else 0
+
+
+def add_counts(target, delta):
+    """Add a nested dict of counts onto target in place"""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            add_counts(target.setdefault(key, {}), value)
+        else:
+            target[key] = (target.get(key) or 0) + value
+    return target
+
+
+def fold_events(events):
+    """{(zine_id, day): rollup delta} for a batch of view/follow/read events
+
+    A read event (SQL stores read times as their own rows) only adds its read_time.
+    """
+    deltas = {}
+    for event in events:
+        created_at = event['created_at']
+        delta = deltas.setdefault((event['zine_id'], rollup_day(created_at)), {})
+        if event.get('event_type', 'view') == 'view':
+            # A stored event covers every view by its session that day
+            views = event.get('views') or 1
+            add_counts(delta, {
+                'views': views,
+                'hours': {f'{created_at.hour:02d}': views},
+                'referrers': {referrer_host(event.get('referrer')): views}
+            })
+        elif event['event_type'] == 'follow':
+            add_counts(delta, {'follows': 1})
+        if event.get('read_time'):
+            add_counts(delta, read_time_delta(event['read_time']))
+    return deltas
+
+
+def read_time_delta(seconds):
+    """Rollup delta for one reported read time"""
+    return {
+        'read_time_total': seconds,
+        'read_time_count': 1,
+        'read_time_hist': {read_time_bucket(seconds): 1}
+    }
+
+
+def summarize(rollups, days=ROLLUP_WINDOW_DAYS):
+    """Dashboard payload from {day: rollup} covering the last `days` days"""
+    totals = {}
+    for rollup in rollups.values():
+        add_counts(totals, {key: value for key, value in rollup.items() if key not in ('zine_id', 'date')})
+
+    referrers = sorted(totals.get('referrers', {}).items(), key=lambda item: -item[1])
+    return {
+        'views_window': totals.get('views', 0),
+        'avg_read_time_window': average_read_time(totals.get('read_time_total'), totals.get('read_time_count')),
+        'followers_gained': totals.get('follows', 0),
+        'daily_views': [
+            {'date': day, 'views': rollups[day].get('views', 0)}
+            for day in reversed(window_days(days)) if day in rollups
+        ],
+        'hourly_views': [totals.get('hours', {}).get(f'{hour:02d}', 0) for hour in range(24)],
+        'read_time_histogram': [
+            {'seconds': bound, 'count': totals.get('read_time_hist', {}).get(str(bound), 0)}
+            for bound in READ_TIME_BUCKETS
+        ],
+        'top_referrers': [{'referrer': host, 'count': count} for host, count in referrers[:TOP_REFERRERS]]
+    }
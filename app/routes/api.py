@@ -1,27 +1,61 @@
 from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
-from app.models import Zine, Analytics, User
-from app import db
-from datetime import datetime, timedelta
-from sqlalchemy import func
+import hmac
 import os
 from werkzeug.utils import secure_filename
-from PIL import Image
 import uuid
+from app.blob_store import get_blob_store
+from app.image_jobs import image_jobs, QueueFull
+from app.http_cache import make_etag, not_modified, add_validators
+from app.rollups import summarize
+from app.repos import get_repos
+from io import BytesIO
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# Every upload stores its derivatives permanently, so each user gets a daily allowance
+UPLOAD_DAILY_LIMIT = int(os.getenv('UPLOAD_DAILY_LIMIT', 200))
+UPLOAD_DAILY_BYTES = int(os.getenv('UPLOAD_DAILY_MB', 500)) * 1024 * 1024
 UPLOAD_FOLDER = 'static/uploads'
+TEMPLATES_CACHE_CONTROL = 'public, max-age=3600, stale-while-revalidate=86400'
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def job_response(job):
+    """Status payload for an upload job; includes the image fields once it is done"""
+    response = {
+        'success': job['status'] != 'error',
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'status_url': f"/api/upload/{job['id']}"
+    }
+    if job['status'] == 'done':
+        response.update(image_fields(job['result']))
+    elif job['status'] == 'error':
+        response['error'] = 'Failed to process image'
+    return response
+
+def image_fields(manifest):
+    """Fields the editor stores on an image block"""
+    return {
+        'url': manifest['src'],
+        'thumbnail': manifest['thumbnail'],
+        'srcset': manifest['srcset'],
+        'srcset_webp': manifest['srcset_webp'],
+        'manifest': manifest['manifest'],
+        'width': manifest['width'],
+        'height': manifest['height']
+    }
+
 @bp.route('/upload-test', methods=['GET'])
 def upload_test():
     """Test endpoint to verify data URL generation"""
     import base64
     from io import BytesIO
+    from PIL import Image
 
     # Create a simple 1x1 red pixel image
     img = Image.new('RGB', (1, 1), color='red')
@@ -38,6 +72,7 @@ def upload_test():
     })
 
 @bp.route('/upload', methods=['POST'])
+@login_required
 def upload_image():
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -55,117 +90,78 @@ def upload_image():
         if file_size > 10 * 1024 * 1024:  # 10MB limit
             return jsonify({'error': 'File too large. Maximum size is 10MB'}), 400
 
-        # For Vercel/serverless, we'll use base64 encoding
-        # or external image URLs instead of local file storage
-        import base64
-        from io import BytesIO
+        from PIL import Image
 
+        # Images are stored in the content-addressed blob store and referenced by URL,
+        # keeping page JSON small. Several widths are generated in WebP and JPEG/PNG so
+        # viewers can serve a srcset and each device downloads only what it needs.
+        data = file.read()
         try:
-            # Read the file into memory
-            img = Image.open(file)
+            Image.open(BytesIO(data)).verify()
         except Exception as e:
             return jsonify({'error': f'Invalid image file: {str(e)}'}), 400
 
-        # Convert RGBA to RGB if necessary (for JPEG compatibility)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Create a white background
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-
-        # More aggressive resizing for better performance
-        # Max dimension of 800px for zine pages (mobile-optimized)
-        if img.width > 800 or img.height > 800:
-            img.thumbnail((800, 800), Image.Resampling.LANCZOS)
-
-        # Convert to base64 with progressive compression
-        buffered = BytesIO()
-
-        # Always use JPEG for photos to reduce size (except for logos/graphics)
-        # Check if image has lots of uniform colors (likely a graphic/logo)
-        is_graphic = len(img.getcolors(maxcolors=256) or []) < 256 if img.mode == 'RGB' else False
-
-        # Determine final format
-        final_format = 'PNG' if (is_graphic and file.filename.lower().endswith('.png')) else 'JPEG'
-
-        if final_format == 'PNG':
-            # Keep PNG for graphics/logos
-            img.save(buffered, format='PNG', optimize=True, compress_level=9)
-        else:
-            # Use JPEG with lower quality for photos
-            img.save(buffered, format='JPEG', optimize=True, quality=75, progressive=True)
-
-        # Check final size and reduce quality if still too large
-        if buffered.tell() > 200000:  # If over 200KB, force JPEG with lower quality
-            buffered = BytesIO()
-            img.save(buffered, format='JPEG', optimize=True, quality=60, progressive=True)
-            final_format = 'JPEG'  # Update format since we forced JPEG
-
-        # Get the base64 string
-        buffered.seek(0)  # Reset buffer position
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-
-        # Set correct mime type based on actual format used
-        mime_type = "image/png" if final_format == 'PNG' else "image/jpeg"
-
-        data_url = f"data:{mime_type};base64,{img_str}"
-
-        # Log info for debugging
-        print(f"Image upload: Original size: {file_size/1024:.1f}KB, "
-              f"Final size: {len(img_str)*3/4/1024:.1f}KB, "
-              f"Format: {final_format}, Dimensions: {img.width}x{img.height}")
-
-        return jsonify({
-            'success': True,
-            'url': data_url,
-            'thumbnail': data_url  # For now, same as main image
-        })
+        repos = get_repos()
+        uploads, uploaded_bytes = repos.users.count_upload(current_user.id, file_size)
+        repos.commit()
+        if uploads > UPLOAD_DAILY_LIMIT or uploaded_bytes > UPLOAD_DAILY_BYTES:
+            return jsonify({'error': 'Daily upload limit reached, please try again tomorrow'}), 429
+
+        # Encoding runs in the image job pool; the client polls the status URL for the result
+        try:
+            job = image_jobs.submit(data, file.filename, get_blob_store(), owner_id=current_user.id)
+        except QueueFull:
+            response = jsonify({'error': 'Image processing is busy, please try again shortly'})
+            response.headers['Retry-After'] = '2'
+            return response, 503
+        except Exception as e:
+            print(f"Error queueing uploaded image: {e}")
+            return jsonify({'error': 'Failed to process image'}), 500
+
+        print(f"Image upload: Original size: {file_size/1024:.1f}KB, Job: {job['id']} ({job['status']})")
+
+        status_code = {'done': 200, 'error': 500}.get(job['status'], 202)
+        return jsonify(job_response(job)), status_code
 
     return jsonify({'error': 'Invalid file type'}), 400
 
-@bp.route('/analytics/<int:zine_id>')
+@bp.route('/upload/<job_id>')
+def upload_status(job_id):
+    """Progress and, once finished, the stored image for an upload job"""
+    job = image_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired upload job'}), 404
+    if job['owner_id'] and (not current_user.is_authenticated or current_user.id != job['owner_id']):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(job_response(job))
+
+@bp.route('/analytics/<zine_id>')
 @login_required
 def get_analytics(zine_id):
-    zine = Zine.query.get_or_404(zine_id)
-    if zine.creator_id != current_user.id:
+    """Creator dashboard stats, read from daily rollups and reader sketches"""
+    repos = get_repos()
+    zine = repos.zines.get(zine_id)
+    if not zine:
+        return jsonify({'error': 'Zine not found'}), 404
+    if zine['creator_id'] != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30)
-
-    daily_views = db.session.query(
-        func.date(Analytics.created_at).label('date'),
-        func.count(Analytics.id).label('views')
-    ).filter(
-        Analytics.zine_id == zine_id,
-        Analytics.event_type == 'view',
-        Analytics.created_at >= start_date
-    ).group_by(func.date(Analytics.created_at)).all()
-
-    top_referrers = db.session.query(
-        Analytics.referrer,
-        func.count(Analytics.id).label('count')
-    ).filter(
-        Analytics.zine_id == zine_id,
-        Analytics.referrer.isnot(None)
-    ).group_by(Analytics.referrer).order_by(func.count(Analytics.id).desc()).limit(5).all()
-
-    followers_gained = db.session.query(func.count(Analytics.id)).filter(
-        Analytics.zine_id == zine_id,
-        Analytics.event_type == 'follow',
-        Analytics.created_at >= start_date
-    ).scalar() or 0
+    response, rollups = repos.analytics.stats(zine)
+    response.update(summarize(rollups))
+    return jsonify(response)
 
-    return jsonify({
-        'views': zine.views_count,
-        'unique_readers': zine.unique_readers,
-        'avg_read_time': round(zine.avg_read_time, 1) if zine.avg_read_time else 0,
-        'followers_gained': followers_gained,
-        'daily_views': [{'date': str(d.date), 'views': d.views} for d in daily_views],
-        'top_referrers': [{'referrer': r.referrer or 'Direct', 'count': r.count} for r in top_referrers]
-    })
+@bp.route('/cron/compact-counters')
+def cron_compact_counters():
+    """Fold counters left pending by idle instances into their fields (Vercel cron, see vercel.json)"""
+    secret = os.getenv('CRON_SECRET')
+    if not secret or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {secret}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    from app.firestore_db import firestore_db
+    if not firestore_db.is_available():
+        return jsonify({'compacted': 0})
+    firestore_db.analytics.flush()
+    return jsonify({'compacted': firestore_db.counters.compact_all()})
 
 @bp.route('/templates')
 def get_templates():
@@ -215,4 +211,10 @@ def get_templates():
             ]
         }
     ]
-    return jsonify(templates)
\ No newline at end of file
+
+    # Templates only change with a deploy, so browsers and the edge can hold them for a while
+    etag = make_etag('templates', templates)
+    response = not_modified(etag, cache_control=TEMPLATES_CACHE_CONTROL)
+    if response:
+        return response
+    return add_validators(jsonify(templates), etag, cache_control=TEMPLATES_CACHE_CONTROL)
\ No newline at end of file
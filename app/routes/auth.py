@@ -3,8 +3,20 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User
 from app.firebase_auth import verify_token, get_user as get_firebase_user
+from app.names import claim_sql_name, NameUnavailable
+from app.user_session import remember_user, forget_user
 import re
 
+# Try to import the Firestore user model
+try:
+    from app.firestore_models import FirestoreUser
+except Exception as e:
+    print(f"Firestore import failed in auth: {e}")
+    FirestoreUser = None
+
+def is_firestore_user(user):
+    return FirestoreUser is not None and isinstance(user, FirestoreUser)
+
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 @bp.route('/login')
@@ -67,55 +79,30 @@ def firebase_login():
         # Create new user
         # Generate unique username from email or name
         base_username = email.split('@')[0] if email else name.replace(' ', '').lower()
-        base_username = re.sub(r'[^a-zA-Z0-9_]', '', base_username)[:20]
-
-        username = base_username
-        counter = 1
-
-        if use_firestore:
-            # Check username uniqueness in Firestore
-            while firestore_db.get_user_by_username(username):
-                username = f"{base_username}{counter}"
-                counter += 1
-
-            # Create user in Firestore with UUID
-            import uuid
-            from datetime import datetime
-            from werkzeug.security import generate_password_hash
-
-            user_id = f"user_{uuid.uuid4()}"
-            user_data = {
-                'id': user_id,
-                'firebase_uid': firebase_uid,
-                'email': email,
-                'username': username,
-                'display_name': name,
-                'avatar_url': picture,
-                'bio': '',
-                'created_at': datetime.utcnow(),
-                'followers_count': 0,
-                'following_count': 0,
-                'email_notifications': True
-            }
-
-            firestore_db._get_db().collection('users').document(user_id).set(user_data)
-            user = FirestoreUser(user_data)
-            print(f"Created Firestore user: {username} with ID: {user_id}")
-        else:
-            # SQLAlchemy fallback
-            while User.query.filter_by(username=username).first():
-                username = f"{base_username}{counter}"
-                counter += 1
-
-            user = User(
-                firebase_uid=firebase_uid,
-                email=email,
-                username=username,
-                display_name=name,
-                avatar_url=picture
-            )
-            db.session.add(user)
-            db.session.commit()
+        base_username = re.sub(r'[^a-zA-Z0-9_]', '', base_username)[:20] or 'user'
+
+        try:
+            if use_firestore:
+                # The username is reserved in the same transaction that creates the user
+                user_data = firestore_db.create_user(
+                    base_username, email, firebase_uid,
+                    display_name=name,
+                    avatar_url=picture
+                )
+                user = FirestoreUser(user_data)
+                print(f"Created Firestore user: {user_data['username']} with ID: {user_data['id']}")
+            else:
+                # SQLAlchemy fallback
+                user = claim_sql_name(User.username, base_username, lambda username: User(
+                    firebase_uid=firebase_uid,
+                    email=email,
+                    username=username,
+                    display_name=name,
+                    avatar_url=picture
+                ))
+        except NameUnavailable as e:
+            print(f"Error creating user: {e}")
+            return jsonify({'error': 'Could not allocate a username, please try again'}), 409
     else:
         # Update existing user info
         if use_firestore:
@@ -140,6 +127,8 @@ def firebase_login():
 
     # Log in the user
     login_user(user, remember=True)
+    if is_firestore_user(user):
+        remember_user(user.to_dict())
 
     return jsonify({
         'success': True,
@@ -187,6 +176,11 @@ def update_username():
     if len(username) < 3 or len(username) > 20:
         return jsonify({'error': 'Username must be between 3 and 20 characters'}), 400
 
+    if is_firestore_user(current_user._get_current_object()):
+        if not current_user.change_username(username):
+            return jsonify({'error': 'Username is already taken'}), 400
+        return jsonify({'success': True, 'username': username})
+
     # Check if username is taken (excluding current user)
     existing = User.query.filter_by(username=username).first()
     if existing and existing.id != current_user.id:
@@ -201,6 +195,7 @@ def update_username():
 @login_required
 def logout():
     logout_user()
+    forget_user()
     return redirect(url_for('main.index'))
 
 @bp.route('/profile')
@@ -211,6 +206,21 @@ def profile():
 @bp.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
+    if request.method == 'POST' and is_firestore_user(current_user._get_current_object()):
+        new_username = request.form.get('username')
+        if new_username and new_username != current_user.username:
+            if not current_user.change_username(new_username):
+                flash('Username is already taken', 'error')
+                return redirect(url_for('auth.edit_profile'))
+
+        current_user.update(
+            bio=request.form.get('bio'),
+            website=request.form.get('website'),
+            email_notifications=request.form.get('email_notifications') == 'on'
+        )
+        flash('Profile updated successfully', 'success')
+        return redirect(url_for('auth.profile'))
+
     if request.method == 'POST':
         current_user.bio = request.form.get('bio')
         current_user.website = request.form.get('website')
@@ -202,4 +202,41 @@ def debug_firebase():
         else:
             debug_info['summary']['action_required'].append('Check Firestore is enabled in Google Cloud Console')
 
-    return jsonify(debug_info)
\ No newline at end of file
+    return jsonify(debug_info)
+
+
+@bp.route('/debug/cache')
+def debug_cache():
+    """Report Firestore read-cache hit/miss counters for sizing"""
+    from app.firestore_db import firestore_db
+    return jsonify(firestore_db.cache.stats())
+
+
+@bp.route('/debug/auth-cache')
+def debug_auth_cache():
+    """Report verified-token cache and signing key state"""
+    from app.token_verifier import token_verifier
+    return jsonify(token_verifier.stats())
+
+
+@bp.route('/debug/startup')
+def debug_startup():
+    """Report import/init timings of this instance for tracking cold-start latency"""
+    from app import startup
+    return jsonify(startup.report())
+
+
+@bp.route('/debug/image-jobs')
+def debug_image_jobs():
+    """Report image job queue depth for sizing IMAGE_WORKERS / IMAGE_QUEUE_SIZE"""
+    from app.image_jobs import image_jobs
+    return jsonify(image_jobs.stats())
+
+
+@bp.route('/debug/analytics')
+def debug_analytics():
+    """Report analytics buffer depth, flush counters and sharded counter state"""
+    from app.firestore_db import firestore_db
+    stats = firestore_db.analytics.stats()
+    stats['counters'] = firestore_db.counters.stats()
+    return jsonify(stats)
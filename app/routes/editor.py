@@ -1,45 +1,70 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
-from app.models import Zine, Page, ZineVersion, Tag, Notification
-from app import db
-from datetime import datetime
-import json
+from app.cache import invalidate_zine_html
+from app.blob_store import get_blob_store
+from app.qr import generate_qr_codes, zine_share_url
+from app.http_cache import make_etag, not_modified, add_validators, PRIVATE_CACHE_CONTROL
+from app.page_patch import ensure_block_ids, PatchError, RevisionConflict
+from app.versions import diff_pages, version_summary
+from app.repos import get_repos
 import re
 
-# Try to import Firestore
+# The editor bypasses Firestore's shared read cache (see editor_reads_fresh)
 try:
     from app.firestore_db import firestore_db
-    USE_FIRESTORE = None  # Will be determined per request
 except Exception as e:
     print(f"Firestore import failed in editor: {e}")
     firestore_db = None
-    USE_FIRESTORE = False
-
-def use_firestore():
-    """Dynamically check if Firestore should be used"""
-    global USE_FIRESTORE
-    if USE_FIRESTORE is not None:
-        return USE_FIRESTORE
-
-    if firestore_db is None:
-        USE_FIRESTORE = False
-        return False
-
-    try:
-        USE_FIRESTORE = firestore_db.is_available()
-        return USE_FIRESTORE
-    except Exception as e:
-        print(f"Error checking Firestore availability: {e}")
-        USE_FIRESTORE = False
-        return False
 
 bp = Blueprint('editor', __name__, url_prefix='/editor')
 
+@bp.before_request
+def editor_reads_fresh():
+    """The editor must see the latest saved state, so bypass the shared read cache"""
+    if firestore_db is not None:
+        firestore_db.cache.request_only()
+
 def generate_slug(title):
     slug = re.sub(r'[^\w\s-]', '', title.lower())
     slug = re.sub(r'[-\s]+', '-', slug)
     return slug
 
+def owned_zine(repos, zine_id):
+    """The zine if the current user owns it, else None"""
+    zine = repos.zines.get(zine_id)
+    return zine if zine and zine.get('creator_id') == current_user.id else None
+
+def zine_page(repos, zine, page_id):
+    """The page if it belongs to zine, else None"""
+    page = repos.pages.get(page_id)
+    return page if page and str(page.get('zine_id')) == str(zine['id']) else None
+
+def record_version(repos, zine_id, changed=None, removed=()):
+    """Fold a page write into the zine's version history (see app.versions)
+
+    changed/removed name the pages the write touched, so autosaves don't re-read the
+    whole zine; without them all current pages are snapshotted. On SQL this joins the
+    caller's transaction; the caller commits.
+    """
+    try:
+        if changed is None and not removed:
+            repos.versions.record(zine_id, repos.pages.list(zine_id), current_user.id)
+        else:
+            repos.versions.record_changes(zine_id, lambda: repos.pages.list(zine_id),
+                                          changed=changed or (), removed=removed, user_id=current_user.id)
+    except Exception as e:
+        if repos.backend == 'sql':
+            raise
+        # History is best effort; the save itself already succeeded
+        print(f"Error recording version for zine {zine_id}: {e}")
+
+def pages_changed(repos, zine_id, changed=None, removed=()):
+    """Bump updated_at, record a version and commit after a page write"""
+    repos.zines.touch(zine_id)
+    record_version(repos, zine_id, changed, removed)
+    repos.commit()
+    invalidate_zine_html(zine_id)
+
 @bp.route('/new')
 @login_required
 def new_zine():
@@ -48,6 +73,7 @@ def new_zine():
 @bp.route('/create', methods=['POST'])
 @login_required
 def create_zine():
+    repos = get_repos()
     try:
         title = request.form.get('title')
         description = request.form.get('description')
@@ -56,68 +82,18 @@ def create_zine():
             flash('Title is required', 'error')
             return redirect(url_for('editor.new_zine'))
 
-        slug = generate_slug(title)
-
-        if use_firestore():
-            # Firestore implementation
-            counter = 1
-            original_slug = slug
-            while firestore_db.get_zine_by_slug(current_user.id, slug):
-                slug = f"{original_slug}-{counter}"
-                counter += 1
-
-            # Create zine in Firestore
-            zine = firestore_db.create_zine(
-                creator_id=current_user.id,
-                title=title,
-                slug=slug,
-                description=description,
-                status='draft'
-            )
+        # Taken slugs get a -1, -2, ... suffix
+        zine = repos.zines.create(current_user.id, title, generate_slug(title), description=description)
+        repos.pages.insert(zine['id'], content={'blocks': []}, template='blank')
+        repos.commit()
 
-            # Create first page
-            first_page = firestore_db.create_page(
-                zine_id=zine['id'],
-                order=0,
-                content={'blocks': []},
-                template='blank'
-            )
-
-            flash(f'Zine "{title}" created successfully!', 'success')
-            return redirect(url_for('editor.edit', zine_id=zine['id']))
-        else:
-            # SQLAlchemy fallback
-            counter = 1
-            original_slug = slug
-            while Zine.query.filter_by(creator_id=current_user.id, slug=slug).first():
-                slug = f"{original_slug}-{counter}"
-                counter += 1
-
-            zine = Zine(
-                creator_id=current_user.id,
-                title=title,
-                slug=slug,
-                description=description,
-                status='draft'
-            )
-            db.session.add(zine)
-            db.session.commit()
-
-            first_page = Page(
-                zine_id=zine.id,
-                order=0,
-                content={'blocks': []},
-                template='blank'
-            )
-            db.session.add(first_page)
-            db.session.commit()
-
-            flash(f'Zine "{title}" created successfully!', 'success')
-            return redirect(url_for('editor.edit', zine_id=zine.id))
+        flash(f'Zine "{title}" created successfully!', 'success')
+        return redirect(url_for('editor.edit', zine_id=zine['id']))
     except Exception as e:
         print(f"Error creating zine: {e}")
         import traceback
         traceback.print_exc()
+        repos.rollback()
         flash(f'Error creating zine: {str(e)}', 'error')
         return redirect(url_for('editor.new_zine'))
 
@@ -125,60 +101,21 @@ def create_zine():
 @login_required
 def edit_debug(zine_id):
     """Debug endpoint to test editor functionality"""
-    if use_firestore():
-        zine = firestore_db.get_zine_by_id(zine_id)
-        if not zine:
-            return "Zine not found", 404
-
-        class ZineObj:
-            def __init__(self, data):
-                self.__dict__.update(data)
-
-        zine_obj = ZineObj(zine)
-        return render_template('editor/edit_debug.html', zine=zine_obj)
-    else:
-        return "Debug only available for Firestore", 400
+    zine = get_repos().zines.get(zine_id)
+    if not zine:
+        return "Zine not found", 404
+    return render_template('editor/edit_debug.html', zine=zine)
 
 @bp.route('/<zine_id>')
 @login_required
 def edit(zine_id):
-    if use_firestore():
-        # Firestore implementation
-        zine = firestore_db.get_zine_by_id(zine_id)
-        if not zine or zine.get('creator_id') != current_user.id:
-            flash('You can only edit your own zines', 'error')
-            return redirect(url_for('main.index'))
-
-        pages = firestore_db.get_zine_pages(zine_id)
-
-        # Convert to object-like format for template compatibility
-        class ZineObj:
-            def __init__(self, data):
-                self.__dict__.update(data)
-                self.pages = type('Pages', (), {'all': lambda: pages})()
-                # Ensure id is accessible
-                if 'id' not in self.__dict__ and '_id' in self.__dict__:
-                    self.id = self._id
-
-        zine_obj = ZineObj(zine)
-        print(f"DEBUG: Zine ID being passed to template: {zine_obj.id}")
-        print(f"DEBUG: Zine data: {zine}")
-        return render_template('editor/edit.html', zine=zine_obj, pages=pages)
-    else:
-        # SQLAlchemy fallback
-        try:
-            zine_id = int(zine_id)
-        except ValueError:
-            flash('Invalid zine ID', 'error')
-            return redirect(url_for('main.index'))
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        flash('You can only edit your own zines', 'error')
+        return redirect(url_for('main.index'))
 
-        zine = Zine.query.get_or_404(zine_id)
-        if zine.creator_id != current_user.id:
-            flash('You can only edit your own zines', 'error')
-            return redirect(url_for('main.index'))
-
-        pages = zine.pages.all()
-        return render_template('editor/edit.html', zine=zine, pages=pages)
+    return render_template('editor/edit.html', zine=zine, pages=repos.pages.list(zine['id']))
 
 @bp.route('/<zine_id>/save', methods=['POST'])
 @login_required
@@ -186,222 +123,222 @@ def save(zine_id):
     data = request.get_json()
     page_id = data.get('page_id')
     content = data.get('content')
+    base_revision = data.get('base_revision')
+    if base_revision is not None and not isinstance(base_revision, int):
+        return jsonify({'error': 'base_revision must be an integer'}), 400
+
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    if page_id:
+        page = zine_page(repos, zine, page_id)
+        if not page:
+            return jsonify({'error': 'Page not found'}), 404
+        try:
+            revision = repos.pages.save_content(page['id'], content, base_revision)
+        except RevisionConflict as e:
+            repos.rollback()
+            return jsonify({'error': 'Page was changed elsewhere', 'revision': e.revision}), 409
+        if revision is None:
+            return jsonify({'error': 'Page not found'}), 404
+        changed = {'id': page['id'], 'content': content, 'template': page.get('template')}
+    else:
+        # Create new page at the end
+        page = changed = repos.pages.insert(zine['id'], content=content)
+        revision = page['revision']
 
-    if use_firestore():
-        # Firestore implementation
-        zine = firestore_db.get_zine_by_id(zine_id)
-        if not zine or zine.get('creator_id') != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        if page_id:
-            # Update existing page
-            page = firestore_db.get_page_by_id(page_id)
-            if not page:
-                return jsonify({'error': 'Page not found'}), 404
-            if page.get('zine_id') != zine_id:
-                return jsonify({'error': 'Invalid page'}), 400
-
-            # Update the page content
-            firestore_db.update_page(page_id, {'content': content, 'updated_at': datetime.utcnow()})
-        else:
-            # Create new page
-            pages = firestore_db.get_zine_pages(zine_id)
-            next_order = max([p.get('order', 0) for p in pages]) + 1 if pages else 0
-            page = firestore_db.create_page(
-                zine_id=zine_id,
-                order=next_order,
-                content=content
-            )
-            page_id = page['id']
+    pages_changed(repos, zine['id'], [changed])
+    return jsonify({'success': True, 'page_id': page['id'], 'revision': revision})
 
-        # Update zine's updated_at
-        firestore_db.update_zine(zine_id, {'updated_at': datetime.utcnow()})
+@bp.route('/<zine_id>/page/<page_id>/patch', methods=['POST'])
+@login_required
+def patch_page(zine_id, page_id):
+    """Apply block-level operations from autosave (see app.page_patch)
+
+    Responds 409 with the current revision if the page was saved elsewhere since
+    base_revision, so the editor can reload it instead of overwriting.
+    """
+    data = request.get_json(silent=True) or {}
+    base_revision = data.get('base_revision')
+    ops = data.get('ops')
+    if not isinstance(base_revision, int):
+        return jsonify({'error': 'base_revision is required'}), 400
+
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    page = zine_page(repos, zine, page_id)
+    if not page:
+        return jsonify({'error': 'Page not found'}), 404
 
-        return jsonify({'success': True, 'page_id': page_id})
-    else:
-        # SQLAlchemy fallback
-        try:
-            zine_id = int(zine_id)
-        except ValueError:
-            return jsonify({'error': 'Invalid zine ID'}), 400
-
-        zine = Zine.query.get_or_404(zine_id)
-        if zine.creator_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        if page_id:
-            page = Page.query.get_or_404(page_id)
-            if page.zine_id != zine_id:
-                return jsonify({'error': 'Invalid page'}), 400
-        else:
-            last_page = Page.query.filter_by(zine_id=zine_id).order_by(Page.order.desc()).first()
-            next_order = (last_page.order + 1) if last_page else 0
-            page = Page(zine_id=zine_id, order=next_order)
-            db.session.add(page)
-
-        page.content = content
-        page.updated_at = datetime.utcnow()
-        zine.updated_at = datetime.utcnow()
-
-        version_count = ZineVersion.query.filter_by(zine_id=zine_id).count()
-        if version_count >= 10:
-            oldest = ZineVersion.query.filter_by(zine_id=zine_id).order_by(ZineVersion.created_at).first()
-            db.session.delete(oldest)
-
-        all_pages = Page.query.filter_by(zine_id=zine_id).order_by(Page.order).all()
-        snapshot = {
-            'pages': [{'order': p.order, 'content': p.content} for p in all_pages]
-        }
-
-        version = ZineVersion(
-            zine_id=zine_id,
-            version_number=version_count + 1,
-            content_snapshot=snapshot,
-            created_by=current_user.id
-        )
-        db.session.add(version)
-        db.session.commit()
-
-        return jsonify({'success': True, 'page_id': page.id})
+    try:
+        result = repos.pages.patch(page['id'], base_revision, ops)
+        if result is None:
+            return jsonify({'error': 'Page not found'}), 404
+        revision, content = result
+        pages_changed(repos, zine['id'], [{'id': page['id'], 'content': content, 'template': page.get('template')}])
+    except RevisionConflict as e:
+        repos.rollback()
+        return jsonify({'error': 'Page was changed elsewhere', 'revision': e.revision}), 409
+    except PatchError as e:
+        repos.rollback()
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'success': True, 'page_id': page['id'], 'revision': revision})
 
 @bp.route('/<zine_id>/page/<page_id>', methods=['GET'])
 @login_required
 def get_page(zine_id, page_id):
     """Get a specific page's content"""
-    if use_firestore():
-        # Verify ownership
-        zine = firestore_db.get_zine_by_id(zine_id)
-        if not zine or zine.get('creator_id') != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        # Get the page
-        page = firestore_db.get_page_by_id(page_id)
-        if not page or page.get('zine_id') != zine_id:
-            return jsonify({'error': 'Page not found'}), 404
-
-        return jsonify({
-            'success': True,
-            'content': page.get('content', {'blocks': []})
-        })
-    else:
-        # SQLAlchemy fallback
-        try:
-            zine_id = int(zine_id)
-            page_id = int(page_id)
-        except ValueError:
-            return jsonify({'error': 'Invalid ID'}), 400
-
-        zine = Zine.query.get_or_404(zine_id)
-        if zine.creator_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        page = Page.query.get_or_404(page_id)
-        if page.zine_id != zine_id:
-            return jsonify({'error': 'Invalid page'}), 400
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    page = zine_page(repos, zine, page_id)
+    if not page:
+        return jsonify({'error': 'Page not found'}), 404
+
+    content = page.get('content') or {'blocks': []}
+    revision = page.get('revision') or 0
+    updated_at = page.get('updated_at')
+
+    # Switching back to a page the editor already loaded costs a 304 instead of the full JSON
+    etag = make_etag('page', page_id, updated_at) if updated_at else make_etag('page', page_id, content)
+    response = not_modified(etag, updated_at, PRIVATE_CACHE_CONTROL)
+    if response:
+        return response
+
+    # Patches address blocks by id, so blocks saved without one get a stable positional id
+    content = dict(content, blocks=ensure_block_ids([dict(b) for b in content.get('blocks') or []]))
+    return add_validators(jsonify({
+        'success': True,
+        'content': content,
+        'revision': revision
+    }), etag, updated_at, PRIVATE_CACHE_CONTROL)
 
-        return jsonify({
-            'success': True,
-            'content': page.content or {'blocks': []}
-        })
+def requested_index(data):
+    """Optional 'index' (0-based page position) from a JSON body; raises ValueError"""
+    index = (data or {}).get('index')
+    if index is not None and (not isinstance(index, int) or isinstance(index, bool) or index < 0):
+        raise ValueError('index must be a non-negative integer')
+    return index
 
 @bp.route('/<zine_id>/add-page', methods=['POST'])
 @login_required
 def add_page(zine_id):
-    if use_firestore():
-        # Firestore implementation
-        zine = firestore_db.get_zine_by_id(zine_id)
-        if not zine or zine.get('creator_id') != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        # Get existing pages to determine next order
-        pages = firestore_db.get_zine_pages(zine_id)
-        next_order = max([p.get('order', 0) for p in pages]) + 1 if pages else 0
-
-        # Create new page
-        new_page = firestore_db.create_page(
-            zine_id=zine_id,
-            order=next_order,
-            content={'blocks': []},
-            template='blank'
-        )
-
-        return jsonify({'success': True, 'page_id': new_page['id'], 'order': next_order})
-    else:
-        # SQLAlchemy fallback
-        try:
-            zine_id = int(zine_id)
-        except ValueError:
-            return jsonify({'error': 'Invalid zine ID'}), 400
-
-        zine = Zine.query.get_or_404(zine_id)
-        if zine.creator_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        index = requested_index(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        last_page = Page.query.filter_by(zine_id=zine_id).order_by(Page.order.desc()).first()
-        next_order = (last_page.order + 1) if last_page else 0
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
 
-        page = Page(
-            zine_id=zine_id,
-            order=next_order,
-            content={'blocks': []},
-            template='blank'
-        )
-        db.session.add(page)
-        db.session.commit()
+    # Only the new page is written; its rank places it among the others
+    page = repos.pages.insert(zine['id'], index, content={'blocks': []}, template='blank')
+    pages_changed(repos, zine['id'], [page])
 
-        return jsonify({'success': True, 'page_id': page.id, 'order': page.order})
+    return jsonify({'success': True, 'page_id': page['id'], 'order': page['order'], 'revision': 0})
 
 @bp.route('/<zine_id>/delete-page/<page_id>', methods=['DELETE'])
 @login_required
 def delete_page(zine_id, page_id):
-    if use_firestore():
-        # Firestore implementation
-        zine = firestore_db.get_zine_by_id(zine_id)
-        if not zine or zine.get('creator_id') != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        page = firestore_db.get_page_by_id(page_id)
-        if not page or page.get('zine_id') != zine_id:
-            return jsonify({'error': 'Invalid page'}), 400
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
 
-        # Delete the page
-        firestore_db._get_db().collection('pages').document(page_id).delete()
+    page = zine_page(repos, zine, page_id)
+    if not page:
+        return jsonify({'error': 'Invalid page'}), 400
 
-        # Reorder remaining pages
-        pages = firestore_db.get_zine_pages(zine_id)
-        deleted_order = page.get('order', 0)
+    # Remaining pages keep their ranks, so nothing else needs rewriting
+    repos.pages.delete(page['id'])
+    pages_changed(repos, zine['id'], removed=[page['id']])
+    return jsonify({'success': True})
 
-        for p in pages:
-            if p.get('order', 0) > deleted_order:
-                firestore_db.update_page(p['id'], {'order': p['order'] - 1})
-
-        return jsonify({'success': True})
+@bp.route('/<zine_id>/page/<page_id>/move', methods=['POST'])
+@login_required
+def move_page(zine_id, page_id):
+    """Move a page to {"index": n}; only the moved page's rank is written"""
+    try:
+        index = requested_index(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if index is None:
+        return jsonify({'error': 'index is required'}), 400
+
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    page = zine_page(repos, zine, page_id)
+    position = repos.pages.move(zine['id'], page['id'], index) if page else None
+    if position is None:
+        return jsonify({'error': 'Invalid page'}), 400
+
+    pages_changed(repos, zine['id'], [{'id': page['id'], 'order': position}])
+    return jsonify({'success': True, 'page_id': page['id'], 'order': position})
+
+@bp.route('/<zine_id>/versions')
+@login_required
+def list_versions(zine_id):
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
+    versions = repos.versions.list(zine['id'])
+    return jsonify({'versions': [version_summary(v) for v in versions]})
+
+@bp.route('/<zine_id>/versions/<int:number>/diff')
+@login_required
+def diff_version(zine_id, number):
+    """Changes from version `number` to `against` (default: the current pages)"""
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    store = repos.versions
+    version = store.get(zine['id'], number)
+    if not version:
+        return jsonify({'error': 'Version not found'}), 404
+
+    against = request.args.get('against', type=int)
+    if against is None:
+        new_pages = repos.pages.list(zine['id'])
     else:
-        # SQLAlchemy fallback
-        try:
-            zine_id = int(zine_id)
-            page_id = int(page_id)
-        except ValueError:
-            return jsonify({'error': 'Invalid ID'}), 400
-
-        zine = Zine.query.get_or_404(zine_id)
-        if zine.creator_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
+        other = store.get(zine['id'], against)
+        if not other:
+            return jsonify({'error': 'Version not found'}), 404
+        new_pages = store.load_pages(zine['id'], other)
 
-        page = Page.query.get_or_404(page_id)
-        if page.zine_id != zine_id:
-            return jsonify({'error': 'Invalid page'}), 400
+    diff = diff_pages(store.load_pages(zine['id'], version), new_pages)
+    return jsonify({'number': number, 'against': against, **diff})
 
-        deleted_order = page.order
-        db.session.delete(page)
+@bp.route('/<zine_id>/versions/<int:number>/restore', methods=['POST'])
+@login_required
+def restore_version(zine_id, number):
+    repos = get_repos()
+    zine = owned_zine(repos, zine_id)
+    if not zine:
+        return jsonify({'error': 'Unauthorized'}), 403
 
-        Page.query.filter(
-            Page.zine_id == zine_id,
-            Page.order > deleted_order
-        ).update({Page.order: Page.order - 1})
+    version = repos.versions.get(zine['id'], number)
+    if not version:
+        return jsonify({'error': 'Version not found'}), 404
 
-        db.session.commit()
-        return jsonify({'success': True})
+    repos.pages.replace(zine['id'], repos.versions.load_pages(zine['id'], version))
+    pages_changed(repos, zine['id'])
+    return jsonify({'success': True, 'restored': number})
 
 @bp.route('/<zine_id>/publish', methods=['POST'])
 @login_required
@@ -411,113 +348,71 @@ def publish(zine_id):
     print(f"{'='*60}")
     print(f"Zine ID: {zine_id}")
     print(f"User ID: {current_user.id}")
-    print(f"Request Method: {request.method}")
-    print(f"Request Headers: {dict(request.headers)}")
 
     try:
         data = request.get_json()
         print(f"Request Data: {data}")
         visibility = data.get('visibility', 'public')
         tags_data = data.get('tags', [])[:3]
-        print(f"Visibility: {visibility}")
-        print(f"Tags: {tags_data}")
     except Exception as e:
         print(f"ERROR parsing request data: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Invalid request data: {str(e)}'}), 400
 
-    if use_firestore():
-        print("Using Firestore for publish")
-        # Firestore implementation
+    repos = get_repos()
+    zine = repos.zines.get(zine_id)
+    if not zine:
+        print(f"ERROR: Zine not found with ID: {zine_id}")
+        return jsonify({'error': 'Zine not found'}), 404
+    if zine.get('creator_id') != current_user.id:
+        print(f"ERROR: Unauthorized - Creator ID mismatch. Zine creator: {zine.get('creator_id')}, Current user: {current_user.id}")
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    zine_url = zine_share_url(current_user.username, zine['slug'])
+    try:
+        # Pre-generate the share QR code so viewers never render it
+        qr_codes = None
         try:
-            zine = firestore_db.get_zine_by_id(zine_id)
-            print(f"Zine retrieved from Firestore: {zine}")
-            if not zine:
-                print(f"ERROR: Zine not found with ID: {zine_id}")
-                return jsonify({'error': 'Zine not found'}), 404
-
-            if zine.get('creator_id') != current_user.id:
-                print(f"ERROR: Unauthorized - Creator ID mismatch. Zine creator: {zine.get('creator_id')}, Current user: {current_user.id}")
-                return jsonify({'error': 'Unauthorized'}), 403
-
-            # Update zine status in Firestore
-            updates = {
-                'status': 'published' if visibility == 'public' else 'unlisted',
-                'published_at': datetime.utcnow(),
-                'tags': tags_data,
-                'updated_at': datetime.utcnow()
-            }
-            print(f"Updating zine with: {updates}")
-            firestore_db.update_zine(zine_id, updates)
-            print("Zine updated successfully in Firestore")
-
-            # Get the slug and title from the Firestore zine
-            zine_slug = zine.get('slug')
-            zine_title = zine.get('title')
-            print(f"Zine slug: {zine_slug}, title: {zine_title}")
+            qr_codes = generate_qr_codes(zine_url, get_blob_store())
         except Exception as e:
-            print(f"ERROR in Firestore publish: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({'error': f'Failed to publish: {str(e)}'}), 500
-    else:
-        # SQLAlchemy fallback
+            print(f"ERROR generating QR code: {e}")
+
+        repos.zines.publish(zine['id'], 'published' if visibility == 'public' else 'unlisted', tags_data,
+                            qr_codes=qr_codes)
+        repos.commit()
+        invalidate_zine_html(zine['id'])
+    except Exception as e:
+        print(f"ERROR publishing zine: {e}")
+        import traceback
+        traceback.print_exc()
+        repos.rollback()
+        return jsonify({'error': f'Failed to publish: {str(e)}'}), 500
+
+    if visibility == 'public':
+        # Deliver the zine to followers; a failure here must not fail the publish
         try:
-            zine_id = int(zine_id)
-        except ValueError:
-            return jsonify({'error': 'Invalid zine ID'}), 400
-
-        zine = Zine.query.get_or_404(zine_id)
-        if zine.creator_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-
-        zine.status = 'published' if visibility == 'public' else 'unlisted'
-        zine.published_at = datetime.utcnow()
-
-        zine.tags = []
-        for tag_name in tags_data:
-            tag = Tag.query.filter_by(name=tag_name).first()
-            if not tag:
-                tag = Tag(name=tag_name)
-                db.session.add(tag)
-            zine.tags.append(tag)
-
-        db.session.commit()
-
-        # Get the slug and title from the SQLAlchemy zine
-        zine_slug = zine.slug
-        zine_title = zine.title
-
-        if visibility == 'public':
-            for follower in current_user.followers.all():
-                if follower.email_notifications:
-                    notification = Notification(
-                        user_id=follower.id,
-                        type='new_issue',
-                        title='New zine published',
-                        message=f'{current_user.username} published "{zine_title}"',
-                        link=url_for('viewer.view_zine', username=current_user.username, slug=zine_slug)
-                    )
-                    db.session.add(notification)
-            db.session.commit()
-
-    # Debug current user info
-    print(f"Current user username: {current_user.username if hasattr(current_user, 'username') else 'NO USERNAME'}")
-    print(f"Current user attributes: {dir(current_user)}")
-
-    publish_url = url_for('viewer.view_zine', username=current_user.username, slug=zine_slug, _external=True)
-    print(f"Publishing successful! URL: {publish_url}")
-    print(f"Generated URL components - username: {current_user.username}, slug: {zine_slug}")
+            repos.follows.announce(
+                zine,
+                {'id': current_user.id, 'username': current_user.username},
+                url_for('viewer.view_zine', username=current_user.username, slug=zine['slug'])
+            )
+            repos.commit()
+        except Exception as e:
+            print(f"ERROR announcing zine to followers: {e}")
+            repos.rollback()
+
+    print(f"Publishing successful! URL: {zine_url}")
     print(f"{'='*60}\n")
 
     return jsonify({
         'success': True,
-        'url': publish_url
+        'url': zine_url
     })
 
 @bp.route('/my-zines')
 @login_required
 def my_zines():
-    zines = current_user.zines.order_by(Zine.updated_at.desc()).all()
-    return render_template('editor/my_zines.html', zines=zines)
\ No newline at end of file
+    zines, _ = get_repos().zines.by_creator(current_user.id)
+    zines.sort(key=lambda zine: zine.get('updated_at') or zine.get('created_at'), reverse=True)
+    return render_template('editor/my_zines.html', zines=zines)
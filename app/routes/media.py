@@ -0,0 +1,34 @@
+from flask import Blueprint, Response, abort, request
+from app.blob_store import get_blob_store, is_blob_key
+
+bp = Blueprint('media', __name__)
+
+# Blobs are content-addressed, so a URL always refers to the same bytes
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+@bp.route('/media/<key>')
+def serve_media(key):
+    """Stream a stored blob with long-lived cache headers"""
+    if not is_blob_key(key):
+        abort(404)
+    return send_blob(key, IMMUTABLE_CACHE_CONTROL)
+
+def send_blob(key, cache_control):
+    """Response streaming a blob, using its content address as a strong ETag"""
+    etag = f'"{key}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=304)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    store = get_blob_store()
+    meta = store.stat(key)
+    if not meta:
+        abort(404)
+
+    response = Response(store.iter_chunks(key), mimetype=meta.get('content_type') or 'application/octet-stream')
+    response.headers['Content-Length'] = str(meta['size'])
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -1,45 +1,32 @@
-from flask import Blueprint, render_template, request, jsonify, abort, make_response, url_for
+from flask import Blueprint, render_template, request, jsonify, abort, make_response
 from flask_login import current_user
-from datetime import datetime
-import qrcode
-import io
-import base64
+from markupsafe import Markup
+from app.pagination import decode_cursor
+from app.cache import rendered_zines, zine_html_key
+from app.blob_store import get_blob_store
+from app.qr import get_qr_codes, zine_share_url
+from app.rollups import MAX_READ_TIME
+from app.repos import get_repos
+from app.routes.media import send_blob
+from app.http_cache import (make_etag, not_modified, add_validators, is_shared_cacheable,
+                            PUBLIC_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, PRIVATE_CACHE_CONTROL)
 import uuid
-
-# Always import both systems to avoid import errors
-from app.models import User, Zine, Page, Analytics
-from app import db
-
-# Try to import Firestore
-try:
-    from app.firestore_db import firestore_db
-    # Don't check availability at import time - do it dynamically
-    USE_FIRESTORE = None  # Will be determined per request
-except Exception as e:
-    print(f"Firestore import failed: {e}")
-    firestore_db = None
-    USE_FIRESTORE = False
-
-def use_firestore():
-    """Dynamically check if Firestore should be used"""
-    global USE_FIRESTORE
-    if USE_FIRESTORE is not None:
-        return USE_FIRESTORE
-
-    if firestore_db is None:
-        USE_FIRESTORE = False
-        return False
-
-    try:
-        USE_FIRESTORE = firestore_db.is_available()
-        return USE_FIRESTORE
-    except Exception as e:
-        print(f"Error checking Firestore availability: {e}")
-        USE_FIRESTORE = False
-        return False
+from datetime import datetime, timedelta
 
 bp = Blueprint('viewer', __name__)
 
+PROFILE_PAGE_SIZE = 24
+
+PAGE_TEMPLATES = {
+    'desktop': 'viewer/_pages.html',
+    'mobile': 'viewer/_pages_mobile.html'
+}
+
+def render_pages(variant, pages):
+    """Render the page markup of a zine for the desktop or mobile viewer"""
+    return render_template(PAGE_TEMPLATES[variant], pages=pages)
+
+
 @bp.route('/demo/sample-zine')
 def demo_zine():
     """Demo zine for testing when database is empty"""
@@ -110,128 +97,80 @@ def demo_zine():
     ]
 
     is_following = False
-    return render_template('viewer/view.html', zine=zine, creator=creator, pages=pages, is_following=is_following)
+    # The demo zine and creator aren't stored, so there is no QR code or profile to link to
+    return render_template('viewer/view.html', zine=zine, creator=creator, is_following=is_following,
+                           pages_html=Markup(render_pages('desktop', pages)), page_count=len(pages),
+                           demo=True)
 
 @bp.route('/<username>')
 def creator_profile(username):
-    if use_firestore():
-        creator = firestore_db.get_user_by_username(username)
-        if not creator:
-            abort(404)
+    repos = get_repos()
+    cursor = decode_cursor(request.args.get('cursor'))
+    shared = is_shared_cacheable()
 
-        zines = firestore_db.get_user_zines(creator['id'], status='published')
-
-        is_following = False
-        if current_user.is_authenticated:
-            is_following = firestore_db.is_following(current_user.id, creator['id'])
+    creator = repos.users.get_by_username(username)
+    if not creator:
+        abort(404)
 
-        # Convert to object-like format for template compatibility
-        class CreatorObj:
-            def __init__(self, data):
-                self.__dict__.update(data)
+    zines, cursor_token = repos.zines.by_creator(creator['id'], status='published',
+                                                 limit=PROFILE_PAGE_SIZE, cursor=cursor)
 
-        creator_obj = CreatorObj(creator)
-        zines_objs = [CreatorObj(z) for z in zines]
+    # The page only depends on the creator and the zines listed, so repeat visits get a 304
+    etag = make_etag('profile', creator, request.args.get('cursor'),
+                     [(z['id'], z.get('updated_at')) for z in zines])
+    last_modified = max((z.get('updated_at') for z in zines if z.get('updated_at')), default=None)
+    if shared:
+        response = not_modified(etag, last_modified, PUBLIC_CACHE_CONTROL)
+        if response:
+            return response
 
-        return render_template('viewer/creator.html', creator=creator_obj, zines=zines_objs, is_following=is_following)
-    else:
-        # SQLAlchemy fallback
-        creator = User.query.filter_by(username=username).first_or_404()
-        zines = creator.zines.filter_by(status='published').order_by(Zine.published_at.desc()).all()
+    is_following = False
+    if current_user.is_authenticated:
+        is_following = repos.follows.is_following(current_user.id, creator['id'])
 
-        is_following = False
-        if current_user.is_authenticated:
-            is_following = current_user.is_following(creator)
+    response = make_response(render_template(
+        'viewer/creator.html', creator=creator, zines=zines, is_following=is_following,
+        next_cursor=cursor_token
+    ))
 
-        return render_template('viewer/creator.html', creator=creator, zines=zines, is_following=is_following)
+    if shared:
+        return add_validators(response, etag, last_modified, PUBLIC_CACHE_CONTROL)
+    response.headers['Cache-Control'] = PRIVATE_CACHE_CONTROL
+    return response
 
-@bp.route('/<username>/<slug>')
-def view_zine(username, slug):
-    print(f"\n{'='*60}")
-    print(f"VIEW_ZINE ROUTE HIT")
-    print(f"Username: {username}")
-    print(f"Slug: {slug}")
-    print(f"Using Firestore: {use_firestore()}")
-    print(f"{'='*60}")
-
-    if use_firestore():
-        creator = firestore_db.get_user_by_username(username)
-        print(f"Creator found: {creator}")
-        if not creator:
-            print(f"ERROR: No creator found with username: {username}")
-            abort(404)
+def find_zine(repos, username, slug):
+    """(creator, zine) for a zine URL; 404 for missing zines and other people's drafts"""
+    creator = repos.users.get_by_username(username)
+    zine = repos.zines.get_by_slug(creator['id'], slug) if creator else None
+    if not zine:
+        abort(404)
 
-        zine = firestore_db.get_zine_by_slug(creator['id'], slug)
-        print(f"Zine found: {zine}")
-        if not zine:
-            print(f"ERROR: No zine found with slug: {slug} for creator ID: {creator['id']}")
+    if zine['status'] == 'draft':
+        if not current_user.is_authenticated or current_user.id != creator['id']:
             abort(404)
+    return creator, zine
 
-        if zine['status'] == 'draft':
-            if not current_user.is_authenticated or current_user.id != creator['id']:
-                abort(404)
-
-        pages = firestore_db.get_zine_pages(zine['id'])
-
-        # Track view
-        session_id = request.cookies.get('session_id', None)
-        if not session_id:
-            session_id = str(uuid.uuid4())
-
-        firestore_db.track_view(
-            zine_id=zine['id'],
-            user_id=current_user.id if current_user.is_authenticated else None,
-            session_id=session_id,
-            referrer=request.referrer
-        )
-    else:
-        # SQLAlchemy fallback
-        creator = User.query.filter_by(username=username).first_or_404()
-        zine = Zine.query.filter_by(creator_id=creator.id, slug=slug).first_or_404()
-
-        if zine.status == 'draft':
-            if not current_user.is_authenticated or current_user.id != creator.id:
-                abort(404)
-
-        pages = zine.pages.order_by(Page.order).all()
-
-        # Track view
-        session_id = request.cookies.get('session_id', None)
-        if not session_id:
-            session_id = str(uuid.uuid4())
-
-        zine.views_count += 1
-        db.session.commit()
-
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(request.url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer)
-    qr_code = base64.b64encode(buffer.getvalue()).decode()
+@bp.route('/<username>/<slug>')
+def view_zine(username, slug):
+    repos = get_repos()
+    creator, zine = find_zine(repos, username, slug)
+
+    # Track view
+    session_id = request.cookies.get('session_id', None)
+    if not session_id:
+        session_id = str(uuid.uuid4())
+
+    repos.analytics.track_view(
+        zine,
+        user_id=current_user.id if current_user.is_authenticated else None,
+        session_id=session_id,
+        referrer=request.referrer
+    )
+    repos.commit()
 
     is_following = False
-
-    if use_firestore():
-        if current_user.is_authenticated:
-            is_following = firestore_db.is_following(current_user.id, creator['id'])
-
-        # Convert to object-like format for template compatibility
-        class DataObj:
-            def __init__(self, data):
-                self.__dict__.update(data)
-
-        zine_obj = DataObj(zine)
-        creator_obj = DataObj(creator)
-        pages_objs = [DataObj(p) for p in pages]
-    else:
-        if current_user.is_authenticated:
-            is_following = current_user.is_following(creator)
-
-        zine_obj = zine
-        creator_obj = creator
-        pages_objs = pages
+    if current_user.is_authenticated:
+        is_following = repos.follows.is_following(current_user.id, creator['id'])
 
     # Detect mobile device
     user_agent = request.headers.get('User-Agent', '').lower()
@@ -246,41 +185,88 @@ def view_zine(username, slug):
     # Choose template based on device
     template = 'viewer/view_mobile.html' if is_mobile else 'viewer/view.html'
 
+    # The page markup only changes when the zine is saved, so it is cached per zine version
+    # and device; per-user parts (follow state, nav) are rendered on every request
+    variant = 'mobile' if is_mobile else 'desktop'
+    updated_at = zine.get('updated_at')
+
+    # Anonymous readers of a published zine all get the same page, so a client that already
+    # has this version gets a 304 before anything is rendered
+    shared = is_shared_cacheable() and zine['status'] != 'draft'
+    cache_control = REVALIDATE_CACHE_CONTROL if shared else PRIVATE_CACHE_CONTROL
+    etag = make_etag('zine', zine['id'], updated_at, variant,
+                     creator['username'], creator.get('avatar_url'))
+    if shared:
+        response = not_modified(etag, updated_at, cache_control)
+        if response:
+            response.set_cookie('session_id', session_id, max_age=60*60*24*30)
+            return response
+
+    cache_key = zine_html_key(zine['id'], updated_at, variant)
+    rendered = rendered_zines.get(cache_key)
+    if rendered is None:
+        pages = repos.pages.list(zine['id'])
+        rendered = {
+            'pages_html': Markup(render_pages(variant, pages)),
+            'page_count': len(pages)
+        }
+        rendered_zines.set(cache_key, rendered)
+
     response = make_response(render_template(
         template,
-        zine=zine_obj,
-        pages=pages_objs,
-        creator=creator_obj,
-        qr_code=qr_code,
-        is_following=is_following
+        zine=zine,
+        creator=creator,
+        is_following=is_following,
+        **rendered
     ))
     response.set_cookie('session_id', session_id, max_age=60*60*24*30)  # 30 days
+    if shared:
+        return add_validators(response, etag, updated_at, cache_control)
+    response.headers['Cache-Control'] = cache_control
     return response
 
+@bp.route('/<username>/<slug>/qr.<any(svg, png):fmt>')
+def zine_qr(username, slug, fmt):
+    """QR code for a zine's canonical URL, generated once and served from the blob store"""
+    repos = get_repos()
+    _, zine = find_zine(repos, username, slug)
+
+    zine_url = zine_share_url(username, slug)
+    codes, generated = get_qr_codes(zine_url, get_blob_store(), stored=zine.get('qr_codes'))
+    if generated:
+        # Zines published before QR pre-generation get theirs persisted on first request
+        repos.zines.set_qr_codes(zine['id'], codes)
+
+    # The URL embeds username and slug, so the image only changes if PUBLIC_BASE_URL does
+    return send_blob(codes[fmt], 'public, max-age=86400')
+
 @bp.route('/<username>/<slug>/pdf')
 def download_pdf(username, slug):
-    creator = User.query.filter_by(username=username).first_or_404()
-    zine = Zine.query.filter_by(creator_id=creator.id, slug=slug).first_or_404()
+    _, zine = find_zine(get_repos(), username, slug)
 
-    if not zine.enable_pdf:
+    if not zine.get('enable_pdf'):
         abort(404)
 
-    if zine.status == 'draft':
-        if not current_user.is_authenticated or current_user.id != creator.id:
-            abort(404)
-
     return jsonify({'error': 'PDF generation not yet implemented'}), 501
 
 @bp.route('/api/track-read-time', methods=['POST'])
 def track_read_time():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     zine_id = data.get('zine_id')
     read_time = data.get('read_time')
     session_id = request.cookies.get('session_id')
 
-    if zine_id and read_time and session_id:
-        if use_firestore():
-            firestore_db.track_read_time(zine_id, session_id, read_time)
-        # SQLAlchemy doesn't need special handling here
+    if not isinstance(read_time, (int, float)) or read_time <= 0:
+        read_time = None
+    else:
+        read_time = min(float(read_time), MAX_READ_TIME)
 
-    return jsonify({'success': True})
\ No newline at end of file
+    if zine_id and read_time and session_id:
+        # Read time is measured from page load, so the view happened read_time seconds ago;
+        # keying on that keeps a report sent after midnight on the view's event and day
+        viewed_at = datetime.utcnow() - timedelta(seconds=read_time)
+        repos = get_repos()
+        repos.analytics.track_read_time(zine_id, session_id, read_time, viewed_at=viewed_at)
+        repos.commit()
+
+    return jsonify({'success': True})
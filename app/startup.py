@@ -0,0 +1,126 @@
+"""
+Cold-start settings and timings
+
+On serverless hosts every cold start pays for app setup before the first request is
+served. With LAZY_INIT on (the default on Vercel) create_app doesn't touch Firestore:
+the client is created and health-checked on first use instead.
+
+Each setup phase is timed with `timed()`; phases that happen lazily (Firestore client
+creation, the health check) are recorded when they run. The timings are printed once
+create_app finishes and served from /debug/startup so cold-start latency can be tracked.
+
+profile_imports() breaks the import part down by module: it starts a fresh interpreter
+with `-X importtime`, creates the app there and aggregates the report. It is only
+exposed through `flask import-profile`, since every run spawns an interpreter.
+"""
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+PROCESS_STARTED = time.time()
+
+# phase name -> milliseconds, in the order the phases ran
+STARTUP_TIMINGS = {}
+
+
+def is_serverless():
+    return bool(os.getenv('VERCEL')) or '/var/task' in os.getcwd()
+
+
+def lazy_init():
+    """Whether create_app should defer Firestore setup to first use (LAZY_INIT=true/false)"""
+    value = os.getenv('LAZY_INIT', '').strip().lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    return is_serverless()
+
+
+def record(phase, seconds):
+    STARTUP_TIMINGS[phase] = round(seconds * 1000, 1)
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - started)
+
+
+def report():
+    return {
+        'lazy_init': lazy_init(),
+        'process_age_seconds': round(time.time() - PROCESS_STARTED, 1),
+        'timings_ms': dict(STARTUP_TIMINGS)
+    }
+
+
+def print_report():
+    print('Startup timings (ms): ' + ', '.join(f'{phase}={ms}' for phase, ms in STARTUP_TIMINGS.items()))
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILE_SCRIPT = 'from app import create_app; create_app()'
+
+
+def _package(module):
+    """Group app modules by their own name and everything else by top-level package"""
+    parts = module.split('.')
+    return '.'.join(parts[:2]) if parts[0] == 'app' else parts[0]
+
+
+def parse_importtime(report):
+    """[(module, self_us, cumulative_us)] from `-X importtime` stderr output"""
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return modules
+
+
+def _ms(microseconds):
+    return round(microseconds / 1000, 1)
+
+
+def profile_imports(limit=20, timeout=60):
+    """Import-time breakdown of creating the app in a fresh interpreter
+
+    `packages` sums each module's own import time per top-level package (app modules
+    individually); `app_modules` lists app modules by cumulative time, i.e. including
+    everything they pulled in.
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT],
+        cwd=PROJECT_ROOT, env=dict(os.environ), capture_output=True, text=True, timeout=timeout
+    )
+    wall_us = (time.perf_counter() - started) * 1000000
+    modules = parse_importtime(result.stderr)
+
+    packages = {}
+    for name, self_us, _ in modules:
+        packages[_package(name)] = packages.get(_package(name), 0) + self_us
+    app_modules = sorted((m for m in modules if m[0].split('.')[0] == 'app'), key=lambda m: -m[2])
+
+    return {
+        'ok': result.returncode == 0,
+        'error': result.stderr.strip().splitlines()[-1] if result.returncode and result.stderr.strip() else None,
+        'wall_ms': _ms(wall_us),
+        'import_ms': _ms(sum(self_us for _, self_us, _ in modules)),
+        'module_count': len(modules),
+        'packages': [{'package': name, 'ms': _ms(us)}
+                     for name, us in sorted(packages.items(), key=lambda item: -item[1])[:limit]],
+        'app_modules': [{'module': name, 'self_ms': _ms(self_us), 'cumulative_ms': _ms(cumulative_us)}
+                        for name, self_us, cumulative_us in app_modules[:limit]]
+    }
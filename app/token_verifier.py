@@ -0,0 +1,257 @@
+"""
+Firebase ID token verification with a verified-token cache
+
+firebase_admin's verify_id_token() looks up Google's signing certificates and checks the
+RS256 signature on every call, and API clients send the same token on every request.
+Here:
+- a verified token's claims are cached under the SHA-256 of the token until the token's
+  `exp` (at most TOKEN_CACHE_TTL), so repeat requests skip verification entirely
+- the public signing certificates are kept in memory and refreshed in a background
+  thread shortly before their Cache-Control max-age runs out; a token signed with an
+  unknown key id triggers one synchronous refresh (key rotation)
+- revocation checks cost an Auth API call per cache miss and are off unless
+  FIREBASE_CHECK_REVOKED=true; with them on, a verification is trusted for at most
+  REVOCATION_CHECK_TTL seconds so revoked sessions are noticed quickly
+
+LocalSigningKey mints tokens with a throwaway RSA key and can stand in for Google's key
+endpoint, so the whole verification path runs offline.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+
+from app.cache import TTLCache
+
+ID_TOKEN_CERT_URI = ('https://www.googleapis.com/robot/v1/metadata/x509/'
+                     'securetoken@system.gserviceaccount.com')
+ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 4096))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 600))
+
+CHECK_REVOKED = os.getenv('FIREBASE_CHECK_REVOKED', 'false').lower() == 'true'
+REVOCATION_CHECK_TTL = float(os.getenv('REVOCATION_CHECK_TTL', 60))
+
+# Signing keys are refreshed in the background this long before they expire
+KEY_REFRESH_MARGIN = 300
+# Unknown key ids force a refresh at most this often, so bogus tokens can't hammer Google
+KEY_MIN_REFRESH_INTERVAL = 30
+# Default lifetime of fetched keys when the response has no max-age
+KEY_DEFAULT_MAX_AGE = 3600
+
+# Same as firebase_admin: no leeway on exp/iat
+CLOCK_SKEW_SECONDS = 0
+
+
+class InvalidToken(ValueError):
+    """The token is malformed, expired, wrongly signed or revoked"""
+
+
+def token_key(token):
+    """Cache key for a token; the token itself is a bearer credential and isn't stored"""
+    return hashlib.sha256(token.encode() if isinstance(token, str) else token).hexdigest()
+
+
+class SigningKeys:
+    """Google's public token-signing certificates, held in memory and refreshed ahead of expiry"""
+
+    def __init__(self, url=ID_TOKEN_CERT_URI, fetch=None):
+        self.url = url
+        self._fetch = fetch or self._fetch_http
+        self._certs = {}
+        self._expires_at = 0
+        self._fetched_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.refreshes = 0
+        self.failed_refreshes = 0
+
+    def _fetch_http(self):
+        """({key id: PEM certificate}, max-age seconds) from the certificate endpoint"""
+        import requests
+
+        response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        return response.json(), int(match.group(1)) if match else KEY_DEFAULT_MAX_AGE
+
+    def refresh(self):
+        certs, max_age = self._fetch()
+        now = time.monotonic()
+        with self._lock:
+            self._certs = dict(certs)
+            self._fetched_at = now
+            self._expires_at = now + max_age
+            self.refreshes += 1
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                # The current keys stay in use until they expire
+                self.failed_refreshes += 1
+                print(f"Error refreshing token signing keys: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='signing-key-refresh', daemon=True).start()
+
+    def certs(self, key_id=None):
+        """Current certificates, making sure key_id is present if it can be"""
+        now = time.monotonic()
+        if not self._certs or now >= self._expires_at:
+            self.refresh()
+        elif now >= self._expires_at - KEY_REFRESH_MARGIN:
+            self._refresh_in_background()
+
+        if key_id and key_id not in self._certs and now - self._fetched_at >= KEY_MIN_REFRESH_INTERVAL:
+            self.refresh()
+        return self._certs
+
+    def stats(self):
+        return {
+            'keys': len(self._certs),
+            'expires_in': round(max(0, self._expires_at - time.monotonic())),
+            'refreshes': self.refreshes,
+            'failed_refreshes': self.failed_refreshes
+        }
+
+
+class LocalSigningKey:
+    """Offline stand-in for Firebase's token signer
+
+    Pass `fetch` to SigningKeys in place of the HTTP fetch and `sign()` produces tokens
+    that verify exactly like real Firebase ID tokens for `project_id`.
+    """
+
+    def __init__(self, project_id, key_id='local-key'):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.project_id = project_id
+        self.key_id = key_id
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        self.public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+
+    def fetch(self):
+        return {self.key_id: self.public_pem}, KEY_DEFAULT_MAX_AGE
+
+    def sign(self, uid, lifetime=3600, **claims):
+        """A signed ID token for uid; extra claims (email, name, ...) are added as given"""
+        from google.auth import crypt, jwt
+
+        now = int(time.time())
+        payload = {
+            'iss': ISSUER_PREFIX + self.project_id,
+            'aud': self.project_id,
+            'sub': uid,
+            'user_id': uid,
+            'iat': now,
+            'auth_time': now,
+            'exp': now + lifetime
+        }
+        payload.update(claims)
+        signer = crypt.RSASigner.from_string(self.private_pem, self.key_id)
+        return jwt.encode(signer, payload).decode()
+
+
+class TokenVerifier:
+    """Verifies Firebase ID tokens locally against cached signing keys"""
+
+    def __init__(self, project_id=None, keys=None, check_revoked=None):
+        self._project_id = project_id
+        self.keys = keys or SigningKeys()
+        self.check_revoked = CHECK_REVOKED if check_revoked is None else check_revoked
+        self.cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+    @property
+    def project_id(self):
+        if not self._project_id:
+            import firebase_admin
+            self._project_id = firebase_admin.get_app().project_id or \
+                os.getenv('FIREBASE_PROJECT_ID') or os.getenv('GOOGLE_CLOUD_PROJECT')
+        return self._project_id
+
+    def verify(self, token):
+        """Decoded claims (with 'uid') for a valid token; raises InvalidToken"""
+        if not token or not isinstance(token, str):
+            raise InvalidToken('No token provided')
+
+        key = token_key(token)
+        claims = self.cache.get(key)
+        if claims is not None and claims['exp'] > time.time():
+            return dict(claims)
+
+        claims = self._decode(token)
+        if self.check_revoked:
+            self._check_revoked(claims)
+
+        ttl = min(claims['exp'] - time.time(), TOKEN_CACHE_TTL)
+        if self.check_revoked:
+            ttl = min(ttl, REVOCATION_CHECK_TTL)
+        if ttl > 0:
+            self.cache.set(key, claims, ttl=ttl)
+        return dict(claims)
+
+    def _decode(self, token):
+        from google.auth import jwt
+
+        try:
+            header = jwt.decode_header(token)
+        except Exception as e:
+            raise InvalidToken(f'Malformed token: {e}')
+        if header.get('alg') != 'RS256' or not header.get('kid'):
+            raise InvalidToken('Token must be RS256-signed with a key id')
+
+        certs = self.keys.certs(header['kid'])
+        if header['kid'] not in certs:
+            raise InvalidToken('Token was signed with an unknown key')
+        try:
+            claims = jwt.decode(token, certs={header['kid']: certs[header['kid']]},
+                                audience=self.project_id, clock_skew_in_seconds=CLOCK_SKEW_SECONDS)
+        except ValueError as e:
+            raise InvalidToken(str(e))
+
+        if claims.get('iss') != ISSUER_PREFIX + self.project_id:
+            raise InvalidToken('Token has the wrong issuer')
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidToken('Token has an invalid subject')
+        if claims.get('auth_time', 0) > time.time() + CLOCK_SKEW_SECONDS:
+            raise InvalidToken('Token auth_time is in the future')
+        claims['uid'] = subject
+        return claims
+
+    def _check_revoked(self, claims):
+        from firebase_admin import auth as firebase_auth
+
+        user = firebase_auth.get_user(claims['uid'])
+        if user.disabled:
+            raise InvalidToken('User is disabled')
+        valid_after = user.tokens_valid_after_timestamp
+        if valid_after and claims['iat'] * 1000 < valid_after:
+            raise InvalidToken('Token has been revoked')
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats.update({'check_revoked': self.check_revoked, 'signing_keys': self.keys.stats()})
+        return stats
+
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,54 @@
+"""
+Session-embedded snapshot of the logged-in Firestore user
+
+Flask-Login runs the user loader on every authenticated request. Instead of reading the
+user document each time, the loader uses a compact snapshot of the user's profile fields
+kept in the session and only falls back to firestore_db.get_user_by_id (itself behind
+the process document cache) once the snapshot is older than USER_SNAPSHOT_TTL.
+
+Edits made through FirestoreUser rewrite the snapshot in the same request. Changes made
+elsewhere (another device, follower counts) show up within USER_SNAPSHOT_TTL.
+
+The session cookie is signed but not encrypted, so only fields the user may see go in
+the snapshot - never the password hash.
+"""
+import os
+import time
+
+from flask import session, has_request_context
+
+SESSION_KEY = '_user_snapshot'
+
+USER_SNAPSHOT_TTL = int(os.getenv('USER_SNAPSHOT_TTL', 300))
+
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'firebase_uid', 'display_name', 'avatar_url', 'bio',
+    'website', 'followers_count', 'following_count', 'email_notifications'
+)
+
+
+def remember_user(user_data):
+    """Store a fresh snapshot of user_data in the session"""
+    snapshot = {field: user_data[field] for field in SNAPSHOT_FIELDS if field in user_data}
+    snapshot['_at'] = time.time()
+    session[SESSION_KEY] = snapshot
+
+
+def snapshot_for(user_id):
+    """The session's user data for user_id if the snapshot is still fresh, else None"""
+    snapshot = session.get(SESSION_KEY)
+    if not snapshot or snapshot.get('id') != user_id:
+        return None
+    if time.time() - snapshot.get('_at', 0) >= USER_SNAPSHOT_TTL:
+        return None
+    return {field: value for field, value in snapshot.items() if field != '_at'}
+
+
+def refresh_snapshot(user_data):
+    """Rewrite the snapshot after user_data changed, if it is this session's user"""
+    if has_request_context() and (session.get(SESSION_KEY) or {}).get('id') == user_data.get('id'):
+        remember_user(user_data)
+
+
+def forget_user():
+    session.pop(SESSION_KEY, None)
@@ -0,0 +1,449 @@
+"""
+Zine version history
+
+A version is a small manifest listing each page's id, order, template and content hash.
+Page content is stored once per zine per distinct hash ("page blobs"), so pages that did
+not change are shared by every version that contains them and a version costs one
+manifest plus the pages that changed.
+
+Saves within VERSION_COALESCE_SECONDS of the latest version (by the same user) update
+that version instead of creating a new one, so autosave produces a version every few
+minutes of editing rather than one per keystroke pause. Such saves go through
+record_changes(): the latest manifest is updated from just the pages that changed, so an
+autosave reads one manifest and writes one blob whatever the size of the zine. Starting
+a new version snapshots every page, which also resyncs a manifest that missed a change.
+
+Blobs a coalesced save stops referring to are remembered on the version as `orphans`.
+They are deleted by prune(), which runs once a zine has more than MAX_VERSIONS versions
+(dropping the oldest) and from `flask prune-versions`, never on the save path.
+
+FirestoreVersionStore keeps manifests in `zine_versions` and blobs in `page_blobs`;
+SQLVersionStore uses the ZineVersion and PageBlob tables; MemoryVersionStore backs the
+in-memory repositories (app.repos.memory). All take and return plain page dicts
+({'id', 'order', 'content', 'template'}).
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+VERSION_COALESCE_SECONDS = int(os.getenv('VERSION_COALESCE_SECONDS', 300))
+
+MAX_VERSIONS = int(os.getenv('MAX_VERSIONS', 50))
+
+
+def page_hash(content, template=None):
+    """Content address of a page"""
+    raw = json.dumps({'content': content or {'blocks': []}, 'template': template},
+                     sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def build_manifest(pages):
+    """(manifest entries, {hash: blob}) for the current pages of a zine"""
+    entries, blobs = [], {}
+    for page in sorted(pages, key=lambda p: p.get('order', 0)):
+        content = page.get('content') or {'blocks': []}
+        digest = page_hash(content, page.get('template'))
+        entries.append({
+            'page_id': str(page['id']),
+            'order': page.get('order', 0),
+            'template': page.get('template'),
+            'hash': digest
+        })
+        blobs[digest] = content
+    return entries, blobs
+
+
+def manifest_hashes(entries):
+    return {entry['hash'] for entry in entries if entry.get('hash')}
+
+
+def apply_manifest_changes(entries, changed=(), removed=()):
+    """(entries, {hash: blob}) after changing some pages of a manifest
+
+    A changed page with 'content' gets a new hash; one with 'order' is moved to that
+    position, others keep theirs. Returns None if a page without content isn't in the
+    manifest, in which case the caller snapshots all pages instead.
+    """
+    by_id = {entry['page_id']: entry for entry in entries}
+    sequence = [entry['page_id'] for entry in sorted(entries, key=lambda e: e.get('order', 0))]
+    removed = {str(page_id) for page_id in removed}
+    sequence = [page_id for page_id in sequence if page_id not in removed]
+
+    blobs = {}
+    for page in sorted(changed, key=lambda p: p.get('order', len(sequence))):
+        page_id = str(page['id'])
+        if 'content' in page:
+            content = page.get('content') or {'blocks': []}
+            digest = page_hash(content, page.get('template'))
+            by_id[page_id] = {'page_id': page_id, 'template': page.get('template'), 'hash': digest}
+            blobs[digest] = content
+        elif page_id not in by_id or page_id not in sequence:
+            return None
+        if 'order' in page or page_id not in sequence:
+            if page_id in sequence:
+                sequence.remove(page_id)
+            index = page.get('order', len(sequence))
+            sequence.insert(max(0, min(index, len(sequence))), page_id)
+
+    return [dict(by_id[page_id], order=position) for position, page_id in enumerate(sequence)], blobs
+
+
+def _blocks_by_id(content):
+    return {str(block.get('id', index)): block for index, block in enumerate((content or {}).get('blocks') or [])}
+
+
+def diff_pages(old_pages, new_pages):
+    """Page- and block-level differences between two lists of page dicts"""
+    old = {str(page['id']): page for page in old_pages}
+    new = {str(page['id']): page for page in new_pages}
+    changed = []
+    for page_id in new.keys() & old.keys():
+        if page_hash(old[page_id].get('content'), old[page_id].get('template')) == \
+                page_hash(new[page_id].get('content'), new[page_id].get('template')):
+            continue
+        old_blocks = _blocks_by_id(old[page_id].get('content'))
+        new_blocks = _blocks_by_id(new[page_id].get('content'))
+        changed.append({
+            'page_id': page_id,
+            'template_changed': old[page_id].get('template') != new[page_id].get('template'),
+            'blocks_added': sorted(new_blocks.keys() - old_blocks.keys()),
+            'blocks_removed': sorted(old_blocks.keys() - new_blocks.keys()),
+            'blocks_changed': sorted(k for k in new_blocks.keys() & old_blocks.keys() if new_blocks[k] != old_blocks[k])
+        })
+
+    def order(pages):
+        return [str(page['id']) for page in sorted(pages, key=lambda p: p.get('order', 0)) if str(page['id']) in old.keys() & new.keys()]
+
+    return {
+        'pages_added': sorted(new.keys() - old.keys()),
+        'pages_removed': sorted(old.keys() - new.keys()),
+        'pages_changed': sorted(changed, key=lambda c: c['page_id']),
+        'reordered': order(old_pages) != order(new_pages)
+    }
+
+
+def _coalesces(latest, user_id, now):
+    return (
+        latest is not None
+        and latest.get('created_by') == user_id
+        and now - latest['created_at'].replace(tzinfo=None) < timedelta(seconds=VERSION_COALESCE_SECONDS)
+    )
+
+
+def version_summary(version):
+    return {
+        'number': version['number'],
+        'created_at': version['created_at'],
+        'updated_at': version.get('updated_at') or version['created_at'],
+        'created_by': version.get('created_by'),
+        'page_count': len(version['pages'])
+    }
+
+
+class VersionStore:
+    """Recording shared by the stores; each implements _latest(), _write() and prune()"""
+
+    def record(self, zine_id, pages, user_id=None):
+        """Record the zine's current pages, coalescing with a recent version; returns it"""
+        return self._write(zine_id, *build_manifest(pages), user_id, self._latest(zine_id))
+
+    def record_changes(self, zine_id, load_pages, changed=(), removed=(), user_id=None):
+        """Record a save that changed or removed some pages
+
+        Within the coalescing window only the latest manifest is read; otherwise (and if
+        the manifest doesn't know a page) load_pages() is called for a full snapshot.
+        """
+        latest = self._latest(zine_id)
+        result = None
+        if _coalesces(latest, user_id, datetime.utcnow()):
+            result = apply_manifest_changes(latest['pages'], changed, removed)
+        if result is None:
+            result = build_manifest(load_pages())
+        return self._write(zine_id, *result, user_id, latest)
+
+
+def _orphans(latest, entries):
+    """Hashes a coalesced version no longer refers to, for prune() to collect"""
+    dropped = set(latest.get('orphans') or []) | manifest_hashes(latest['pages'])
+    return sorted(dropped - manifest_hashes(entries))
+
+
+class FirestoreVersionStore(VersionStore):
+    """Version manifests and page blobs in Firestore"""
+
+    def __init__(self, firestore_db):
+        self.firestore_db = firestore_db
+
+    def _db(self):
+        return self.firestore_db._get_db()
+
+    def _version_ref(self, zine_id, number):
+        return self._db().collection('zine_versions').document(f'{zine_id}_{number:06d}')
+
+    def _blob_ref(self, zine_id, digest):
+        return self._db().collection('page_blobs').document(f'{zine_id}_{digest}')
+
+    def list(self, zine_id, limit=None):
+        """Versions of a zine, newest first"""
+        query = self._db().collection('zine_versions').where('zine_id', '==', zine_id)
+        return self.firestore_db._ordered_query(query, 'number', descending=True, limit=limit)
+
+    def get(self, zine_id, number):
+        doc = self._version_ref(zine_id, number).get()
+        return doc.to_dict() if doc.exists else None
+
+    def _latest(self, zine_id):
+        recent = self.list(zine_id, limit=1)
+        return recent[0] if recent else None
+
+    def _write(self, zine_id, entries, blobs, user_id, latest):
+        now = datetime.utcnow()
+        if latest and latest['pages'] == entries:
+            return latest
+
+        writes = []
+        known = manifest_hashes(latest['pages']) if latest else set()
+        for digest, content in blobs.items():
+            if digest not in known:
+                writes.append(('set', self._blob_ref(zine_id, digest),
+                               {'zine_id': zine_id, 'hash': digest, 'content': content}))
+
+        if _coalesces(latest, user_id, now):
+            version = dict(latest, pages=entries, updated_at=now, orphans=_orphans(latest, entries))
+        else:
+            version = {
+                'zine_id': zine_id,
+                'number': (latest['number'] + 1) if latest else 1,
+                'pages': entries,
+                'created_by': user_id,
+                'created_at': now,
+                'updated_at': now
+            }
+        writes.append(('set', self._version_ref(zine_id, version['number']), version))
+        self.firestore_db._commit_writes(writes)
+
+        if version['number'] != (latest or {}).get('number') and version['number'] > MAX_VERSIONS:
+            self.prune(zine_id)
+        return version
+
+    def prune(self, zine_id, keep=MAX_VERSIONS):
+        """Delete all but the newest `keep` versions, and blobs no kept version refers to"""
+        versions = self.list(zine_id)
+        kept, dropped = versions[:keep], versions[keep:]
+        orphans = set().union(*(v.get('orphans') or [] for v in versions))
+        if not dropped and not orphans:
+            return 0
+        live = set().union(*(manifest_hashes(v['pages']) for v in kept))
+        dead = set().union(orphans, *(manifest_hashes(v['pages']) for v in dropped)) - live
+        self.firestore_db._commit_writes(
+            [('delete', self._version_ref(zine_id, v['number']), None) for v in dropped] +
+            [('delete', self._blob_ref(zine_id, digest), None) for digest in sorted(dead)] +
+            [('update', self._version_ref(zine_id, v['number']), {'orphans': []})
+             for v in kept if v.get('orphans')]
+        )
+        return len(dropped)
+
+    def load_pages(self, zine_id, version):
+        """Page dicts for a version, fetching its blobs in one batched read"""
+        digests = sorted(manifest_hashes(version['pages']))
+        docs = self._db().get_all([self._blob_ref(zine_id, digest) for digest in digests])
+        contents = {doc.to_dict()['hash']: doc.to_dict()['content'] for doc in docs if doc.exists}
+        return [
+            {'id': e['page_id'], 'order': e['order'], 'template': e.get('template'),
+             'content': contents.get(e['hash'], {'blocks': []})}
+            for e in version['pages']
+        ]
+
+    def delete_writes(self, zine_id):
+        """Write tuples removing a zine's whole history"""
+        db = self._db()
+        docs = list(db.collection('zine_versions').where('zine_id', '==', zine_id).get()) + \
+            list(db.collection('page_blobs').where('zine_id', '==', zine_id).get())
+        return [('delete', doc.reference, None) for doc in docs]
+
+
+class SQLVersionStore(VersionStore):
+    """Version manifests in ZineVersion.content_snapshot and blobs in PageBlob"""
+
+    @staticmethod
+    def _to_dict(row):
+        snapshot = row.content_snapshot or {}
+        return {
+            'zine_id': row.zine_id,
+            'number': row.version_number,
+            'pages': snapshot.get('pages', []),
+            'orphans': snapshot.get('orphans', []),
+            'created_by': row.created_by,
+            'created_at': row.created_at,
+            'updated_at': snapshot.get('updated_at') and datetime.fromisoformat(snapshot['updated_at'])
+        }
+
+    def _rows(self, zine_id):
+        from app.models import ZineVersion
+        return ZineVersion.query.filter_by(zine_id=zine_id).order_by(ZineVersion.version_number.desc())
+
+    def list(self, zine_id, limit=None):
+        rows = self._rows(zine_id)
+        if limit:
+            rows = rows.limit(limit)
+        return [self._to_dict(row) for row in rows]
+
+    def get(self, zine_id, number):
+        from app.models import ZineVersion
+        row = ZineVersion.query.filter_by(zine_id=zine_id, version_number=number).first()
+        return self._to_dict(row) if row else None
+
+    def _latest(self, zine_id):
+        row = self._rows(zine_id).first()
+        return self._to_dict(row) if row else None
+
+    def _write(self, zine_id, entries, blobs, user_id, latest):
+        """Write a manifest, coalescing with latest when recent (caller commits)"""
+        from app import db
+        from app.models import ZineVersion, PageBlob
+
+        now = datetime.utcnow()
+        if latest and latest['pages'] == entries:
+            return latest
+
+        existing = {row.hash for row in PageBlob.query.filter(
+            PageBlob.zine_id == zine_id, PageBlob.hash.in_(list(blobs)))}
+        for digest, content in blobs.items():
+            if digest not in existing:
+                db.session.add(PageBlob(zine_id=zine_id, hash=digest, content=content))
+
+        if _coalesces(latest, user_id, now):
+            row = ZineVersion.query.filter_by(zine_id=zine_id, version_number=latest['number']).first()
+            row.content_snapshot = {'pages': entries, 'updated_at': now.isoformat(),
+                                    'orphans': _orphans(latest, entries)}
+            return self._to_dict(row)
+
+        version = ZineVersion(
+            zine_id=zine_id,
+            version_number=(latest['number'] + 1) if latest else 1,
+            content_snapshot={'pages': entries, 'updated_at': now.isoformat()},
+            created_by=user_id,
+            created_at=now
+        )
+        db.session.add(version)
+        db.session.flush()
+        if version.version_number > MAX_VERSIONS:
+            self.prune(zine_id)
+        return self._to_dict(version)
+
+    def _delete_blobs(self, zine_id, digests):
+        from app.models import PageBlob
+        if digests:
+            PageBlob.query.filter(PageBlob.zine_id == zine_id, PageBlob.hash.in_(list(digests)))\
+                .delete(synchronize_session=False)
+
+    def prune(self, zine_id, keep=MAX_VERSIONS):
+        """Delete all but the newest `keep` versions, and blobs no kept version refers to (caller commits)"""
+        from app import db
+        rows = self._rows(zine_id).all()
+        kept, dropped = rows[:keep], rows[keep:]
+        snapshot = lambda row: row.content_snapshot or {}
+        orphans = set().union(*(snapshot(row).get('orphans') or [] for row in rows))
+        if not dropped and not orphans:
+            return 0
+        live = set().union(*(manifest_hashes(snapshot(row).get('pages', [])) for row in kept))
+        dead = set().union(orphans, *(manifest_hashes(snapshot(row).get('pages', [])) for row in dropped)) - live
+        for row in dropped:
+            db.session.delete(row)
+        for row in kept:
+            if snapshot(row).get('orphans'):
+                row.content_snapshot = dict(snapshot(row), orphans=[])
+        self._delete_blobs(zine_id, dead)
+        return len(dropped)
+
+    def load_pages(self, zine_id, version):
+        from app.models import PageBlob
+        digests = list(manifest_hashes(version['pages']))
+        contents = {row.hash: row.content for row in PageBlob.query.filter(
+            PageBlob.zine_id == zine_id, PageBlob.hash.in_(digests))}
+        return [
+            {
+                'id': entry.get('page_id', f"legacy-{entry.get('order', index)}"),
+                'order': entry.get('order', index),
+                'template': entry.get('template'),
+                # Snapshots taken before page blobs existed hold the content inline
+                'content': entry['content'] if 'content' in entry else contents.get(entry.get('hash'), {'blocks': []})
+            }
+            for index, entry in enumerate(version['pages'])
+        ]
+
+
+class MemoryVersionStore(VersionStore):
+    """Version manifests and blobs in process memory"""
+
+    def __init__(self):
+        self._versions = {}  # zine id -> [version], oldest first
+        self._blobs = {}  # zine id -> {hash: content}
+        self._lock = threading.Lock()
+
+    def list(self, zine_id, limit=None):
+        versions = [copy.deepcopy(v) for v in reversed(self._versions.get(zine_id, []))]
+        return versions[:limit] if limit else versions
+
+    def get(self, zine_id, number):
+        for version in self._versions.get(zine_id, []):
+            if version['number'] == number:
+                return copy.deepcopy(version)
+        return None
+
+    def _latest(self, zine_id):
+        versions = self._versions.get(zine_id)
+        return copy.deepcopy(versions[-1]) if versions else None
+
+    def _write(self, zine_id, entries, blobs, user_id, latest):
+        now = datetime.utcnow()
+        with self._lock:
+            versions = self._versions.setdefault(zine_id, [])
+            if latest and latest['pages'] == entries:
+                return latest
+            stored = self._blobs.setdefault(zine_id, {})
+            for digest, content in blobs.items():
+                stored.setdefault(digest, copy.deepcopy(content))
+            if _coalesces(latest, user_id, now):
+                version = dict(latest, pages=entries, updated_at=now)
+                versions[-1] = version
+            else:
+                version = {
+                    'zine_id': zine_id,
+                    'number': (latest['number'] + 1) if latest else 1,
+                    'pages': entries,
+                    'created_by': user_id,
+                    'created_at': now,
+                    'updated_at': now
+                }
+                versions.append(version)
+        if len(versions) > MAX_VERSIONS:
+            self.prune(zine_id)
+        return copy.deepcopy(version)
+
+    def prune(self, zine_id, keep=MAX_VERSIONS):
+        """Drop old versions, and blobs no remaining version refers to"""
+        with self._lock:
+            versions = self._versions.get(zine_id, [])
+            dropped = versions[:-keep] if len(versions) > keep else []
+            del versions[:len(dropped)]
+            live = set().union(*(manifest_hashes(v['pages']) for v in versions))
+            stored = self._blobs.get(zine_id, {})
+            for digest in [digest for digest in stored if digest not in live]:
+                del stored[digest]
+        return len(dropped)
+
+    def load_pages(self, zine_id, version):
+        stored = self._blobs.get(zine_id, {})
+        return [
+            {'id': e['page_id'], 'order': e['order'], 'template': e.get('template'),
+             'content': copy.deepcopy(stored.get(e['hash'], {'blocks': []}))}
+            for e in version['pages']
+        ]
+
+
+sql_versions = SQLVersionStore()
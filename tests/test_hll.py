@@ -0,0 +1,50 @@
+import pytest
+
+from app.hll import HyperLogLog, sparse_registers
+
+
+def sketch_of(values, precision=None):
+    sketch = HyperLogLog(precision)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_small_counts_are_exact_enough():
+    assert HyperLogLog().count() == 0
+    assert sketch_of(['reader']).count() == 1
+    assert sketch_of(f'reader-{n}' for n in range(100)).count() == pytest.approx(100, abs=2)
+
+
+@pytest.mark.parametrize('n', [1000, 20000])
+def test_large_counts_are_within_error(n):
+    assert sketch_of(f'reader-{i}' for i in range(n)).count() == pytest.approx(n, rel=0.05)
+
+
+def test_duplicates_are_not_counted_twice():
+    assert sketch_of(['a', 'b', 'a', 'b', 'a']).count() == 2
+
+
+def test_merge_counts_the_union():
+    a = sketch_of(f'reader-{n}' for n in range(0, 600))
+    b = sketch_of(f'reader-{n}' for n in range(400, 1000))
+    assert a.merge(b).count() == pytest.approx(1000, rel=0.05)
+
+
+def test_merge_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+
+def test_sparse_registers_rebuild_the_same_sketch():
+    values = [f'reader-{n}' for n in range(300)]
+    sketch = HyperLogLog()
+    sketch.update(sparse_registers(values))
+    assert sketch.registers == sketch_of(values).registers
+
+
+def test_bytes_round_trip():
+    sketch = sketch_of(['a', 'b', 'c'], precision=10)
+    assert HyperLogLog.from_bytes(sketch.to_bytes(), precision=10).registers == sketch.registers
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(sketch.to_bytes(), precision=12)
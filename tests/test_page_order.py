@@ -0,0 +1,65 @@
+import random
+
+from app.page_order import (MAX_RANK_LENGTH, legacy_rank, page_rank, place, rank_between, sort_pages,
+                            spread_ranks)
+
+
+def test_rank_between_sorts_between_neighbours():
+    assert 'a' < rank_between('a', 'b') < 'b'
+    assert rank_between(None, 'V') < 'V'
+    assert rank_between('V', None) > 'V'
+    assert 'a' < rank_between('a', 'a1') < 'a1'
+
+
+def test_repeated_inserts_stay_ordered():
+    rng = random.Random(7)
+    ranks = [rank_between()]
+    for _ in range(500):
+        index = rng.randrange(len(ranks) + 1)
+        before = ranks[index - 1] if index else None
+        after = ranks[index] if index < len(ranks) else None
+        ranks.insert(index, rank_between(before, after))
+    assert ranks == sorted(ranks)
+    assert len(set(ranks)) == len(ranks)
+
+
+def test_legacy_ranks_keep_integer_order():
+    ranks = [legacy_rank(order) for order in range(200)]
+    assert ranks == sorted(ranks)
+    assert page_rank({'order': 3}) == legacy_rank(3)
+
+
+def test_spread_ranks_are_short_and_ascending():
+    for count in (1, 61, 62, 1000):
+        ranks = spread_ranks(count)
+        assert len(ranks) == count
+        assert ranks == sorted(ranks) and len(set(ranks)) == count
+        assert all(not rank.endswith('0') for rank in ranks)
+
+
+def test_sort_pages_mixes_ranked_and_legacy_pages():
+    pages = [{'id': 'b', 'order': 1}, {'id': 'a', 'order': 0}, {'id': 'c', 'rank': legacy_rank(0) + 'V'}]
+    assert [page['id'] for page in sort_pages(pages)] == ['a', 'c', 'b']
+
+
+def test_place_inserts_and_moves_without_touching_other_pages():
+    pages = [{'id': str(n), 'rank': rank} for n, rank in enumerate(spread_ranks(3))]
+    rank, respaced = place(pages, index=1)
+    assert respaced == {}
+    assert pages[0]['rank'] < rank < pages[1]['rank']
+
+    rank, respaced = place(pages, index=0, moving_id='2')
+    assert respaced == {} and rank < pages[0]['rank']
+
+
+def test_place_respaces_when_ranks_get_too_long():
+    pages = [{'id': 'a', 'rank': 'V'}, {'id': 'b', 'rank': 'V' + '0' * MAX_RANK_LENGTH + '1'}]
+    rank, respaced = place(pages, index=1)
+    assert set(respaced) == {'a', 'b'}
+    assert respaced['a'] < rank < respaced['b']
+
+
+def test_place_respaces_tied_ranks():
+    pages = [{'id': 'a', 'rank': 'V'}, {'id': 'b', 'rank': 'V'}]
+    rank, respaced = place(pages, index=1)
+    assert respaced['a'] < rank < respaced['b']
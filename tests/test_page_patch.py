@@ -0,0 +1,62 @@
+import pytest
+
+from app.page_patch import MAX_PATCH_OPS, PatchError, apply_ops, ensure_block_ids
+
+
+def blocks():
+    return [{'id': 'a', 'content': 'one'}, {'id': 'b', 'content': 'two'}, {'id': 'c', 'content': 'three'}]
+
+
+def ids(result):
+    return [block['id'] for block in result]
+
+
+def test_ops_apply_in_order():
+    result, touched = apply_ops(blocks(), [
+        {'op': 'insert', 'block': {'id': 'd', 'content': 'four'}, 'index': 1},
+        {'op': 'update', 'id': 'a', 'fields': {'content': 'uno', 'x': '4px'}},
+        {'op': 'delete', 'id': 'b'},
+        {'op': 'move', 'id': 'c', 'index': 0}
+    ])
+    assert ids(result) == ['c', 'a', 'd']
+    assert result[1] == {'id': 'a', 'content': 'uno', 'x': '4px'}
+    assert touched == {'d': None, 'a': {'content', 'x'}, 'b': None}
+
+
+def test_input_blocks_are_not_modified():
+    original = blocks()
+    apply_ops(original, [{'op': 'update', 'id': 'a', 'fields': {'content': 'changed'}}])
+    assert original == blocks()
+
+
+def test_updates_to_an_inserted_block_keep_it_fully_touched():
+    _, touched = apply_ops([], [
+        {'op': 'insert', 'block': {'id': 'n'}},
+        {'op': 'update', 'id': 'n', 'fields': {'content': 'x'}}
+    ])
+    assert touched == {'n': None}
+
+
+def test_index_is_clamped():
+    result, _ = apply_ops(blocks(), [{'op': 'move', 'id': 'a', 'index': 99}])
+    assert ids(result) == ['b', 'c', 'a']
+
+
+def test_blocks_without_ids_get_positional_ones():
+    assert ids(ensure_block_ids([{'content': 'x'}, {'id': 'k'}])) == ['b0', 'k']
+
+
+@pytest.mark.parametrize('ops', [
+    'not a list',
+    [{'op': 'update', 'id': 'missing', 'fields': {}}],
+    [{'op': 'insert', 'block': {'id': 'a'}}],
+    [{'op': 'update', 'id': 'a', 'fields': {'id': 'z'}}],
+    [{'op': 'update', 'id': 'a', 'fields': {'bad.name': 1}}],
+    [{'op': 'move', 'id': 'a', 'index': '1'}],
+    [{'op': 'rename', 'id': 'a'}],
+    [{'op': 'delete', 'id': True}],
+    [{'op': 'delete', 'id': 'c'}] * (MAX_PATCH_OPS + 1)
+])
+def test_invalid_patches_are_rejected(ops):
+    with pytest.raises(PatchError):
+        apply_ops(blocks(), ops)
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from app.pagination import decode_cursor, encode_cursor, firestore_start_after, next_cursor
+
+
+def test_cursor_round_trips():
+    when = datetime(2024, 5, 1, 12, 30, 15, 250)
+    assert decode_cursor(encode_cursor(when, 'zine-1')) == (when, 'zine-1')
+    assert decode_cursor(encode_cursor(42, 7)) == (42, 7)
+    assert decode_cursor(encode_cursor(None, 'x')) == (None, 'x')
+
+
+def test_cursor_is_url_safe():
+    token = encode_cursor('a/b+c?d', 'id')
+    assert '=' not in token and '/' not in token and '+' not in token
+
+
+def test_bad_cursors_decode_to_none():
+    for token in (None, '', 'not base64!', encode_cursor(1, 2)[:-3], 'e30'):
+        assert decode_cursor(token) is None
+
+
+def test_next_cursor_points_after_the_last_item():
+    items = [{'id': 'a', 'views': 9}, {'id': 'b', 'views': 3}]
+    assert decode_cursor(next_cursor(items, 'views', 2)) == (3, 'b')
+
+
+def test_short_or_empty_pages_have_no_next_cursor():
+    assert next_cursor([], 'views', 2) is None
+    assert next_cursor([{'id': 'a', 'views': 1}], 'views', 2) is None
+
+
+def test_firestore_start_after():
+    assert firestore_start_after(None, 'published_at') is None
+    assert firestore_start_after((5, 'z'), 'views_count') == {'views_count': 5, '__name__': 'z'}
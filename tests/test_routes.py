@@ -0,0 +1,224 @@
+import io
+import os
+
+import pytest
+
+# Tables are dropped between tests, so never point them at a configured database
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+from PIL import Image
+
+from app import create_app, db
+from app.blob_store import LocalBlobStore
+from app.firestore_models import FirestoreUser
+from app.repos import set_repos
+from app.repos.memory import memory_repos
+from app.repos.sql import sql_repos
+
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app()
+
+
+@pytest.fixture(params=['memory', 'sql'])
+def repos(request, app, monkeypatch):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    repos = memory_repos() if request.param == 'memory' else sql_repos()
+    set_repos(repos)
+    # Sessions hold the repo user's id; load it through the backend under test
+    monkeypatch.setattr(app.login_manager, '_user_callback',
+                        lambda user_id: FirestoreUser(repos.users.get(user_id)) if repos.users.get(user_id) else None)
+    yield repos
+    set_repos(None)
+
+
+@pytest.fixture
+def create_user(app, repos):
+    def create(username):
+        with app.app_context():
+            user = repos.users.create(username, f'{username}@example.com', f'uid-{username}')
+            repos.commit()
+        return user
+    return create
+
+
+def client_for(app, user=None):
+    client = app.test_client()
+    if user:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user['id'])
+    return client
+
+
+def create_zine(client, title='Hello World'):
+    response = client.post('/editor/create', data={'title': title})
+    assert response.status_code == 302
+    return response.headers['Location'].rsplit('/', 1)[1]
+
+
+def first_page(app, repos, zine_id):
+    with app.app_context():
+        return repos.pages.list(zine_id)[0]['id']
+
+
+def publish(client, zine_id):
+    response = client.post(f'/editor/{zine_id}/publish', json={'visibility': 'public', 'tags': []})
+    assert response.get_json()['success']
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), color='red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_create_dedupes_slugs(app, repos, create_user):
+    client = client_for(app, create_user('ann'))
+    first = create_zine(client)
+    second = create_zine(client)
+    with app.app_context():
+        assert repos.zines.get(first)['slug'] == 'hello-world'
+        assert repos.zines.get(second)['slug'] == 'hello-world-1'
+        assert len(repos.pages.list(first)) == 1
+
+
+def test_stale_patch_and_save_conflict(app, repos, create_user):
+    client = client_for(app, create_user('ann'))
+    zine_id = create_zine(client)
+    page_id = first_page(app, repos, zine_id)
+
+    saved = client.post(f'/editor/{zine_id}/save', json={
+        'page_id': page_id, 'content': {'blocks': [{'id': 'a', 'type': 'text', 'content': 'one'}]}
+    }).get_json()
+    assert saved['revision'] == 1
+
+    ops = [{'op': 'update', 'id': 'a', 'fields': {'content': 'two'}}]
+    assert client.post(f'/editor/{zine_id}/page/{page_id}/patch',
+                       json={'base_revision': 1, 'ops': ops}).get_json()['revision'] == 2
+
+    stale = client.post(f'/editor/{zine_id}/page/{page_id}/patch', json={'base_revision': 1, 'ops': ops})
+    assert stale.status_code == 409
+    assert stale.get_json()['revision'] == 2
+
+    stale = client.post(f'/editor/{zine_id}/save', json={
+        'page_id': page_id, 'base_revision': 1, 'content': {'blocks': []}
+    })
+    assert stale.status_code == 409
+
+    page = client.get(f'/editor/{zine_id}/page/{page_id}').get_json()
+    assert page['revision'] == 2
+    assert page['content']['blocks'][0]['content'] == 'two'
+
+
+def test_restore_version(app, repos, create_user, monkeypatch):
+    from app import versions
+
+    # Every save starts its own version instead of folding into the latest one
+    monkeypatch.setattr(versions, 'VERSION_COALESCE_SECONDS', 0)
+    client = client_for(app, create_user('ann'))
+    zine_id = create_zine(client)
+    page_id = first_page(app, repos, zine_id)
+    client.post(f'/editor/{zine_id}/save', json={
+        'page_id': page_id, 'content': {'blocks': [{'id': 'a', 'type': 'text', 'content': 'original'}]}
+    })
+    number = max(version['number'] for version in client.get(f'/editor/{zine_id}/versions').get_json()['versions'])
+
+    added = client.post(f'/editor/{zine_id}/add-page', json={}).get_json()
+    client.post(f'/editor/{zine_id}/save', json={
+        'page_id': page_id, 'content': {'blocks': [{'id': 'a', 'type': 'text', 'content': 'edited'}]}
+    })
+
+    response = client.post(f'/editor/{zine_id}/versions/{number}/restore')
+    assert response.get_json() == {'success': True, 'restored': number}
+    with app.app_context():
+        pages = repos.pages.list(zine_id)
+        assert [str(page['id']) for page in pages] == [str(page_id)]
+        assert pages[0]['content']['blocks'][0]['content'] == 'original'
+        assert repos.pages.get(added['page_id']) is None
+
+
+def test_anonymous_view_revalidates_with_etag(app, repos, create_user):
+    client = client_for(app, create_user('ann'))
+    zine_id = create_zine(client)
+    publish(client, zine_id)
+
+    reader = client_for(app)
+    response = reader.get('/ann/hello-world')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = reader.get('/ann/hello-world', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not response.data
+
+    with app.app_context():
+        assert repos.zines.get(zine_id)['views_count'] == 2
+
+
+def test_follow_notifies_and_fills_feed(app, repos, create_user):
+    ann, bob = create_user('ann'), create_user('bob')
+    client = client_for(app, bob)
+
+    assert client.get(f"/follow/{ann['id']}").status_code == 302
+    with app.app_context():
+        assert repos.follows.is_following(bob['id'], ann['id'])
+        assert [n['type'] for n in repos.users.notifications(ann['id'])] == ['new_follower']
+
+    author = client_for(app, ann)
+    zine_id = create_zine(author)
+    publish(author, zine_id)
+    with app.app_context():
+        zines, _ = repos.follows.feed(bob['id'], 10)
+        assert [str(zine['id']) for zine in zines] == [str(zine_id)]
+
+    client.get(f"/unfollow/{ann['id']}")
+    with app.app_context():
+        assert not repos.follows.is_following(bob['id'], ann['id'])
+
+
+def test_analytics_counts_views_follows_and_read_time(app, repos, create_user):
+    ann, bob = create_user('ann'), create_user('bob')
+    client = client_for(app, ann)
+    zine_id = create_zine(client)
+    publish(client, zine_id)
+
+    reader = client_for(app)
+    reader.get('/ann/hello-world', headers={'Referer': 'https://example.com/'})
+    assert reader.post('/api/track-read-time', json={'zine_id': zine_id, 'read_time': 30}).status_code == 200
+    client_for(app, bob).get(f"/follow/{ann['id']}?zine={zine_id}")
+
+    stats = client.get(f'/api/analytics/{zine_id}').get_json()
+    assert stats['views'] == 1
+    assert stats['unique_readers_7d'] == 1
+    assert stats['avg_read_time'] == 30
+    assert stats['views_window'] == 1
+    assert stats['followers_gained'] == 1
+    assert stats['avg_read_time_window'] == 30
+    assert stats['top_referrers'] == [{'referrer': 'example.com', 'count': 1}]
+
+    assert client_for(app, bob).get(f'/api/analytics/{zine_id}').status_code == 403
+
+
+def test_upload_requires_login_and_enforces_quota(app, repos, create_user, tmp_path, monkeypatch):
+    from app import blob_store
+    from app.image_jobs import image_jobs
+    from app.routes import api
+
+    monkeypatch.setattr(blob_store, '_blob_store', LocalBlobStore(str(tmp_path)))
+    monkeypatch.setattr(image_jobs, 'workers', 0)
+    monkeypatch.setattr(api, 'UPLOAD_DAILY_LIMIT', 1)
+
+    def upload(client):
+        return client.post('/api/upload', data={'file': (io.BytesIO(png_bytes()), 'red.png')},
+                           content_type='multipart/form-data')
+
+    assert upload(client_for(app)).status_code == 302
+
+    client = client_for(app, create_user('ann'))
+    response = upload(client)
+    assert response.status_code == 200
+    assert response.get_json()['url']
+    assert upload(client).status_code == 429
@@ -0,0 +1,68 @@
+import pytest
+
+from app.token_verifier import ISSUER_PREFIX, InvalidToken, LocalSigningKey, SigningKeys, TokenVerifier
+
+PROJECT_ID = 'zine-test'
+
+
+@pytest.fixture(scope='module')
+def signer():
+    return LocalSigningKey(PROJECT_ID)
+
+
+@pytest.fixture
+def verifier(signer):
+    return TokenVerifier(PROJECT_ID, keys=SigningKeys(fetch=signer.fetch), check_revoked=False)
+
+
+def test_valid_token_verifies(signer, verifier):
+    claims = verifier.verify(signer.sign('user-1', email='a@example.com'))
+    assert claims['uid'] == 'user-1'
+    assert claims['email'] == 'a@example.com'
+
+
+def test_expired_token_is_rejected(signer, verifier):
+    with pytest.raises(InvalidToken):
+        verifier.verify(signer.sign('user-1', lifetime=-60))
+
+
+def test_token_signed_with_another_key_is_rejected(verifier):
+    # Same key id, different private key: the signature must not check out
+    impostor = LocalSigningKey(PROJECT_ID)
+    with pytest.raises(InvalidToken):
+        verifier.verify(impostor.sign('user-1'))
+
+
+def test_token_for_another_project_is_rejected(signer, verifier):
+    token = signer.sign('user-1', aud='other-project', iss=ISSUER_PREFIX + 'other-project')
+    with pytest.raises(InvalidToken):
+        verifier.verify(token)
+
+
+def test_unknown_key_id_is_rejected(verifier):
+    with pytest.raises(InvalidToken):
+        verifier.verify(LocalSigningKey(PROJECT_ID, key_id='rotated').sign('user-1'))
+
+
+def test_malformed_token_is_rejected(verifier):
+    for token in ('', None, 'not-a-jwt'):
+        with pytest.raises(InvalidToken):
+            verifier.verify(token)
+
+
+def test_repeat_verification_is_served_from_cache(signer, verifier, monkeypatch):
+    token = signer.sign('user-1')
+    verifier.verify(token)
+
+    def fail(token):
+        raise AssertionError('cached token was decoded again')
+
+    monkeypatch.setattr(verifier, '_decode', fail)
+    assert verifier.verify(token)['uid'] == 'user-1'
+    assert verifier.cache.hits == 1
+
+
+def test_cached_claims_are_copies(signer, verifier):
+    token = signer.sign('user-1')
+    verifier.verify(token)['uid'] = 'someone-else'
+    assert verifier.verify(token)['uid'] == 'user-1'